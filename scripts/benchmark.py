@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the generator and UDF hot paths, with regression tracking
+
+Times every ``DataGenerator.iter_*`` table stream, ``save_to_csv`` of
+every table's stream (generation included, as data_generator.py writes
+them) and every UDF/UDTF class of udf/python/text_analytics.py over a range
+of row counts (and, for the UDFs, text lengths in words). Each case runs in
+a fresh process and the best of ``--repeat`` runs counts; a case whose runs
+add up to less than ``--min-time`` seconds runs more often, until they do, so
+short cases are not timed from a handful of sub-millisecond runs. Memory is the
+peak RSS growth over the timed runs, above the RSS once the case's inputs
+are built; on Linux the peak is reset there (/proc/self/clear_refs), elsewhere
+only growth beyond the earlier peak shows.
+
+Results are written as JSON with the machine they ran on. Given a
+``--baseline`` (an earlier results file), every case also present there is
+compared, and the exit status is 1 when a case's throughput dropped, or its
+peak RSS growth grew, by more than ``--threshold``; RSS growth also has to grow
+by at least ``--min-rss-change`` MiB, as a fraction of a MiB is noise. Baselines are only comparable
+on the same machine; a different one is reported with a warning.
+
+UDF inputs are synthetic review texts: Zipf-distributed words over a fixed
+vocabulary, with sentiment words, negations and occasional HTML, e-mail
+addresses, phone numbers and URLs, so every UDF branch is exercised.
+TextKeywordsTfidf uses an IDF table built from the same texts.
+
+Usage:
+    python benchmark.py --output benchmark_results.json
+    python benchmark.py --sizes 1k,10k,100k,1m --text-words 10,100,1000 --group udf --filter Sentiment
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.1 --output benchmark_results.json
+    python benchmark.py --output benchmark_baseline.json   # record a new baseline
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from data_generator import DataGenerator
+from udf_runner import DEFAULT_MODULE, UdfCall, install_odps_standin, load_module
+
+
+GROUPS = ('generator', 'csv', 'udf')
+
+# One call per UDF class, over the columns text, text2 (another text), key and
+# group (1,000 rows per group); a class without a call here is not benchmarked
+UDF_CALLS = {
+    'TextSentiment': "TextSentiment(text)",
+    'TextSentimentScore': "TextSentimentScore(text, 'sentiment_lexicon.tsv')",
+    'TextSentimentLabel': "TextSentimentLabel(text, 'sentiment_lexicon.tsv')",
+    'TextKeywords': "TextKeywords(text)",
+    'TextKeywordsTfidf': "TextKeywordsTfidf(text, 'benchmark_idf.bin', 5, 'words')",
+    'TextSimilarity': "TextSimilarity(text, text2)",
+    'TextSimilarPairs': "TextSimilarPairs(group, key, text, 0.8)",
+    'TextWordCount': "TextWordCount(text)",
+    'TextLanguageDetect': "TextLanguageDetect(text)",
+    'TextLanguageProfile': "TextLanguageProfile(text)",
+    'TextClean': "TextClean(text, 'all')",
+    'TextProfile': "TextProfile(text)",
+    'TextAnalyzeBatch': "TextAnalyzeBatch('sentiment', key, text)",
+}
+
+LEXICON = os.path.join(os.path.dirname(DEFAULT_MODULE), 'sentiment_lexicon.tsv')
+IDF_TABLE = 'benchmark_idf.bin'
+GROUP_ROWS = 1000
+
+SENTIMENT_WORDS = ('good', 'great', 'excellent', 'amazing', 'love', 'perfect',
+                   'bad', 'terrible', 'awful', 'hate', 'poor', 'worst')
+EXTRAS = ('<b>', '</b>', 'support@example.com', '555-123-4567',
+          'https://example.com/item', '&amp;', 'not', 'never')
+
+SIZE_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)([km]?)$', re.IGNORECASE)
+
+
+def parse_size(text: str) -> int:
+    """A row count like ``10000``, ``10k`` or ``1.5m``."""
+    match = SIZE_PATTERN.match(text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f'Invalid size {text!r}: expected e.g. 1000, 10k or 1m')
+    number, unit = match.groups()
+    return int(float(number) * {'': 1, 'k': 1000, 'm': 1000000}[unit.lower()])
+
+
+def parse_list(convert: Callable[[str], Any]) -> Callable[[str], List[Any]]:
+    return lambda text: [convert(item) for item in text.split(',') if item.strip()]
+
+
+def vocabulary(size: int = 5000) -> List[str]:
+    """Pseudo-words from syllables, the same on every run."""
+    rng = random.Random(0)
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'pe', 'da', 'go', 'shi']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def synthetic_texts(rows: int, words: int, seed: int = 42) -> List[str]:
+    """``rows`` texts of ``words`` words each, Zipf-distributed over the vocabulary."""
+    rng = random.Random(seed)
+    tokens = list(SENTIMENT_WORDS) + list(EXTRAS) + vocabulary()
+    # Sentiment words and extras are frequent but not dominant
+    weights = [3.0] * len(SENTIMENT_WORDS) + [1.0] * len(EXTRAS) + [
+        1.0 / rank ** 1.1 * 100 for rank in range(1, len(tokens) - len(SENTIMENT_WORDS) - len(EXTRAS) + 1)]
+    cum_weights, total = [], 0.0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+    choices = rng.choices
+    return [' '.join(choices(tokens, cum_weights=cum_weights, k=words)) for _ in range(rows)]
+
+
+def _proc_status_mib(field: str) -> Optional[float]:
+    """``field`` (VmRSS, VmHWM) of /proc/self/status in MiB; None without procfs."""
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as status:
+            for line in status:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mib() -> Optional[float]:
+    """Peak resident set size of this process so far, or since ``reset_peak_rss``."""
+    peak = _proc_status_mib('VmHWM')
+    if peak is not None or resource is None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def reset_peak_rss() -> Optional[float]:
+    """Restart the peak RSS at the current RSS where possible; returns the RSS growth is measured from."""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        # The peak so far stays, so growth below it is not seen
+        return peak_rss_mib()
+    return _proc_status_mib('VmRSS')
+
+
+def best_time(repeat: int, function: Callable[[], Any], setup: Callable[[], Any] = lambda: None,
+              min_time: float = 0.0) -> Tuple[float, Optional[float]]:
+    """Fastest of ``repeat`` timed calls of ``function(setup())``, or more until they take ``min_time``
+    seconds in all, and the peak RSS growth over them (MiB)."""
+    baseline = reset_peak_rss()
+    best, total, runs = float('inf'), 0.0, 0
+    while runs < repeat or total < min_time:
+        argument = setup()
+        started = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - started
+        best, total, runs = min(best, elapsed), total + elapsed, runs + 1
+    peak = peak_rss_mib()
+    if peak is None or baseline is None:
+        return best, None
+    return best, round(max(peak - baseline, 0.0), 1)
+
+
+def _time_generator(case: Dict[str, Any]) -> Tuple[float, Optional[float]]:
+    generator = DataGenerator(seed=42)
+    method = getattr(generator, case['benchmark'])
+    # Rows are consumed as they come, as the writers do, instead of collected
+    return best_time(case['repeat'], lambda _: collections.deque(method(case['rows']), maxlen=0),
+                     min_time=case['min_time'])
+
+
+def _time_csv(case: Dict[str, Any]) -> Tuple[float, Optional[float]]:
+    stream = getattr(DataGenerator(seed=42), case['benchmark'].split(':', 1)[1])
+    generator = DataGenerator(seed=42)
+    directory = tempfile.mkdtemp(prefix='benchmark_csv_')
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            # The first write pays one-time costs (date formatting setup)
+            generator.save_to_csv(stream(10), 'warmup')
+            return best_time(case['repeat'], lambda _: generator.save_to_csv(stream(case['rows']), 'table'),
+                             min_time=case['min_time'])
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _time_udf(case: Dict[str, Any]) -> Tuple[float, Optional[float]]:
+    rows = case['rows']
+    texts = synthetic_texts(rows, case['text_words'])
+    columns = {
+        'text': texts,
+        'text2': texts[1:] + texts[:1],
+        'key': [str(index) for index in range(rows)],
+        'group': [str(index // GROUP_ROWS) for index in range(rows)],
+    }
+    directory = tempfile.mkdtemp(prefix='benchmark_udf_')
+    try:
+        shutil.copy(LEXICON, directory)
+        install_odps_standin(directory)
+        module = load_module(case['module'])
+        module.build_idf_table(texts, os.path.join(directory, IDF_TABLE))
+        call = UdfCall(UDF_CALLS[case['benchmark']]).bind(module)
+        arguments = [columns[value] if kind == 'column' else [value] * rows
+                     for kind, value in call.arguments]
+        arguments = list(zip(*arguments))
+        if call.is_udtf:
+            return best_time(case['repeat'], _process_all, lambda: (call.udf_class(), arguments),
+                             min_time=case['min_time'])
+        # Warm up the instance: lexicons and tables load on first use
+        udf = call.udf_class()
+        udf.evaluate(*arguments[0])
+        return best_time(case['repeat'], lambda _: _evaluate_all(udf.evaluate, arguments),
+                         min_time=case['min_time'])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _evaluate_all(evaluate: Callable, arguments: List[tuple]):
+    for row in arguments:
+        evaluate(*row)
+
+
+def _process_all(setup: Tuple[Any, List[tuple]]):
+    udtf, arguments = setup
+    udtf.forward = lambda *values: None
+    process = udtf.process
+    for row in arguments:
+        process(*row)
+    udtf.close()
+
+
+TIMERS = {'generator': _time_generator, 'csv': _time_csv, 'udf': _time_udf}
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Time one case; runs in a fresh process so no other case's memory is counted."""
+    seconds, rss_growth = TIMERS[case['group']](case)
+    return {
+        'group': case['group'],
+        'benchmark': case['benchmark'],
+        'rows': case['rows'],
+        'text_words': case.get('text_words'),
+        'seconds': round(seconds, 6),
+        'rows_per_second': round(case['rows'] / seconds, 1) if seconds else None,
+        'peak_rss_growth_mib': rss_growth,
+    }
+
+
+def case_key(result: Dict[str, Any]) -> Tuple[str, int, Optional[int]]:
+    return result['benchmark'], result['rows'], result.get('text_words')
+
+
+def plan_cases(groups: List[str], sizes: List[int], text_words: List[int], repeat: int,
+               module_path: str = DEFAULT_MODULE, pattern: Optional[str] = None,
+               min_time: float = 0.0) -> List[Dict[str, Any]]:
+    """Every case of ``groups``, optionally only benchmarks matching ``pattern``."""
+    tables = [name[len('generate_'):] for name in dir(DataGenerator)
+              if name.startswith('generate_') and hasattr(DataGenerator, f"iter_{name[len('generate_'):]}")]
+    cases = []
+    for group in groups:
+        if group == 'generator':
+            names = [(f'iter_{table}', None) for table in tables]
+        elif group == 'csv':
+            names = [(f'save_to_csv:iter_{table}', None) for table in tables]
+        else:
+            names = [(name, words) for name in udf_classes(module_path) for words in text_words]
+        for name, words in names:
+            if pattern and not re.search(pattern, name):
+                continue
+            for rows in sizes:
+                case = dict(group=group, benchmark=name, rows=rows, repeat=repeat, min_time=min_time)
+                if group == 'udf':
+                    case.update(text_words=words, module=module_path)
+                cases.append(case)
+    return cases
+
+
+def udf_classes(module_path: str) -> List[str]:
+    """UDF and UDTF classes of the module with a benchmark call, in UDF_CALLS order."""
+    install_odps_standin(os.path.dirname(module_path))
+    module = load_module(module_path)
+    found = [name for name, value in vars(module).items()
+             if isinstance(value, type) and name.startswith('Text')
+             and (hasattr(value, 'evaluate') or hasattr(value, 'process'))]
+    for name in found:
+        if name not in UDF_CALLS:
+            print(f"Warning: no benchmark call for {name}; add one to UDF_CALLS", file=sys.stderr)
+    return [name for name in UDF_CALLS if name in found]
+
+
+def machine_info() -> Dict[str, Any]:
+    """Where the results were measured; baselines compare only on the same machine."""
+    info = {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': f'{platform.python_implementation()} {platform.python_version()}',
+    }
+    if hasattr(os, 'sysconf') and 'SC_PHYS_PAGES' in os.sysconf_names:
+        info['memory_gib'] = round(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 3, 1)
+    try:
+        info['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def run(cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Run every case in its own spawned process, printing each result."""
+    results = []
+    # Spawned processes inherit the environment: one hash seed gives every case
+    # process, in this run and the baseline's, the same set and dict layouts
+    os.environ.setdefault('PYTHONHASHSEED', '0')
+    context = get_context('spawn')
+    for case in cases:
+        label = describe(case)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_case, case).result()
+        print(f"{label:<48} {result['rows_per_second']:>14,.0f} rows/s "
+              f"{result['seconds']:>10.3f}s {format_rss(result['peak_rss_growth_mib'])}")
+        results.append(result)
+    return results
+
+
+def describe(case: Dict[str, Any]) -> str:
+    words = f" x {case['text_words']} words" if case.get('text_words') else ''
+    return f"{case['benchmark']} [{case['rows']:,} rows{words}]"
+
+
+def format_rss(value: Optional[float]) -> str:
+    return f'{value:>+8.1f} MiB' if value is not None else '       n/a'
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+            threshold: float, min_rss_change: float = 0.0) -> List[str]:
+    """Regressions of ``results`` against ``baseline``, one message each."""
+    previous = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        label = describe(result)
+        if old.get('rows_per_second') and result['rows_per_second'] is not None:
+            change = result['rows_per_second'] / old['rows_per_second'] - 1
+            if change < -threshold:
+                regressions.append(f"{label}: throughput {change:+.1%} "
+                                   f"({old['rows_per_second']:,.0f} -> {result['rows_per_second']:,.0f} rows/s)")
+        if old.get('peak_rss_growth_mib') and result['peak_rss_growth_mib'] is not None:
+            change = result['peak_rss_growth_mib'] / old['peak_rss_growth_mib'] - 1
+            growth = result['peak_rss_growth_mib'] - old['peak_rss_growth_mib']
+            if change > threshold and growth >= min_rss_change:
+                regressions.append(f"{label}: peak RSS growth {change:+.1%} "
+                                   f"({old['peak_rss_growth_mib']:.1f} -> {result['peak_rss_growth_mib']:.1f} MiB)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the generator and UDF hot paths')
+    parser.add_argument('--group', type=parse_list(str), default=list(GROUPS),
+                        help=f"Comma-separated groups to run, of {', '.join(GROUPS)} (default: all)")
+    parser.add_argument('--sizes', type=parse_list(parse_size), default=[1000, 10000, 100000],
+                        help='Comma-separated row counts, e.g. 1k,10k,100k,1m,10m (default: 1k,10k,100k)')
+    parser.add_argument('--text-words', type=parse_list(int), default=[10, 100],
+                        help='Comma-separated UDF text lengths in words (default: 10,100)')
+    parser.add_argument('--filter', help='Only benchmarks whose name matches this regular expression')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per case; the fastest counts (default: 3)')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Repeat a case beyond --repeat until its runs take this many seconds '
+                             '(default: 0.2)')
+    parser.add_argument('--module', default=DEFAULT_MODULE, help='UDF module to benchmark')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Largest tolerated relative throughput drop or rise in peak RSS growth '
+                             '(default: 0.1)')
+    parser.add_argument('--min-rss-change', type=float, default=1.0,
+                        help='Smallest rise in peak RSS growth (MiB) counted as a regression (default: 1.0)')
+    args = parser.parse_args()
+
+    unknown = set(args.group) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown group(s): {', '.join(sorted(unknown))}")
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    if args.min_time < 0 or args.min_rss_change < 0:
+        parser.error('--min-time and --min-rss-change cannot be negative')
+
+    cases = plan_cases(args.group, args.sizes, args.text_words, args.repeat,
+                       os.path.abspath(args.module), args.filter, args.min_time)
+    if not cases:
+        parser.error('No benchmarks selected')
+    machine = machine_info()
+    print(f"Running {len(cases)} benchmarks on {machine['platform']} "
+          f"({machine['cpu_count']} CPUs, {machine['python']})")
+    results = run(cases)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                       'machine': machine, 'results': results}, output, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        differences = [name for name in ('hostname', 'platform', 'processor', 'cpu_count', 'python')
+                       if baseline.get('machine', {}).get(name) != machine.get(name)]
+        if differences:
+            print(f"Warning: baseline was measured on a different machine "
+                  f"(different {', '.join(differences)})", file=sys.stderr)
+        regressions = compare(results, baseline.get('results', []), args.threshold, args.min_rss_change)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
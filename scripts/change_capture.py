@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Sort-merge change detection for customer_changes
+
+The incremental section of sql/05_etl_workflows.sql finds inserted, updated
+and deleted customers by full-outer-joining today's table with yesterday's
+snapshot, comparing every column and building JSON with CONCAT (unescaped, so
+a quote in a name breaks it). Here each row of a snapshot is reduced to its
+key, a stable fingerprint of the tracked columns (BLAKE2b over the
+length-prefixed values) and, unless --fingerprints-only, the JSON of those
+values. These records are stored sorted by key per ds:
+
+    <state-dir>/<table>/ds=<ds>/fingerprints.csv.gz   (and columns.json, the tracked columns)
+
+The next snapshot is sorted by key with an external merge sort (runs of
+--buffer-rows records are spilled to temporary files and merged at most 64 at
+a time, so memory and open files stay bounded however large the table is),
+then merge-joined with the stored records of the
+previous ds in one sequential pass: keys only in the new snapshot are INSERTs,
+keys only in the old one DELETEs, and keys whose fingerprints differ UPDATEs.
+Of rows sharing a key, the first in file order is kept. The new snapshot's
+records are written as the next ds's store on the way.
+
+Changes come out shaped like customer_changes, with old_data/new_data as
+properly escaped JSON (numbers typed from the DDL), and are streamed to
+<output-dir>/customer_changes/ds=<ds>/part-00000.csv as they are found.
+
+Usage:
+    python change_capture.py --snapshot generated_data/customers_generated.csv --ds 20240115 --baseline-only
+    python change_capture.py --snapshot /data/customers_20240116.csv --ds 20240116 --output-dir generated_data
+    python change_capture.py --data-dir generated_data --ds 20240116 --columns all --buffer-rows 1000000
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from local_engine import CSV_CONVERTERS, open_csv, table_files
+from output_writers import load_schemas, open_writer
+
+
+ETL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sql', '05_etl_workflows.sql')
+
+# Columns compared and written to old_data/new_data by sql/05
+DEFAULT_COLUMNS = ['first_name', 'last_name', 'email']
+
+STORE_HEADER = ['key', 'fingerprint', 'data']
+
+# A snapshot record: key, fingerprint, JSON of the tracked values ('' when not stored)
+Record = Tuple[str, str, str]
+
+
+def fingerprint(values: Sequence[Optional[str]]) -> str:
+    """Stable hash of a row's values; NULL and '' hash differently."""
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if value is None:
+            digest.update(b'\xff\xff\xff\xff')
+        else:
+            data = value.encode('utf-8')
+            digest.update(len(data).to_bytes(4, 'little'))
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def snapshot_records(paths: Iterable[str], key: str, columns: List[Tuple[str, str]],
+                     store_values: bool) -> Iterator[Record]:
+    """Records of every row of the snapshot files, in file order."""
+    converters = [CSV_CONVERTERS.get(column_type) for _, column_type in columns]
+    for path in paths:
+        with open_csv(path) as csv_file:
+            reader = csv.reader(csv_file)
+            lookup = {name.strip().lower(): index for index, name in enumerate(next(reader, []))}
+            if key not in lookup:
+                raise ValueError(f'{path} has no {key} column')
+            key_position = lookup[key]
+            positions = [lookup.get(name) for name, _ in columns]
+            for record in reader:
+                if key_position >= len(record) or record[key_position] == '':
+                    continue
+                values = [record[position] if position is not None and position < len(record)
+                          and record[position] != '' else None for position in positions]
+                data = ''
+                if store_values:
+                    data = json.dumps({name: _typed(value, convert)
+                                       for (name, _), value, convert in zip(columns, values, converters)},
+                                      ensure_ascii=False, separators=(',', ':'))
+                yield record[key_position], fingerprint(values), data
+
+
+def _typed(value: Optional[str], convert) -> object:
+    if value is None or convert is None:
+        return value
+    try:
+        return convert(value)
+    except ValueError:
+        return value
+
+
+class ExternalSorter:
+    """Sorts records in runs of ``buffer_rows``, spilled to disk and merged.
+
+    At most ``fan_in`` runs are open at once: with more, groups of them are
+    merged into longer runs first, pass by pass.
+    """
+
+    def __init__(self, buffer_rows: int, temp_dir: Optional[str] = None, fan_in: int = 64):
+        if fan_in < 2:
+            raise ValueError('ExternalSorter needs a fan_in of at least 2')
+        self.buffer_rows = buffer_rows
+        self.temp_dir = temp_dir
+        self.fan_in = fan_in
+        self.runs: List[str] = []
+        self.merge_passes = 0
+        self._merged = 0
+        self._directory = None
+
+    def sort(self, records: Iterable[Record]) -> Iterator[Record]:
+        buffer = []
+        for record in records:
+            buffer.append(record)
+            if len(buffer) >= self.buffer_rows:
+                self._spill(buffer)
+                buffer = []
+        buffer.sort()
+        if not self.runs:
+            yield from buffer
+            return
+        if buffer:
+            self._spill(buffer)
+        runs = list(self.runs)
+        while len(runs) > self.fan_in:
+            runs = [self._merge_runs(runs[start:start + self.fan_in]) for start in range(0, len(runs), self.fan_in)]
+            self.merge_passes += 1
+        files = [gzip.open(path, 'rt', encoding='utf-8', newline='') for path in runs]
+        try:
+            yield from heapq.merge(*(map(tuple, csv.reader(run)) for run in files))
+        finally:
+            for run in files:
+                run.close()
+
+    def _spill(self, buffer: List[Record]):
+        buffer.sort()
+        path = self._run_path(f'run-{len(self.runs):05d}.csv.gz')
+        self._write_run(path, buffer)
+        self.runs.append(path)
+
+    def _merge_runs(self, paths: List[str]) -> str:
+        """Merge ``paths`` into one new run and delete them; a single run is kept as is."""
+        if len(paths) == 1:
+            return paths[0]
+        path = self._run_path(f'merged-{self._merged:05d}.csv.gz')
+        self._merged += 1
+        files = [gzip.open(run, 'rt', encoding='utf-8', newline='') for run in paths]
+        try:
+            self._write_run(path, heapq.merge(*(map(tuple, csv.reader(run)) for run in files)))
+        finally:
+            for run in files:
+                run.close()
+        for run in paths:
+            os.remove(run)
+        return path
+
+    def _run_path(self, name: str) -> str:
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix='change_capture_', dir=self.temp_dir)
+        return os.path.join(self._directory, name)
+
+    @staticmethod
+    def _write_run(path: str, records: Iterable[tuple]):
+        # Runs are read back once, so the fastest compression is enough
+        with gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=1) as run:
+            csv.writer(run).writerows(records)
+
+    def cleanup(self):
+        if self._directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+class FingerprintStore:
+    """Sorted snapshot records per ds in ``<directory>/<table>/ds=<ds>/fingerprints.csv.gz``."""
+
+    filename = 'fingerprints.csv.gz'
+
+    def __init__(self, directory: str, table: str):
+        self.root = os.path.join(directory, table)
+
+    def path(self, ds: str) -> str:
+        return os.path.join(self.root, f'ds={ds}', self.filename)
+
+    def partitions(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[3:] for name in os.listdir(self.root)
+                      if name.startswith('ds=') and os.path.isfile(os.path.join(self.root, name, self.filename)))
+
+    def previous(self, ds: str) -> Optional[str]:
+        """Latest stored ds before ``ds``."""
+        earlier = [stored for stored in self.partitions() if stored < ds]
+        return earlier[-1] if earlier else None
+
+    def columns(self, ds: str) -> Optional[List[str]]:
+        """Tracked columns the fingerprints of ``ds`` were computed over."""
+        try:
+            with open(os.path.join(self.root, f'ds={ds}', 'columns.json'), 'r', encoding='utf-8') as columns_file:
+                return json.load(columns_file)
+        except FileNotFoundError:
+            return None
+
+    def read(self, ds: str) -> Iterator[Record]:
+        with gzip.open(self.path(ds), 'rt', encoding='utf-8', newline='') as store:
+            reader = csv.reader(store)
+            next(reader, None)
+            for record in reader:
+                yield tuple(record)
+
+
+def diff(previous: Iterator[Record], current: Iterator[Record],
+         keep=None) -> Iterator[Tuple[str, str, Optional[Record], Optional[Record]]]:
+    """Merge-join two key-sorted record streams into (key, change, old, new) changes.
+
+    ``keep`` is called with every record of ``current`` in key order, and with
+    None for each later record of a key already seen: the first record of a
+    key in ``current`` wins (``capture`` sorts a key's rows in file order).
+    """
+    sentinel = None
+    old = next(previous, sentinel)
+    new = next(current, sentinel)
+    last_key = None
+    while old is not sentinel or new is not sentinel:
+        if new is not sentinel and new[0] == last_key:
+            if keep:
+                keep(None)
+            new = next(current, sentinel)
+            continue
+        if new is sentinel or (old is not sentinel and old[0] < new[0]):
+            yield old[0], 'DELETE', old, None
+            old = next(previous, sentinel)
+            continue
+        last_key = new[0]
+        if keep:
+            keep(new)
+        if old is sentinel or new[0] < old[0]:
+            yield new[0], 'INSERT', None, new
+        else:
+            if old[1] != new[1]:
+                yield new[0], 'UPDATE', old, new
+            old = next(previous, sentinel)
+        new = next(current, sentinel)
+
+
+def capture(paths: List[str], ds: str, store: FingerprintStore, key: str, columns: List[Tuple[str, str]],
+            store_values: bool, buffer_rows: int, previous_ds: Optional[str], baseline_only: bool,
+            changed_at: datetime, temp_dir: Optional[str] = None, changes_writer=None,
+            show: int = 0) -> Tuple[List[tuple], Dict[str, int]]:
+    """Diff snapshot ``paths`` against the store of ``previous_ds`` and store ``ds``.
+
+    The customer_changes rows go to ``changes_writer`` as they are found;
+    only the first ``show`` are returned, with the stats.
+    """
+    stats = {'rows': 0, 'duplicates': 0, 'INSERT': 0, 'UPDATE': 0, 'DELETE': 0, 'runs': 0, 'merge_passes': 0}
+    sorter = ExternalSorter(buffer_rows, temp_dir)
+    target = store.path(ds)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = target + '.tmp'
+    shown, batch = [], []
+    try:
+        with gzip.open(partial, 'wt', encoding='utf-8', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(STORE_HEADER)
+
+            def keep(record):
+                if record is None:
+                    stats['duplicates'] += 1
+                    return
+                stats['rows'] += 1
+                writer.writerow(record)
+
+            # The row's position in the snapshot breaks ties, so the first row of a key sorts first
+            numbered = ((record[0], f'{sequence:012d}', *record[1:])
+                        for sequence, record in enumerate(snapshot_records(paths, key, columns, store_values)))
+            current = ((record_key, *record) for record_key, _, *record in sorter.sort(numbered))
+            previous = store.read(previous_ds) if previous_ds and not baseline_only else iter(())
+            for record_key, change, old, new in diff(previous, current, keep):
+                if baseline_only:
+                    continue
+                stats[change] += 1
+                row = (record_key, change, (old[2] or None) if old else None,
+                       (new[2] or None) if new else None, changed_at, False)
+                if len(shown) < show:
+                    shown.append(row)
+                if changes_writer is not None:
+                    batch.append(row)
+                    if len(batch) >= 10_000:
+                        changes_writer.write_rows(batch)
+                        batch = []
+            if batch:
+                changes_writer.write_rows(batch)
+        os.replace(partial, target)
+        with open(os.path.join(os.path.dirname(target), 'columns.json'), 'w', encoding='utf-8') as columns_file:
+            json.dump([name for name, _ in columns], columns_file)
+    finally:
+        stats['runs'], stats['merge_passes'] = len(sorter.runs), sorter.merge_passes
+        sorter.cleanup()
+        if os.path.exists(partial):
+            os.remove(partial)
+    return shown, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect inserted, updated and deleted rows between snapshots')
+    parser.add_argument('--snapshot', action='append',
+                        help='CSV file or directory of the current snapshot (repeatable; '
+                             'default: the table files in --data-dir)')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--table', default='customers', help='Table of the snapshot (default: customers)')
+    parser.add_argument('--key', help='Key column (default: the first column of the table)')
+    parser.add_argument('--columns', default=','.join(DEFAULT_COLUMNS),
+                        help='Comma-separated columns to track, or "all" (default: first_name,last_name,email)')
+    parser.add_argument('--ds', default=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'),
+                        help='ds of the snapshot (default: yesterday)')
+    parser.add_argument('--previous-ds', help='Stored ds to diff against (default: the latest before --ds)')
+    parser.add_argument('--baseline-only', action='store_true',
+                        help='Only store the snapshot, without emitting changes')
+    parser.add_argument('--fingerprints-only', action='store_true',
+                        help='Store fingerprints without values (old_data is then NULL)')
+    parser.add_argument('--state-dir', default=os.path.join('generated_data', 'change_state'),
+                        help='Directory of the per-ds fingerprint stores (default: generated_data/change_state)')
+    parser.add_argument('--buffer-rows', type=int, default=500_000,
+                        help='Records sorted in memory before spilling a run to disk (default: 500000)')
+    parser.add_argument('--temp-dir', help='Directory for sort runs (default: the system temp directory)')
+    parser.add_argument('--output-dir', help='Write <dir>/customer_changes/ds=<ds>/part-00000.csv')
+    parser.add_argument('--show', type=int, default=10, help='Changes to print (default: 10)')
+    args = parser.parse_args()
+
+    table = args.table.lower()
+    schemas = load_schemas()
+    if table not in schemas:
+        parser.error(f'Unknown table {table}')
+    schema = schemas[table]
+    key = (args.key or schema.column_names[0]).lower()
+    types = dict(schema.columns)
+    if key not in types:
+        parser.error(f'{table} has no column {key}')
+    names = ([name for name in schema.column_names if name != key] if args.columns == 'all'
+             else [name.strip().lower() for name in args.columns.split(',') if name.strip()])
+    unknown = [name for name in names if name not in types]
+    if unknown or not names:
+        parser.error(f"Unknown column(s) of {table}: {', '.join(unknown) or '(none given)'}")
+    columns = [(name, types[name]) for name in names]
+    if args.buffer_rows < 1:
+        parser.error('--buffer-rows must be at least 1')
+
+    if args.snapshot:
+        paths = []
+        for snapshot in args.snapshot:
+            if os.path.isdir(snapshot):
+                paths.extend(sorted(os.path.join(root, name) for root, _, files in os.walk(snapshot)
+                                    for name in files if name.endswith(('.csv', '.csv.gz'))))
+            else:
+                paths.append(snapshot)
+    else:
+        paths = [path for path, _ in table_files(args.data_dir, table)]
+    if not paths:
+        parser.error(f'No snapshot files of {table}')
+
+    store = FingerprintStore(args.state_dir, table)
+    previous_ds = args.previous_ds or store.previous(args.ds)
+    if previous_ds and previous_ds not in store.partitions():
+        parser.error(f'No stored snapshot for ds {previous_ds} in {store.root}')
+    if previous_ds and not args.baseline_only and store.columns(previous_ds) not in (None, names):
+        parser.error(f"ds {previous_ds} tracked {','.join(store.columns(previous_ds))}, not {','.join(names)}; "
+                     f"store a new baseline with --baseline-only first")
+    if not previous_ds and not args.baseline_only:
+        print(f"No stored snapshot before {args.ds}: every row is an INSERT")
+
+    writer = None
+    if args.output_dir and not args.baseline_only:
+        directory = os.path.join(args.output_dir, 'customer_changes', f'ds={args.ds}')
+        os.makedirs(directory, exist_ok=True)
+        writer = open_writer('csv', os.path.join(directory, 'part-00000'),
+                             load_schemas(ETL_SCRIPT)['customer_changes'])
+    started = time.perf_counter()
+    try:
+        shown, stats = capture(paths, args.ds, store, key, columns, not args.fingerprints_only,
+                               args.buffer_rows, previous_ds, args.baseline_only,
+                               datetime.now().replace(microsecond=0), args.temp_dir, writer, args.show)
+    except (OSError, ValueError) as error:
+        if writer:
+            # No partial customer_changes partition is left behind
+            writer.close()
+            os.remove(writer.path)
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+    if writer:
+        writer.close()
+    seconds = time.perf_counter() - started
+
+    against = 'baseline only' if args.baseline_only else (f'against ds {previous_ds}' if previous_ds else 'no baseline')
+    print(f"\n{table} ds {args.ds} ({against}): {stats['rows']:,} rows in {seconds:.3f}s, "
+          f"{stats['runs']} sort run(s) spilled, {stats['merge_passes']} intermediate merge pass(es)")
+    if stats['duplicates']:
+        print(f"  Warning: {stats['duplicates']:,} row(s) with a duplicate {key} skipped "
+              f"(the first in file order is kept)")
+    if not args.baseline_only:
+        print(f"  {stats['INSERT']:,} INSERT, {stats['UPDATE']:,} UPDATE, {stats['DELETE']:,} DELETE")
+    for change in shown:
+        print(f"  {change[1]:<7} {change[0]:<14} {change[2] or '-'}  ->  {change[3] or '-'}")
+    print(f"Stored {store.path(args.ds)}")
+    if writer:
+        print(f"Wrote {stats['INSERT'] + stats['UPDATE'] + stats['DELETE']:,} change(s) to {writer.path}")
+
+
+if __name__ == "__main__":
+    main()
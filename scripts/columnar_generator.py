@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Columnar (NumPy) engine for the sample data generator
+
+Builds every column of a batch as one array instead of looping row by row:
+prices and quantities are drawn as whole uniform arrays, categorical columns
+are single index draws into their value pool, timestamps are epoch seconds
+and derived columns (line_total, shipping_cost, session_end, ...) are array
+arithmetic. Values are formatted through precomputed lookup tables (integers,
+zero-padded ID parts, cents, time of day) and each batch is written in bulk.
+
+The CSV schema and value formatting match DataGenerator exactly; only the
+random stream differs, so a given seed produces different (but equally
+reproducible) rows than the pure-Python engine.
+
+Usage:
+    python data_generator.py --table all --records 1000000 --engine numpy
+    python data_generator.py --table page_views --records 50000000 --engine numpy --seed 42 --workers 8
+
+Requires numpy.
+"""
+
+import hashlib
+import random
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from data_generator import DataGenerator, EVENT_END_DATE, EVENT_START_DATE, IdRange, VisitPlan
+from key_distributions import KeyDistribution
+
+
+EPOCH = datetime(1970, 1, 1)
+
+# '000'..'999' for zero-padded ID parts, ' HH:MM:SS' for every second of the
+# day, and '.NN' cent suffixes in the shortest form repr() uses for a rounded
+# float ('.0', '.5', '.05', '.55')
+PAD3 = np.array([f'{i:03d}' for i in range(1000)], dtype=object)
+_PAD2 = np.array([f'{i:02d}' for i in range(60)], dtype=object)
+_SECOND = np.arange(24 * 60 * 60)
+TIME_OF_DAY = (' ' + _PAD2[_SECOND // 3600] + ':' + _PAD2[_SECOND // 60 % 60]
+               + ':' + _PAD2[_SECOND % 60])
+CENTS = np.array(['.0'] + [f'.{c:02d}' if c % 10 else f'.{c // 10}' for c in range(1, 100)],
+                 dtype=object)
+
+_int_strings = np.array(['0'], dtype=object)
+
+
+def format_ints(values: np.ndarray) -> np.ndarray:
+    """Format non-negative integers as strings through a growing lookup table."""
+    global _int_strings
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.empty(0, dtype=object)
+    limit = int(values.max()) + 1
+    if limit > len(_int_strings):
+        _int_strings = np.array([str(i) for i in range(max(limit, 2 * len(_int_strings)))],
+                                dtype=object)
+    return _int_strings[values]
+
+
+def format_ids(prefix: str, numbers: np.ndarray) -> np.ndarray:
+    """Format 1-based integers as ``PREFIX000001``-style IDs (``f'{n:06d}'``)."""
+    high, low = np.divmod(np.asarray(numbers), 1000)
+    # Below a million the thousands part is zero-padded too; above it is not
+    high_text = np.where(high < 1000, PAD3[np.minimum(high, 999)], format_ints(high))
+    return prefix + high_text + PAD3[low]
+
+
+def format_datetimes(seconds: np.ndarray) -> np.ndarray:
+    """Format epoch seconds as ``YYYY-MM-DD HH:MM:SS`` strings.
+
+    Only the distinct days of the batch are formatted; each value is then two
+    table lookups and one concatenation.
+    """
+    if len(seconds) == 0:
+        return np.empty(0, dtype=object)
+    days, second_of_day = np.divmod(seconds, 86400)
+    first_day = days.min()
+    dates = np.datetime_as_string(np.arange(first_day, days.max() + 1)
+                                  .astype('datetime64[D]')).astype(object)
+    return dates[days - first_day] + TIME_OF_DAY[second_of_day]
+
+
+def format_money(values: np.ndarray) -> np.ndarray:
+    """Format non-negative amounts exactly like ``str(round(value, 2))``."""
+    dollars, cents = np.divmod(np.rint(np.asarray(values) * 100).astype(np.int64), 100)
+    return format_ints(dollars) + CENTS[cents]
+
+
+class ColumnarGenerator:
+    """Vectorized counterpart of DataGenerator's ``iter_*`` producers.
+
+    Each ``columns_<table>`` method returns one batch as a list of object
+    arrays of strings in the table's DDL column order.
+    """
+
+    def __init__(self, seed: Optional[Any] = None):
+        if isinstance(seed, str):
+            # Shard seeds are strings; fold them into a 128-bit integer
+            seed = int.from_bytes(hashlib.sha256(seed.encode('utf-8')).digest()[:16], 'big')
+        self.rng = np.random.default_rng(seed)
+        self.pools = DataGenerator()
+        self._check_pools()
+
+    def columns_customers(self, n: int, start: int = 0, start_date: datetime = None,
+                          end_date: datetime = None) -> List[np.ndarray]:
+        pools = self.pools
+        first_index = self.rng.integers(0, len(pools.first_names), n)
+        last_index = self.rng.integers(0, len(pools.last_names), n)
+        country_index = self.rng.integers(0, len(pools.countries), n)
+        countries = self._pool(pools.countries)[country_index]
+
+        # City depends on country: draw per country group
+        cities = np.empty(n, dtype=object)
+        for index, country in enumerate(pools.countries):
+            mask = country_index == index
+            cities[mask] = self._choice(pools.cities.get(country, ['Unknown City']), int(mask.sum()))
+
+        first_lower = self._pool([name.lower() for name in pools.first_names])
+        last_lower = self._pool([name.lower() for name in pools.last_names])
+        emails = first_lower[first_index] + '.' + last_lower[last_index] + '@email.com'
+
+        return [
+            format_ids('CUST', np.arange(start + 1, start + n + 1)),
+            self._pool(pools.first_names)[first_index],
+            self._pool(pools.last_names)[last_index],
+            emails,
+            self._phone_numbers(countries),
+            format_datetimes(self._timestamps(start_date or datetime(2020, 1, 1),
+                                              end_date or datetime(2024, 12, 31), n)),
+            countries,
+            cities,
+            self._choice(pools.age_groups, n),
+        ]
+
+    def columns_products(self, n: int, start: int = 0) -> List[np.ndarray]:
+        pools = self.pools
+        category_index = self.rng.integers(0, len(pools.product_categories), n)
+
+        base_names = np.empty(n, dtype=object)
+        sub_categories = np.empty(n, dtype=object)
+        for index, category in enumerate(pools.product_categories):
+            mask = category_index == index
+            count = int(mask.sum())
+            base_names[mask] = self._choice(pools.product_names.get(category, ['Generic Product']), count)
+            sub_categories[mask] = self._choice(pools.subcategories.get(category, ['General']), count)
+
+        base_cost = self.rng.uniform(10, 500, n)
+        markup = self.rng.uniform(1.5, 3.0, n)
+
+        return [
+            format_ids('PROD', np.arange(start + 1, start + n + 1)),
+            self._choice(pools.brands, n) + ' ' + base_names,
+            self._pool(pools.product_categories)[category_index],
+            sub_categories,
+            self._choice(pools.brands, n),
+            format_money(base_cost * markup),
+            format_money(base_cost),
+            'SUP' + PAD3[self.rng.integers(1, 21, n)],
+            format_datetimes(self._timestamps(datetime(2020, 1, 1), datetime(2024, 6, 30), n)),
+        ]
+
+    def columns_orders(self, n: int, customer_ids: Sequence[str] = None,
+                       start: int = 0, skew: Dict[str, KeyDistribution] = None,
+                       start_date: datetime = None, end_date: datetime = None) -> List[np.ndarray]:
+        pools = self.pools
+        if not customer_ids:
+            customer_ids = IdRange('CUST', 1000)
+
+        total_amount = np.round(self.rng.uniform(25, 500, n), 2)
+        shipping_cost = self.rng.uniform(5, 25, n)
+
+        return [
+            format_ids('ORD', np.arange(start + 1, start + n + 1)),
+            self._foreign_keys(customer_ids, n, skew, 'customer_id'),
+            format_datetimes(self._timestamps(start_date, end_date, n)),
+            self._choice(pools.order_statuses, n),
+            format_money(total_amount),
+            np.where(total_amount > 100, '0', format_money(shipping_cost)),
+            self._choice(pools.payment_methods, n),
+            self._addresses(n),
+        ]
+
+    def columns_order_items(self, n: int, order_ids: Sequence[str] = None,
+                            product_ids: Sequence[str] = None, start: int = 0,
+                            skew: Dict[str, KeyDistribution] = None) -> List[np.ndarray]:
+        if not order_ids:
+            order_ids = IdRange('ORD', 10000)
+        if not product_ids:
+            product_ids = IdRange('PROD', 1000)
+
+        quantity = self.rng.integers(1, 6, n)
+        unit_price = np.round(self.rng.uniform(10, 200, n), 2)
+        discounted = self.rng.random(n) <= 0.3
+        discount_amount = np.where(discounted,
+                                   np.round(unit_price * self.rng.uniform(0.05, 0.25, n), 2), 0.0)
+        line_total = np.round(unit_price * quantity - discount_amount, 2)
+
+        return [
+            format_ids('ITEM', np.arange(start + 1, start + n + 1)),
+            self._foreign_keys(order_ids, n, skew, 'order_id'),
+            self._foreign_keys(product_ids, n, skew, 'product_id'),
+            format_ints(quantity),
+            format_money(unit_price),
+            np.where(discounted, format_money(discount_amount), '0'),
+            format_money(line_total),
+        ]
+
+    def columns_web_sessions(self, n: int, num_users: int = None, start: int = 0,
+                             start_date: datetime = None, end_date: datetime = None) -> List[np.ndarray]:
+        pools = self.pools
+        if not num_users:
+            num_users = n // 10
+
+        session_start = self._timestamps(start_date, end_date, n)
+        duration = self.rng.integers(30, 3601, n)
+
+        return [
+            format_ids('SES', np.arange(start + 1, start + n + 1)),
+            format_ids('USR', self.rng.integers(1, num_users + 1, n)),
+            format_datetimes(session_start),
+            format_datetimes(session_start + duration),
+            format_ints(self.rng.integers(1, 26, n)),
+            format_ints(duration),
+            self._choice(pools.traffic_sources, n),
+            self._choice(pools.device_types, n),
+            self._choice(pools.browsers, n),
+            self._choice(pools.countries, n),
+        ]
+
+    def columns_page_views(self, n: int, session_ids: Sequence[str] = None,
+                           start: int = 0, skew: Dict[str, KeyDistribution] = None,
+                           start_date: datetime = None, end_date: datetime = None,
+                           num_users: int = None, visits: VisitPlan = None) -> List[np.ndarray]:
+        pools = self.pools
+        if not session_ids:
+            session_ids = IdRange('SES', 10000)
+        num_users = num_users or 10000
+        if visits:
+            users, timestamps = self._visit_columns([visits.page_view(i) for i in range(start, start + n)])
+        else:
+            users = format_ids('USR', self.rng.integers(1, num_users + 1, n))
+            timestamps = self._timestamps(start_date, end_date, n)
+
+        return [
+            format_ids('PV', np.arange(start + 1, start + n + 1)),
+            self._foreign_keys(session_ids, n, skew, 'session_id'),
+            users,
+            self._choice(pools.page_urls, n),
+            self._choice(pools.page_titles, n),
+            format_datetimes(timestamps),
+            format_ints(self.rng.integers(5, 601, n)),
+            self._choice(pools.referrers, n),
+            self._choice(['True', 'False'], n),
+        ]
+
+    def columns_user_events(self, n: int, session_ids: Sequence[str] = None,
+                            start: int = 0, skew: Dict[str, KeyDistribution] = None,
+                            start_date: datetime = None, end_date: datetime = None,
+                            num_users: int = None, visits: VisitPlan = None) -> List[np.ndarray]:
+        pools = self.pools
+        if not session_ids:
+            session_ids = IdRange('SES', 10000)
+        num_users = num_users or 10000
+        if visits:
+            # The offsets after each page view come from a stdlib RNG seeded by this batch
+            offsets = random.Random(int(self.rng.integers(2 ** 32)))
+            users, timestamps = self._visit_columns([visits.event(i, offsets) for i in range(start, start + n)])
+        else:
+            users = format_ids('USR', self.rng.integers(1, num_users + 1, n))
+            timestamps = self._timestamps(start_date, end_date, n)
+
+        return [
+            format_ids('EVT', np.arange(start + 1, start + n + 1)),
+            self._foreign_keys(session_ids, n, skew, 'session_id'),
+            users,
+            self._choice(pools.event_types, n),
+            format_datetimes(timestamps),
+            '/page_' + format_ints(self.rng.integers(1, 101, n)),
+            'element_' + format_ints(self.rng.integers(1, 1001, n)),
+            self._choice(pools.element_types, n),
+            'data_' + format_ints(self.rng.integers(1, 10001, n)),
+        ]
+
+    def write_table(self, table: str, num_records: int, writer, chunk_size: int = 100000,
+                    start: int = 0, **kwargs) -> int:
+        """Generate ``num_records`` rows of ``table`` into ``writer`` batch by batch.
+
+        ``writer`` is one of the ``output_writers`` writers. Output for a given
+        seed depends on ``chunk_size`` as well, since each batch draws its
+        columns in turn.
+        """
+        produce = getattr(self, f'columns_{table}')
+
+        for offset in range(0, num_records, chunk_size):
+            count = min(chunk_size, num_records - offset)
+            columns = produce(count, start=start + offset, **kwargs)
+            # Values never need quoting (see _check_pools), so CSV rows are
+            # joined directly instead of going through csv.writer
+            writer.write_text_columns([column.tolist() for column in columns])
+
+        return num_records
+
+    def _check_pools(self):
+        """Ensure no pool value would need CSV quoting."""
+        for name, pool in vars(self.pools).items():
+            groups = pool.values() if isinstance(pool, dict) else [pool]
+            for group in groups:
+                if not isinstance(group, list):
+                    continue
+                for value in group:
+                    if any(char in str(value) for char in ',"\r\n'):
+                        raise ValueError(f'{name} value {value!r} needs CSV quoting')
+
+    @staticmethod
+    def _pool(values: Sequence[str]) -> np.ndarray:
+        return np.array(values, dtype=object)
+
+    def _choice(self, pool: Sequence[str], n: int) -> np.ndarray:
+        return self._pool(pool)[self.rng.integers(0, len(pool), n)]
+
+    def _foreign_keys(self, ids: Sequence[str], n: int,
+                      skew: Optional[Dict[str, KeyDistribution]] = None,
+                      column: str = None) -> np.ndarray:
+        """Pick ``n`` keys from a parent ID list or IdRange, uniformly unless skewed."""
+        distribution = (skew or {}).get(column)
+        if distribution is None:
+            picks = self.rng.integers(0, len(ids), n)
+        else:
+            picks = distribution.sample_array(len(ids), self.rng, n)
+        if isinstance(ids, IdRange):
+            numbers = picks + ids.offset + 1
+            if ids.excluded:
+                numbers += np.searchsorted(np.array(ids.gaps), picks + 1, side='right')
+            return format_ids(ids.prefix, numbers)
+        return self._pool(ids)[picks]
+
+    @staticmethod
+    def _visit_columns(rows: List[tuple]) -> tuple:
+        """User IDs and epoch seconds of ``VisitPlan`` rows."""
+        users = np.array([user_id for user_id, _ in rows], dtype=object)
+        seconds = np.array([int((timestamp - EPOCH).total_seconds()) for _, timestamp in rows], dtype=np.int64)
+        return users, seconds
+
+    def _timestamps(self, start_date: Optional[datetime], end_date: Optional[datetime],
+                    n: int) -> np.ndarray:
+        """Vectorized ``DataGenerator.random_date`` as epoch seconds.
+
+        Missing dates default to the event range of ``data_generator``.
+        """
+        start_date = start_date or EVENT_START_DATE
+        end_date = end_date or EVENT_END_DATE
+        days_between = (end_date - start_date).days
+        days = self.rng.integers(0, days_between, n)
+        seconds = self.rng.integers(0, 24 * 60 * 60, n)
+        start_seconds = int((start_date - EPOCH).total_seconds())
+        return start_seconds + days * 86400 + seconds
+
+    def _phone_numbers(self, countries: np.ndarray) -> np.ndarray:
+        """Vectorized ``DataGenerator.generate_phone_number``."""
+        n = len(countries)
+        integers = self.rng.integers
+        usa = ('+1-' + format_ints(integers(200, 1000, n)) + '-'
+               + format_ints(integers(200, 1000, n)) + '-' + format_ints(integers(1000, 10000, n)))
+        uk = ('+44-20-' + format_ints(integers(1000, 10000, n)) + '-'
+              + format_ints(integers(1000, 10000, n)))
+        germany = ('+49-30-' + format_ints(integers(100, 1000, n)) + '-'
+                   + format_ints(integers(1000, 10000, n)))
+        other = ('+' + format_ints(integers(1, 1000, n)) + '-'
+                 + format_ints(integers(100, 1000, n)) + '-' + format_ints(integers(1000, 10000, n)))
+        return np.select([countries == 'USA', countries == 'UK', countries == 'Germany'],
+                         [usa, uk, germany], other)
+
+    def _addresses(self, n: int) -> np.ndarray:
+        """Vectorized ``DataGenerator.generate_address``."""
+        return (format_ints(self.rng.integers(1, 10000, n)) + ' '
+                + self._choice(self.pools.street_names, n))
@@ -9,18 +9,148 @@ Usage:
     python data_generator.py --table all --records 1000  # Generate all tables with 1000 records each
 """
 
-import csv
+import bisect
+import functools
+import itertools
 import random
 import argparse
+import operator
 import os
+import shutil
+import sys
+import time
+from array import array
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional
 import uuid
 
+from key_distributions import KeyDistribution, parse_skew
+from output_writers import (CsvWriter, DsIndex, PartitionedWriter, TableSchema,
+                            file_extension, get_schema, open_writer, output_size,
+                            partition_function, throughput)
+
+
+# Default date range of event tables (orders, sessions, page views, user
+# events); the end is exclusive
+EVENT_START_DATE = datetime(2024, 1, 1)
+EVENT_END_DATE = datetime(2024, 6, 30)
+
+
+class IdRange(Sequence):
+    """Lazy sequence of ``PREFIX000001``-style IDs.
+    
+    Behaves like the equivalent list of ID strings (``random.choice`` picks
+    the same element from both), but costs nothing to build or pickle, so
+    shards can reference the full key space of a parent table. ``offset``
+    skips the first IDs, e.g. to reference only one day's new rows, and the
+    ``excluded`` ID numbers (e.g. deleted customers) are left out: ``count``
+    is the number of IDs that remain.
+    """
+    
+    def __init__(self, prefix: str, count: int, offset: int = 0, excluded: Iterable[int] = ()):
+        self.prefix = prefix
+        self.count = count
+        self.offset = offset
+        self.excluded = sorted(excluded)
+        # The i-th excluded number follows gaps[i] + i IDs: an index maps to
+        # its number by bisecting these
+        self.gaps = [number - offset - i for i, number in enumerate(self.excluded)]
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('IdRange index out of range')
+        return f'{self.prefix}{self.number(index):06d}'
+    
+    def number(self, index: int) -> int:
+        """ID number at ``index``, counting from 1."""
+        return self.offset + index + 1 + bisect.bisect_right(self.gaps, index + 1)
+    
+    def __reduce__(self):
+        return (IdRange, (self.prefix, self.count, self.offset, self.excluded))
+
+
+class VisitPlan:
+    """User and time of every page view and user event, clustered into visits.
+    
+    Page views are cut into visits of a geometric number of pages
+    (``mean_pages`` on average, a single page for about 1 in ``mean_pages``).
+    A visit is one of ``num_users`` users starting at a random time in
+    ``[start_date, end_date)``, with its pages 10 seconds to 5 minutes apart.
+    Each block of ``BLOCK`` page views draws its visits from its own seeded
+    RNG, so any shard finds a row's visit without the rows before it. User
+    event ``i`` of ``events`` happens up to a minute after page view
+    ``i * page_views // events``. Like ``IdRange``, it costs nothing to
+    pickle.
+    """
+    
+    BLOCK = 64
+    
+    def __init__(self, seed: Any, num_users: int, page_views: int, events: int,
+                 start_date: datetime = None, end_date: datetime = None, mean_pages: float = 3.5):
+        self.seed = seed
+        self.num_users = num_users
+        self.page_views = page_views
+        self.events = events
+        self.start_date = start_date or EVENT_START_DATE
+        self.end_date = end_date or EVENT_END_DATE
+        self.mean_pages = mean_pages
+        self._block = None
+        self._rows = []
+    
+    def page_view(self, index: int) -> tuple:
+        """``(user_id, timestamp)`` of page view ``index``."""
+        block, offset = divmod(index, self.BLOCK)
+        if block != self._block:
+            self._rows = self._visits(block)
+            self._block = block
+        return self._rows[offset]
+    
+    def event(self, index: int, rng: random.Random) -> tuple:
+        """``(user_id, timestamp)`` of user event ``index``, on one of its visit's pages."""
+        user_id, timestamp = self.page_view(index * self.page_views // max(self.events, 1))
+        return user_id, timestamp + timedelta(seconds=rng.randint(0, 60))
+    
+    def _visits(self, block: int) -> List[tuple]:
+        rng = random.Random(f'{self.seed}:visits:{block}')
+        span = int((self.end_date - self.start_date).total_seconds())
+        rows = []
+        while len(rows) < self.BLOCK:
+            pages = 1
+            while pages < self.BLOCK - len(rows) and rng.random() >= 1 / self.mean_pages:
+                pages += 1
+            gaps = [rng.randint(10, 300) for _ in range(pages - 1)]
+            user_id = f'USR{rng.randint(1, self.num_users):06d}'
+            # Visits end 10 minutes before end_date, leaving room for their events
+            timestamp = self.start_date + timedelta(seconds=rng.randrange(max(span - sum(gaps) - 600, 1)))
+            rows.append((user_id, timestamp))
+            for gap in gaps:
+                timestamp += timedelta(seconds=gap)
+                rows.append((user_id, timestamp))
+        return rows
+    
+    def __reduce__(self):
+        return (VisitPlan, (self.seed, self.num_users, self.page_views, self.events,
+                            self.start_date, self.end_date, self.mean_pages))
+
 
 class DataGenerator:
-    def __init__(self):
-        """Initialize the data generator with sample data pools."""
+    def __init__(self, seed: Optional[Any] = None):
+        """Initialize the data generator with sample data pools.
+        
+        All randomness comes from ``self.rng``, so two generators built with
+        the same ``seed`` produce identical rows.
+        """
+        
+        self.rng = random.Random(seed)
         
         # Sample data pools
         self.first_names = [
@@ -86,15 +216,50 @@ class DataGenerator:
         self.device_types = ['desktop', 'mobile', 'tablet']
         self.browsers = ['chrome', 'firefox', 'safari', 'edge', 'opera']
         
+        self.subcategories = {
+            'Electronics': ['Audio', 'Video', 'Computer', 'Mobile', 'Gaming'],
+            'Fashion': ['Clothing', 'Footwear', 'Accessories', 'Jewelry'],
+            'Home': ['Kitchen', 'Furniture', 'Decor', 'Appliances'],
+            'Sports': ['Fitness', 'Outdoor', 'Team Sports', 'Water Sports']
+        }
+        
+        self.street_names = ['Main St', 'Oak Ave', 'Pine Rd', 'First St', 'Second Ave', 'Park Blvd']
+        
+        self.page_urls = [
+            '/home', '/products', '/about', '/contact', '/cart', '/checkout',
+            '/search', '/category/electronics', '/category/fashion', '/category/home',
+            '/product/detail', '/user/profile', '/user/orders', '/blog', '/support'
+        ]
+        
+        self.page_titles = [
+            'Home Page', 'Product Catalog', 'About Us', 'Contact Us',
+            'Shopping Cart', 'Checkout', 'Search Results', 'User Profile',
+            'Order History', 'Product Details', 'Category Page', 'Blog Post'
+        ]
+        
+        self.referrers = [
+            'https://google.com', 'https://facebook.com', 'https://twitter.com',
+            'direct', 'https://linkedin.com', 'https://youtube.com', 'email',
+            'https://bing.com', 'https://reddit.com'
+        ]
+        
+        self.event_types = ['click', 'scroll', 'hover', 'form_fill', 'search', 'download', 'video_play']
+        self.element_types = ['button', 'link', 'input', 'image', 'video']
+        
     def generate_customers(self, num_records: int) -> List[Dict[str, Any]]:
         """Generate customer data."""
-        customers = []
-        
-        for i in range(num_records):
-            first_name = random.choice(self.first_names)
-            last_name = random.choice(self.last_names)
-            country = random.choice(self.countries)
-            city = random.choice(self.cities.get(country, ['Unknown City']))
+        return list(self.iter_customers(num_records))
+    
+    def iter_customers(self, num_records: int, start: int = 0, start_date: datetime = None,
+                       end_date: datetime = None) -> Iterator[Dict[str, Any]]:
+        """Yield customer rows one at a time, registered in ``[start_date, end_date)``."""
+        start_date = start_date or datetime(2020, 1, 1)
+        end_date = end_date or datetime(2024, 12, 31)
+        for i in range(start, start + num_records):
+            first_name = self.rng.choice(self.first_names)
+            last_name = self.rng.choice(self.last_names)
+            country = self.rng.choice(self.countries)
+            city = self.rng.choice(self.cities.get(country, ['Unknown City']))
             
             customer = {
                 'customer_id': f'CUST{i+1:06d}',
@@ -102,263 +267,541 @@ class DataGenerator:
                 'last_name': last_name,
                 'email': f'{first_name.lower()}.{last_name.lower()}@email.com',
                 'phone': self.generate_phone_number(country),
-                'registration_date': self.random_date(datetime(2020, 1, 1), datetime(2024, 12, 31)),
+                'registration_date': self.random_date(start_date, end_date),
                 'country': country,
                 'city': city,
-                'age_group': random.choice(self.age_groups)
+                'age_group': self.rng.choice(self.age_groups)
             }
-            customers.append(customer)
-        
-        return customers
+            yield customer
     
     def generate_products(self, num_records: int) -> List[Dict[str, Any]]:
         """Generate product data."""
-        products = []
-        
-        for i in range(num_records):
-            category = random.choice(self.product_categories)
+        return list(self.iter_products(num_records))
+    
+    def iter_products(self, num_records: int, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """Yield product rows one at a time."""
+        for i in range(start, start + num_records):
+            category = self.rng.choice(self.product_categories)
             product_names = self.product_names.get(category, ['Generic Product'])
-            base_name = random.choice(product_names)
+            base_name = self.rng.choice(product_names)
             
             # Generate realistic pricing
-            base_cost = random.uniform(10, 500)
-            markup = random.uniform(1.5, 3.0)
+            base_cost = self.rng.uniform(10, 500)
+            markup = self.rng.uniform(1.5, 3.0)
             price = round(base_cost * markup, 2)
             
             product = {
                 'product_id': f'PROD{i+1:06d}',
-                'product_name': f'{random.choice(self.brands)} {base_name}',
+                'product_name': f'{self.rng.choice(self.brands)} {base_name}',
                 'category': category,
                 'sub_category': self.generate_subcategory(category),
-                'brand': random.choice(self.brands),
+                'brand': self.rng.choice(self.brands),
                 'price': price,
                 'cost': round(base_cost, 2),
-                'supplier_id': f'SUP{random.randint(1, 20):03d}',
+                'supplier_id': f'SUP{self.rng.randint(1, 20):03d}',
                 'launch_date': self.random_date(datetime(2020, 1, 1), datetime(2024, 6, 30))
             }
-            products.append(product)
-        
-        return products
+            yield product
     
     def generate_orders(self, num_records: int, customer_ids: List[str] = None) -> List[Dict[str, Any]]:
         """Generate order data."""
-        if not customer_ids:
-            customer_ids = [f'CUST{i+1:06d}' for i in range(1000)]
+        return list(self.iter_orders(num_records, customer_ids))
+    
+    def iter_orders(self, num_records: int, customer_ids: Sequence[str] = None,
+                    start: int = 0, skew: Dict[str, KeyDistribution] = None,
+                    start_date: datetime = None, end_date: datetime = None) -> Iterator[Dict[str, Any]]:
+        """Yield order rows one at a time, placed in ``[start_date, end_date)``.
         
-        orders = []
+        ``skew`` maps foreign-key columns to a ``KeyDistribution``; keys not in
+        it are picked uniformly.
+        """
+        start_date = start_date or EVENT_START_DATE
+        end_date = end_date or EVENT_END_DATE
+        if not customer_ids:
+            customer_ids = IdRange('CUST', 1000)
+        pick_customer = self.key_picker(customer_ids, skew, 'customer_id')
         
-        for i in range(num_records):
-            order_date = self.random_date(datetime(2024, 1, 1), datetime(2024, 6, 30))
-            total_amount = round(random.uniform(25, 500), 2)
-            shipping_cost = 0 if total_amount > 100 else round(random.uniform(5, 25), 2)
+        for i in range(start, start + num_records):
+            order_date = self.random_date(start_date, end_date)
+            total_amount = round(self.rng.uniform(25, 500), 2)
+            shipping_cost = 0 if total_amount > 100 else round(self.rng.uniform(5, 25), 2)
             
             order = {
                 'order_id': f'ORD{i+1:06d}',
-                'customer_id': random.choice(customer_ids),
+                'customer_id': pick_customer(),
                 'order_date': order_date,
-                'order_status': random.choice(self.order_statuses),
+                'order_status': self.rng.choice(self.order_statuses),
                 'total_amount': total_amount,
                 'shipping_cost': shipping_cost,
-                'payment_method': random.choice(self.payment_methods),
+                'payment_method': self.rng.choice(self.payment_methods),
                 'shipping_address': self.generate_address()
             }
-            orders.append(order)
-        
-        return orders
+            yield order
     
     def generate_order_items(self, num_records: int, order_ids: List[str] = None, 
                            product_ids: List[str] = None) -> List[Dict[str, Any]]:
         """Generate order items data."""
+        return list(self.iter_order_items(num_records, order_ids, product_ids))
+    
+    def iter_order_items(self, num_records: int, order_ids: Sequence[str] = None,
+                         product_ids: Sequence[str] = None, start: int = 0,
+                         skew: Dict[str, KeyDistribution] = None) -> Iterator[Dict[str, Any]]:
+        """Yield order item rows one at a time."""
         if not order_ids:
-            order_ids = [f'ORD{i+1:06d}' for i in range(10000)]
+            order_ids = IdRange('ORD', 10000)
         if not product_ids:
-            product_ids = [f'PROD{i+1:06d}' for i in range(1000)]
-        
-        order_items = []
+            product_ids = IdRange('PROD', 1000)
+        pick_order = self.key_picker(order_ids, skew, 'order_id')
+        pick_product = self.key_picker(product_ids, skew, 'product_id')
         
-        for i in range(num_records):
-            quantity = random.randint(1, 5)
-            unit_price = round(random.uniform(10, 200), 2)
-            discount_amount = 0 if random.random() > 0.3 else round(unit_price * random.uniform(0.05, 0.25), 2)
+        for i in range(start, start + num_records):
+            quantity = self.rng.randint(1, 5)
+            unit_price = round(self.rng.uniform(10, 200), 2)
+            discount_amount = 0 if self.rng.random() > 0.3 else round(unit_price * self.rng.uniform(0.05, 0.25), 2)
             line_total = round((unit_price * quantity) - discount_amount, 2)
             
             item = {
                 'order_item_id': f'ITEM{i+1:06d}',
-                'order_id': random.choice(order_ids),
-                'product_id': random.choice(product_ids),
+                'order_id': pick_order(),
+                'product_id': pick_product(),
                 'quantity': quantity,
                 'unit_price': unit_price,
                 'discount_amount': discount_amount,
                 'line_total': line_total
             }
-            order_items.append(item)
-        
-        return order_items
+            yield item
     
     def generate_web_sessions(self, num_records: int) -> List[Dict[str, Any]]:
         """Generate web session data."""
-        sessions = []
+        return list(self.iter_web_sessions(num_records))
+    
+    def iter_web_sessions(self, num_records: int, num_users: int = None, start: int = 0,
+                          start_date: datetime = None, end_date: datetime = None) -> Iterator[Dict[str, Any]]:
+        """Yield web session rows one at a time, starting in ``[start_date, end_date)``."""
+        start_date = start_date or EVENT_START_DATE
+        end_date = end_date or EVENT_END_DATE
+        if not num_users:
+            num_users = num_records // 10
         
-        for i in range(num_records):
-            session_start = self.random_date(datetime(2024, 1, 1), datetime(2024, 6, 30))
-            duration = random.randint(30, 3600)  # 30 seconds to 1 hour
+        for i in range(start, start + num_records):
+            session_start = self.random_date(start_date, end_date)
+            duration = self.rng.randint(30, 3600)  # 30 seconds to 1 hour
             session_end = session_start + timedelta(seconds=duration)
-            page_views = random.randint(1, 25)
+            page_views = self.rng.randint(1, 25)
             
             session = {
                 'session_id': f'SES{i+1:06d}',
-                'user_id': f'USR{random.randint(1, num_records//10):06d}',
+                'user_id': f'USR{self.rng.randint(1, num_users):06d}',
                 'session_start': session_start,
                 'session_end': session_end,
                 'page_views': page_views,
                 'session_duration_seconds': duration,
-                'traffic_source': random.choice(self.traffic_sources),
-                'device_type': random.choice(self.device_types),
-                'browser': random.choice(self.browsers),
-                'country': random.choice(self.countries)
+                'traffic_source': self.rng.choice(self.traffic_sources),
+                'device_type': self.rng.choice(self.device_types),
+                'browser': self.rng.choice(self.browsers),
+                'country': self.rng.choice(self.countries)
             }
-            sessions.append(session)
-        
-        return sessions
+            yield session
     
     def generate_page_views(self, num_records: int, session_ids: List[str] = None) -> List[Dict[str, Any]]:
         """Generate page view data."""
-        if not session_ids:
-            session_ids = [f'SES{i+1:06d}' for i in range(10000)]
-        
-        page_urls = [
-            '/home', '/products', '/about', '/contact', '/cart', '/checkout',
-            '/search', '/category/electronics', '/category/fashion', '/category/home',
-            '/product/detail', '/user/profile', '/user/orders', '/blog', '/support'
-        ]
+        return list(self.iter_page_views(num_records, session_ids))
+    
+    def iter_page_views(self, num_records: int, session_ids: Sequence[str] = None,
+                        start: int = 0, skew: Dict[str, KeyDistribution] = None,
+                        start_date: datetime = None, end_date: datetime = None,
+                        num_users: int = None, visits: VisitPlan = None) -> Iterator[Dict[str, Any]]:
+        """Yield page view rows one at a time, viewed in ``[start_date, end_date)``.
         
-        page_views = []
+        With ``visits``, users and timestamps come from that plan instead.
+        """
+        start_date = start_date or EVENT_START_DATE
+        end_date = end_date or EVENT_END_DATE
+        if not session_ids:
+            session_ids = IdRange('SES', 10000)
+        pick_session = self.key_picker(session_ids, skew, 'session_id')
+        num_users = num_users or 10000
         
-        for i in range(num_records):
-            timestamp = self.random_date(datetime(2024, 1, 1), datetime(2024, 6, 30))
-            time_on_page = random.randint(5, 600)  # 5 seconds to 10 minutes
+        for i in range(start, start + num_records):
+            if visits:
+                user_id, timestamp = visits.page_view(i)
+            else:
+                timestamp = self.random_date(start_date, end_date)
+                user_id = f'USR{self.rng.randint(1, num_users):06d}'
+            time_on_page = self.rng.randint(5, 600)  # 5 seconds to 10 minutes
             
             page_view = {
                 'page_view_id': f'PV{i+1:06d}',
-                'session_id': random.choice(session_ids),
-                'user_id': f'USR{random.randint(1, 10000):06d}',
-                'page_url': random.choice(page_urls),
+                'session_id': pick_session(),
+                'user_id': user_id,
+                'page_url': self.rng.choice(self.page_urls),
                 'page_title': self.generate_page_title(),
                 'timestamp': timestamp,
                 'time_on_page_seconds': time_on_page,
                 'referrer_url': self.generate_referrer(),
-                'exit_page': random.choice([True, False])
+                'exit_page': self.rng.choice([True, False])
             }
-            page_views.append(page_view)
-        
-        return page_views
+            yield page_view
     
     def generate_user_events(self, num_records: int, session_ids: List[str] = None) -> List[Dict[str, Any]]:
         """Generate user event data."""
-        if not session_ids:
-            session_ids = [f'SES{i+1:06d}' for i in range(10000)]
-        
-        event_types = ['click', 'scroll', 'hover', 'form_fill', 'search', 'download', 'video_play']
+        return list(self.iter_user_events(num_records, session_ids))
+    
+    def iter_user_events(self, num_records: int, session_ids: Sequence[str] = None,
+                         start: int = 0, skew: Dict[str, KeyDistribution] = None,
+                         start_date: datetime = None, end_date: datetime = None,
+                         num_users: int = None, visits: VisitPlan = None) -> Iterator[Dict[str, Any]]:
+        """Yield user event rows one at a time, fired in ``[start_date, end_date)``.
         
-        events = []
+        With ``visits``, users and timestamps come from that plan instead.
+        """
+        start_date = start_date or EVENT_START_DATE
+        end_date = end_date or EVENT_END_DATE
+        if not session_ids:
+            session_ids = IdRange('SES', 10000)
+        pick_session = self.key_picker(session_ids, skew, 'session_id')
+        num_users = num_users or 10000
         
-        for i in range(num_records):
+        for i in range(start, start + num_records):
+            if visits:
+                user_id, timestamp = visits.event(i, self.rng)
+            else:
+                user_id = f'USR{self.rng.randint(1, num_users):06d}'
+                timestamp = self.random_date(start_date, end_date)
             event = {
                 'event_id': f'EVT{i+1:06d}',
-                'session_id': random.choice(session_ids),
-                'user_id': f'USR{random.randint(1, 10000):06d}',
-                'event_type': random.choice(event_types),
-                'event_timestamp': self.random_date(datetime(2024, 1, 1), datetime(2024, 6, 30)),
-                'page_url': f'/page_{random.randint(1, 100)}',
-                'element_id': f'element_{random.randint(1, 1000)}',
-                'element_type': random.choice(['button', 'link', 'input', 'image', 'video']),
-                'event_data': f'data_{random.randint(1, 10000)}'
+                'session_id': pick_session(),
+                'user_id': user_id,
+                'event_type': self.rng.choice(self.event_types),
+                'event_timestamp': timestamp,
+                'page_url': f'/page_{self.rng.randint(1, 100)}',
+                'element_id': f'element_{self.rng.randint(1, 1000)}',
+                'element_type': self.rng.choice(self.element_types),
+                'event_data': f'data_{self.rng.randint(1, 10000)}'
             }
-            events.append(event)
+            yield event
+    
+    def key_picker(self, keys: Sequence[str], skew: Optional[Dict[str, KeyDistribution]],
+                   column: str) -> Callable[[], str]:
+        """Return a function picking one of ``keys`` per call.
         
-        return events
+        Uniform (``rng.choice``) unless ``skew`` has a distribution for ``column``.
+        """
+        distribution = (skew or {}).get(column)
+        if distribution is None:
+            return functools.partial(self.rng.choice, keys)
+        draw = distribution.sampler(len(keys), self.rng)
+        return lambda: keys[draw()]
     
     def generate_phone_number(self, country: str) -> str:
         """Generate a realistic phone number based on country."""
         if country == 'USA':
-            return f'+1-{random.randint(200, 999)}-{random.randint(200, 999)}-{random.randint(1000, 9999)}'
+            return f'+1-{self.rng.randint(200, 999)}-{self.rng.randint(200, 999)}-{self.rng.randint(1000, 9999)}'
         elif country == 'UK':
-            return f'+44-20-{random.randint(1000, 9999)}-{random.randint(1000, 9999)}'
+            return f'+44-20-{self.rng.randint(1000, 9999)}-{self.rng.randint(1000, 9999)}'
         elif country == 'Germany':
-            return f'+49-30-{random.randint(100, 999)}-{random.randint(1000, 9999)}'
+            return f'+49-30-{self.rng.randint(100, 999)}-{self.rng.randint(1000, 9999)}'
         else:
-            return f'+{random.randint(1, 999)}-{random.randint(100, 999)}-{random.randint(1000, 9999)}'
+            return f'+{self.rng.randint(1, 999)}-{self.rng.randint(100, 999)}-{self.rng.randint(1000, 9999)}'
     
     def generate_address(self) -> str:
         """Generate a random address."""
-        street_num = random.randint(1, 9999)
-        street_names = ['Main St', 'Oak Ave', 'Pine Rd', 'First St', 'Second Ave', 'Park Blvd']
-        street = random.choice(street_names)
+        street_num = self.rng.randint(1, 9999)
+        street = self.rng.choice(self.street_names)
         return f'{street_num} {street}'
     
     def generate_subcategory(self, category: str) -> str:
         """Generate subcategory based on main category."""
-        subcategories = {
-            'Electronics': ['Audio', 'Video', 'Computer', 'Mobile', 'Gaming'],
-            'Fashion': ['Clothing', 'Footwear', 'Accessories', 'Jewelry'],
-            'Home': ['Kitchen', 'Furniture', 'Decor', 'Appliances'],
-            'Sports': ['Fitness', 'Outdoor', 'Team Sports', 'Water Sports']
-        }
-        return random.choice(subcategories.get(category, ['General']))
+        return self.rng.choice(self.subcategories.get(category, ['General']))
     
     def generate_page_title(self) -> str:
         """Generate realistic page titles."""
-        titles = [
-            'Home Page', 'Product Catalog', 'About Us', 'Contact Us',
-            'Shopping Cart', 'Checkout', 'Search Results', 'User Profile',
-            'Order History', 'Product Details', 'Category Page', 'Blog Post'
-        ]
-        return random.choice(titles)
+        return self.rng.choice(self.page_titles)
     
     def generate_referrer(self) -> str:
         """Generate realistic referrer URLs."""
-        referrers = [
-            'https://google.com', 'https://facebook.com', 'https://twitter.com',
-            'direct', 'https://linkedin.com', 'https://youtube.com', 'email',
-            'https://bing.com', 'https://reddit.com'
-        ]
-        return random.choice(referrers)
+        return self.rng.choice(self.referrers)
     
     def random_date(self, start_date: datetime, end_date: datetime) -> datetime:
         """Generate a random date between start_date and end_date."""
         time_between = end_date - start_date
         days_between = time_between.days
-        random_days = random.randrange(days_between)
-        random_seconds = random.randrange(24 * 60 * 60)  # Random time within the day
+        random_days = self.rng.randrange(days_between)
+        random_seconds = self.rng.randrange(24 * 60 * 60)  # Random time within the day
         return start_date + timedelta(days=random_days, seconds=random_seconds)
     
-    def save_to_csv(self, data: List[Dict[str, Any]], filename: str):
-        """Save data to CSV file."""
-        if not data:
-            print(f"No data to save for {filename}")
-            return
+    def save_to_csv(self, data: Iterable[Dict[str, Any]], filename: str,
+                    chunk_size: int = 10000) -> int:
+        """Save data to CSV file.
         
+        ``data`` may be a list or any iterator of row dicts (e.g. one of the
+        ``iter_*`` producers). Rows are formatted and written ``chunk_size`` at
+        a time, so memory use does not grow with the number of records.
+        Returns the number of rows written.
+        """
         # Ensure data directory exists
         os.makedirs('generated_data', exist_ok=True)
         
         filepath = os.path.join('generated_data', f'{filename}.csv')
+        started = time.perf_counter()
+        row_count = self.write_csv(data, filepath, chunk_size)
         
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = data[0].keys()
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for row in data:
-                # Format datetime objects
-                formatted_row = {}
-                for key, value in row.items():
-                    if isinstance(value, datetime):
-                        formatted_row[key] = value.strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        formatted_row[key] = value
-                writer.writerow(formatted_row)
+        if row_count:
+            print(f"Generated {row_count} records and saved to {filepath} "
+                  f"({throughput(row_count, output_size(filepath), time.perf_counter() - started)})")
+        else:
+            print(f"No data to save for {filename}")
+        return row_count
+    
+    def write_csv(self, data: Iterable[Dict[str, Any]], filepath: str,
+                  chunk_size: int = 10000, header: bool = True) -> int:
+        """Stream rows into ``filepath``; returns the number of rows written.
         
-        print(f"Generated {len(data)} records and saved to {filepath}")
+        Columns are taken from the first row, and those holding datetimes are
+        formatted as ``YYYY-MM-DD HH:MM:SS``.
+        """
+        rows = iter(data)
+        first_row = next(rows, None)
+        if first_row is None:
+            return 0
+        
+        schema = TableSchema(os.path.basename(filepath), [
+            (key, 'DATETIME' if isinstance(value, datetime) else 'STRING')
+            for key, value in first_row.items()])
+        path, extension = os.path.splitext(filepath)
+        if extension != '.csv':
+            path = filepath
+        with CsvWriter(path, schema, header=header) as writer:
+            return self._write_tuples(itertools.chain([first_row], rows), schema, writer,
+                                      chunk_size)
+    
+    def save(self, table: str, data: Iterable[Dict[str, Any]], name: str,
+             chunk_size: int = 10000, ds_index: Sequence[int] = None,
+             ds_record: array = None, **output) -> int:
+        """Save rows of ``table`` in any output format (see ``open_table_writer``).
+        
+        Columns are typed from the table's DDL. ``ds_index``/``ds_record`` carry
+        order partitions over to order_items when partitioning by ds.
+        """
+        started = time.perf_counter()
+        writer = open_table_writer(table, name, ds_index=ds_index, ds_record=ds_record, **output)
+        with writer:
+            row_count = self.write_rows(table, data, writer, chunk_size)
+        
+        if row_count:
+            print(f"Generated {row_count} records and saved to {writer.path} "
+                  f"({throughput(row_count, output_size(writer.path), time.perf_counter() - started)})")
+        else:
+            print(f"No data to save for {name}")
+        return row_count
+    
+    def write_rows(self, table: str, data: Iterable[Dict[str, Any]], writer,
+                   chunk_size: int = 10000) -> int:
+        """Stream row dicts into an ``output_writers`` writer in DDL column order."""
+        return self._write_tuples(data, get_schema(table), writer, chunk_size)
+    
+    def _write_tuples(self, data: Iterable[Dict[str, Any]], schema: TableSchema, writer,
+                      chunk_size: int) -> int:
+        """Write row dicts as tuples in ``schema`` column order, a chunk at a time."""
+        to_tuple = operator.itemgetter(*schema.column_names)
+        row_count = 0
+        for chunk in self._chunked(data, chunk_size):
+            writer.write_rows(list(map(to_tuple, chunk)))
+            row_count += len(chunk)
+        return row_count
+    
+    @staticmethod
+    def _chunked(rows: Iterable[Dict[str, Any]], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Group a row stream into lists of at most ``chunk_size`` rows."""
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+    
+    @staticmethod
+    def collect_ids(rows: Iterable[Dict[str, Any]], key: str, ids: List[str]) -> Iterator[Dict[str, Any]]:
+        """Pass rows through unchanged while appending ``row[key]`` to ``ids``.
+        
+        Lets the ``all`` path keep just the key column a dependent table needs
+        instead of holding on to every generated row.
+        """
+        for row in rows:
+            ids.append(row[key])
+            yield row
+
+
+def open_table_writer(table: str, name: str, fmt: str = 'csv', compression: str = None,
+                      partition: bool = False, output_dir: str = 'generated_data',
+                      part: int = None, header: bool = True, ds_index: Sequence[int] = None,
+                      ds_record: array = None):
+    """Open the writer for one table's output.
+    
+    Output goes to ``<output_dir>/<name>.<ext>``, or ``<output_dir>/<name>/part-NNNNN.<ext>``
+    for shard ``part``. With ``partition``, tables the DDL partitions by ds are
+    split into ``<output_dir>/<name>/ds=YYYYMMDD/part-NNNNN.<ext>``.
+    """
+    schema = get_schema(table)
+    if partition and schema.partitioned:
+        return PartitionedWriter(os.path.join(output_dir, name), f'part-{part or 0:05d}', schema,
+                                 partition_function(table, schema, ds_index), fmt, compression,
+                                 header, ds_record)
+    
+    path = os.path.join(output_dir, name)
+    if part is not None:
+        path = os.path.join(path, f'part-{part:05d}')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return open_writer(fmt, path, schema, compression, header)
+
+
+def shard_seed(seed: int, table: str, shard_index: int) -> str:
+    """Derive the RNG seed for one shard of a table.
+    
+    String seeds are hashed with SHA-512 by ``random.Random``, so the result
+    is stable across processes and independent of the worker count.
+    """
+    return f'{seed}:{table}:{shard_index}'
+
+
+def _generate_shard(task: Dict[str, Any]) -> int:
+    """Process-pool entry point: generate one ID range of a table to its output."""
+    table, shard_index = task['table'], task['shard_index']
+    ds_record = array('I') if task['ds_record_path'] else None
+    writer = open_table_writer(table, task['name'], part=task['part'], header=task['header'],
+                               ds_index=task['ds_index'], ds_record=ds_record, **task['output'])
+    
+    with writer:
+        if task['engine'] == 'numpy':
+            from columnar_generator import ColumnarGenerator
+            generator = ColumnarGenerator(seed=shard_seed(task['seed'], table, shard_index))
+            row_count = generator.write_table(table, task['count'], writer, task['chunk_size'],
+                                              start=task['start'], **task['kwargs'])
+        else:
+            generator = DataGenerator(seed=shard_seed(task['seed'], table, shard_index))
+            rows = getattr(generator, f'iter_{table}')(task['count'], start=task['start'],
+                                                       **task['kwargs'])
+            row_count = generator.write_rows(table, rows, writer, task['chunk_size'])
+    
+    if ds_record is not None:
+        DsIndex.write(task['ds_record_path'], ds_record)
+    return row_count
+
+
+def generate_sharded(table: str, num_records: int, output_name: str, seed: int,
+                     workers: int = 1, shard_size: int = 100000, merge: bool = True,
+                     chunk_size: int = 10000, engine: str = 'python',
+                     output: Dict[str, Any] = None, ds_index: Sequence[int] = None,
+                     ds_index_path: str = None, first_id: int = 0, **kwargs) -> int:
+    """Generate ``table`` as fixed-size ID-range shards across a process pool.
+    
+    Shard boundaries depend only on ``shard_size`` and every shard gets its own
+    seeded RNG, so the output is byte-identical for a given ``seed`` whatever
+    ``workers`` is. Shards are written as ``<output_dir>/<output_name>/part-NNNNN.<ext>``
+    and, when ``merge`` is set, CSV parts (plain or compressed) are concatenated
+    in order into ``<output_dir>/<output_name>.<ext>``. Parquet/ORC parts and
+    ds partitions are kept as files. ``output`` holds the ``open_table_writer``
+    format options. ``engine='numpy'`` generates each shard column-at-a-time
+    with ``columnar_generator.ColumnarGenerator``.
+    
+    ``ds_index_path`` records the ds of every row (orders) into a ``DsIndex``
+    file; ``ds_index`` is that index, passed to order_items. IDs start after
+    ``first_id``.
+    """
+    started = time.perf_counter()
+    output = dict(output or {})
+    output_dir = output.setdefault('output_dir', 'generated_data')
+    fmt, compression = output.get('fmt', 'csv'), output.get('compression')
+    extension = file_extension(fmt, compression)
+    partitioned = output.get('partition', False) and get_schema(table).partitioned
+    merged_path = os.path.join(output_dir, output_name + extension)
+    parts_dir = os.path.join(output_dir, output_name)
+    
+    # A table that fits in one shard is written straight to its merged path
+    direct = merge and not partitioned and num_records <= shard_size
+    concatenate = merge and not partitioned and not direct and fmt == 'csv'
+    
+    tasks = []
+    for shard_index, start in enumerate(range(0, num_records, shard_size)):
+        tasks.append(dict(
+            table=table, seed=seed, shard_index=shard_index, start=first_id + start,
+            count=min(shard_size, num_records - start), kwargs=kwargs, engine=engine,
+            chunk_size=chunk_size, name=output_name, output=output,
+            part=None if direct else shard_index, header=not concatenate,
+            ds_index=ds_index,
+            ds_record_path=ds_index_path and f'{ds_index_path}.{shard_index:05d}'))
+    
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            row_count = sum(pool.map(_generate_shard, tasks))
+    else:
+        row_count = sum(_generate_shard(task) for task in tasks)
+    
+    if ds_index_path:
+        with open(ds_index_path, 'wb') as index_file:
+            for task in tasks:
+                with open(task['ds_record_path'], 'rb') as part:
+                    shutil.copyfileobj(part, index_file)
+                os.remove(task['ds_record_path'])
+    
+    if direct:
+        filepath = merged_path
+    elif concatenate:
+        filepath = merged_path
+        # Header as its own file (or gzip member / zstd frame), then the
+        # headerless parts appended byte for byte
+        open_writer(fmt, os.path.join(output_dir, output_name), get_schema(table),
+                    compression).close()
+        with open(filepath, 'ab') as merged:
+            for task in tasks:
+                part_path = os.path.join(parts_dir, f'part-{task["part"]:05d}{extension}')
+                with open(part_path, 'rb') as part:
+                    shutil.copyfileobj(part, merged, 1024 * 1024)
+        shutil.rmtree(parts_dir)
+    else:
+        filepath = parts_dir
+    
+    print(f"Generated {row_count} records in {len(tasks)} shard(s) and saved to {filepath} "
+          f"({throughput(row_count, output_size(filepath), time.perf_counter() - started)})")
+    return row_count
+
+
+def generate_all_sharded(records: int, seed: int, skew: Dict[str, KeyDistribution] = None,
+                         dates: Dict[str, datetime] = None, visits: VisitPlan = None, **options):
+    """Sharded counterpart of ``--table all``.
+    
+    Parent keys are sequential, so dependent tables reference them through
+    ``IdRange`` instead of collecting the generated IDs. When partitioning by
+    ds, the orders pass leaves a ``DsIndex`` behind for order_items. ``skew``
+    applies to the foreign keys of orders, order_items, page_views and
+    user_events, and ``dates`` (``start_date``/``end_date``) to the event tables.
+    ``visits`` clusters page views and user events into visits (``VisitPlan``).
+    """
+    dates = dates or {}
+    output = options.get('output') or {}
+    ds_index_path = None
+    if output.get('partition'):
+        ds_index_path = os.path.join(output.get('output_dir', 'generated_data'), '.orders_ds.idx')
+    
+    generate_sharded('customers', records, 'customers_generated', seed, **options)
+    generate_sharded('products', records, 'products_generated', seed, **options)
+    generate_sharded('orders', records * 2, 'orders_generated', seed,
+                     customer_ids=IdRange('CUST', records), ds_index_path=ds_index_path,
+                     skew=skew, **dates, **options)
+    generate_sharded('order_items', records * 3, 'order_items_generated', seed,
+                     order_ids=IdRange('ORD', records * 2),
+                     product_ids=IdRange('PROD', records),
+                     ds_index=ds_index_path and DsIndex(ds_index_path), skew=skew, **options)
+    if ds_index_path:
+        os.remove(ds_index_path)
+    generate_sharded('web_sessions', records, 'web_sessions_generated', seed,
+                     num_users=records // 10, **dates, **options)
+    generate_sharded('page_views', records * 5, 'page_views_generated', seed,
+                     session_ids=IdRange('SES', records), skew=skew, visits=visits,
+                     **dates, **options)
+    generate_sharded('user_events', records * 3, 'user_events_generated', seed,
+                     session_ids=IdRange('SES', records), skew=skew, visits=visits,
+                     **dates, **options)
 
 
 def main():
@@ -368,66 +811,199 @@ def main():
                        required=True, help='Table to generate data for')
     parser.add_argument('--records', type=int, default=1000, help='Number of records to generate')
     parser.add_argument('--output', help='Output filename (without extension)')
-    parser.add_argument('--start-date', help='Start date for date ranges (YYYY-MM-DD)')
-    parser.add_argument('--end-date', help='End date for date ranges (YYYY-MM-DD)')
+    parser.add_argument('--start-date', help='First date of orders, sessions, page views and user '
+                                             'events (YYYY-MM-DD); first ds with --daily')
+    parser.add_argument('--end-date', help='Last date (inclusive) of orders, sessions, page views '
+                                           'and user events (YYYY-MM-DD); last ds with --daily')
+    parser.add_argument('--chunk-size', type=int,
+                       help='Rows formatted and written per batch, bounding peak memory '
+                            '(default: 10000, or 100000 with --engine numpy)')
+    parser.add_argument('--seed', type=int, help='Seed for reproducible output')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Generate tables as ID-range shards across N processes')
+    parser.add_argument('--shard-size', type=int, default=100000,
+                       help='Records per shard when generating with --seed/--workers')
+    parser.add_argument('--parts', action='store_true',
+                       help='Keep shards as part-NNNNN.csv files instead of merging them')
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python',
+                       help='Row-at-a-time Python engine or column-at-a-time NumPy engine')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'orc'], default='csv',
+                       help='Output file format, typed from sql/01_create_tables.sql')
+    parser.add_argument('--compression', choices=['gzip', 'zstd', 'snappy'],
+                       help='Output compression (CSV: gzip or zstd; Parquet default: snappy; '
+                            'ORC default: zstd)')
+    parser.add_argument('--partition-by-ds', action='store_true',
+                       help='Split tables partitioned by ds into ds=YYYYMMDD directories')
+    parser.add_argument('--output-dir', default='generated_data',
+                       help='Directory for generated files (default: generated_data)')
+    parser.add_argument('--skew', action='append', default=[], metavar='COLUMN=DISTRIBUTION',
+                       help='Skew a foreign key (customer_id, order_id, product_id, session_id): '
+                            'zipf:S, power:A or hot:K:SHARE (first K keys get SHARE of the rows). '
+                            'Repeatable')
+    parser.add_argument('--daily', action='store_true',
+                       help='Generate one delta per ds from --start-date to --end-date, resuming '
+                            'from the ID high-water marks in --state (use with --table all)')
+    parser.add_argument('--state',
+                       help='State file of --daily runs (default: <output-dir>/generator_state.json)')
+    parser.add_argument('--update-rate', type=float, default=0.01,
+                       help='Share of existing customers updated per day with --daily (default: 0.01)')
+    parser.add_argument('--delete-rate', type=float, default=0.001,
+                       help='Share of existing customers deleted per day with --daily (default: 0.001)')
+    parser.add_argument('--sessionize', type=float, metavar='GAP_MINUTES',
+                       help='Generate page views and user events as per-user visits and derive '
+                            'web_sessions from them, closing sessions after GAP_MINUTES of '
+                            'inactivity (use with --table all)')
     
     args = parser.parse_args()
+    if args.partition_by_ds and args.table == 'order_items':
+        parser.error('order_items take the ds of their orders; use --table all with --partition-by-ds')
+    try:
+        skew = parse_skew(args.skew)
+    except ValueError as error:
+        parser.error(str(error))
+    if skew and args.table in ('customers', 'products', 'web_sessions'):
+        parser.error(f'{args.table} has no foreign keys to skew')
+    try:
+        start_date = args.start_date and datetime.strptime(args.start_date, '%Y-%m-%d')
+        end_date = args.end_date and datetime.strptime(args.end_date, '%Y-%m-%d')
+    except ValueError as error:
+        parser.error(f'Invalid date: {error}')
+    if args.chunk_size is None:
+        args.chunk_size = 100000 if args.engine == 'numpy' else 10000
+    if args.sessionize is not None:
+        if args.table != 'all' or args.daily:
+            parser.error('--sessionize needs every event table; use --table all without --daily')
+        if args.format != 'csv' or args.compression:
+            parser.error('--sessionize rewrites plain CSV output')
+        if args.sessionize <= 0:
+            parser.error('--sessionize must be a positive number of minutes')
+    if args.compression == 'snappy' and args.format == 'csv':
+        parser.error('--compression snappy needs --format parquet or orc')
+    output = dict(fmt=args.format, compression=args.compression,
+                  partition=args.partition_by_ds, output_dir=args.output_dir)
+    
+    if args.daily:
+        if args.table != 'all':
+            parser.error('--daily generates every table; use --table all')
+        if not 0 <= args.update_rate + args.delete_rate <= 1:
+            parser.error('--update-rate and --delete-rate must be between 0 and 1 together')
+        from incremental import generate_daily
+        # Every file of a day is already one ds partition
+        output.pop('partition')
+        options = dict(workers=args.workers, shard_size=args.shard_size,
+                       chunk_size=args.chunk_size, engine=args.engine, output=output)
+        state_path = args.state or os.path.join(args.output_dir, 'generator_state.json')
+        try:
+            generate_daily(args.records, state_path, start_date, end_date, seed=args.seed,
+                           update_rate=args.update_rate, delete_rate=args.delete_rate,
+                           skew=skew, **options)
+        except ValueError as error:
+            parser.error(str(error))
+        return
+    
+    # Event dates: --end-date is inclusive, the generators' end date is not
+    dates = {}
+    if start_date:
+        dates['start_date'] = start_date
+    if end_date:
+        dates['end_date'] = end_date + timedelta(days=1)
+    if dates.get('start_date', EVENT_START_DATE) >= dates.get('end_date', EVENT_END_DATE):
+        parser.error('--start-date must not be after --end-date')
+    table_kwargs = {}
+    if args.table in ('orders', 'web_sessions', 'page_views', 'user_events'):
+        table_kwargs.update(dates)
+    if skew:
+        table_kwargs['skew'] = skew
+    # Sessionized activity comes as visits of the web_sessions users: a few
+    # page views and events within minutes, instead of uniformly random times
+    visit_plan = args.sessionize and functools.partial(
+        VisitPlan, num_users=max(1, args.records // 10), page_views=args.records * 5,
+        events=args.records * 3, **dates)
     
     generator = DataGenerator()
     
-    if args.table == 'all':
+    if args.seed is not None or args.workers > 1 or args.engine != 'python':
+        # Sharded generation: deterministic per --seed regardless of --workers
+        seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+        print(f"Using seed {seed} with {args.workers} worker(s)")
+        options = dict(workers=args.workers, shard_size=args.shard_size,
+                       merge=not args.parts, chunk_size=args.chunk_size,
+                       engine=args.engine, output=output)
+        
+        if args.table == 'all':
+            print("Generating all tables...")
+            generate_all_sharded(args.records, seed, skew=skew, dates=dates,
+                                 visits=visit_plan and visit_plan(seed), **options)
+        else:
+            output_name = args.output or f'{args.table}_generated'
+            generate_sharded(args.table, args.records, output_name, seed, **table_kwargs, **options)
+    
+    elif args.table == 'all':
         # Generate all tables
         print("Generating all tables...")
         
-        # Generate in dependency order
-        customers = generator.generate_customers(args.records)
-        generator.save_to_csv(customers, 'customers_generated')
+        # Generate in dependency order, streaming rows straight to disk and
+        # keeping only the key columns later tables reference
+        customer_ids, product_ids, order_ids, session_ids = [], [], [], []
+        visits = visit_plan and visit_plan(generator.rng.randrange(2 ** 32))
+        # ds of every order, so order_items can follow their order's partition
+        order_ds = array('I') if args.partition_by_ds else None
         
-        products = generator.generate_products(args.records)
-        generator.save_to_csv(products, 'products_generated')
+        generator.save('customers',
+            generator.collect_ids(generator.iter_customers(args.records), 'customer_id', customer_ids),
+            'customers_generated', args.chunk_size, **output)
         
-        customer_ids = [c['customer_id'] for c in customers]
-        orders = generator.generate_orders(args.records * 2, customer_ids)
-        generator.save_to_csv(orders, 'orders_generated')
+        generator.save('products',
+            generator.collect_ids(generator.iter_products(args.records), 'product_id', product_ids),
+            'products_generated', args.chunk_size, **output)
         
-        order_ids = [o['order_id'] for o in orders]
-        product_ids = [p['product_id'] for p in products]
-        order_items = generator.generate_order_items(args.records * 3, order_ids, product_ids)
-        generator.save_to_csv(order_items, 'order_items_generated')
+        generator.save('orders',
+            generator.collect_ids(generator.iter_orders(args.records * 2, customer_ids, skew=skew, **dates), 'order_id', order_ids),
+            'orders_generated', args.chunk_size, ds_record=order_ds, **output)
+        del customer_ids
         
-        web_sessions = generator.generate_web_sessions(args.records)
-        generator.save_to_csv(web_sessions, 'web_sessions_generated')
+        generator.save('order_items',
+            generator.iter_order_items(args.records * 3, order_ids, product_ids, skew=skew),
+            'order_items_generated', args.chunk_size, ds_index=order_ds, **output)
+        del order_ids, product_ids, order_ds
         
-        session_ids = [s['session_id'] for s in web_sessions]
-        page_views = generator.generate_page_views(args.records * 5, session_ids)
-        generator.save_to_csv(page_views, 'page_views_generated')
+        generator.save('web_sessions',
+            generator.collect_ids(generator.iter_web_sessions(args.records, **dates), 'session_id', session_ids),
+            'web_sessions_generated', args.chunk_size, **output)
         
-        user_events = generator.generate_user_events(args.records * 3, session_ids)
-        generator.save_to_csv(user_events, 'user_events_generated')
+        generator.save('page_views',
+            generator.iter_page_views(args.records * 5, session_ids, skew=skew,
+                                      visits=visits, **dates),
+            'page_views_generated', args.chunk_size, **output)
+        
+        generator.save('user_events',
+            generator.iter_user_events(args.records * 3, session_ids, skew=skew,
+                                       visits=visits, **dates),
+            'user_events_generated', args.chunk_size, **output)
         
     else:
         # Generate specific table
         output_name = args.output or f'{args.table}_generated'
         
-        if args.table == 'customers':
-            data = generator.generate_customers(args.records)
-        elif args.table == 'products':
-            data = generator.generate_products(args.records)
-        elif args.table == 'orders':
-            data = generator.generate_orders(args.records)
-        elif args.table == 'order_items':
-            data = generator.generate_order_items(args.records)
-        elif args.table == 'web_sessions':
-            data = generator.generate_web_sessions(args.records)
-        elif args.table == 'page_views':
-            data = generator.generate_page_views(args.records)
-        elif args.table == 'user_events':
-            data = generator.generate_user_events(args.records)
+        data = getattr(generator, f'iter_{args.table}')(args.records, **table_kwargs)
         
-        generator.save_to_csv(data, output_name)
+        generator.save(args.table, data, output_name, args.chunk_size, **output)
+    
+    if args.sessionize:
+        from sessionizer import implausible_sessions, sessionize
+        # Users missing from the generated sessions borrow device, browser and country
+        stats = sessionize(args.output_dir, args.output_dir, timedelta(minutes=args.sessionize),
+                           fill_attributes=True)
+        problems = implausible_sessions(stats)
+        if problems:
+            print(f"Error: implausible sessions: {'; '.join(problems)}", file=sys.stderr)
+            sys.exit(1)
 
 
 if __name__ == '__main__':
+    # Let columnar_generator (and pickled shard tasks) share this module's
+    # classes instead of importing a second copy of the script
+    sys.modules.setdefault('data_generator', sys.modules[__name__])
     main()
 
 """
@@ -442,8 +1018,35 @@ python data_generator.py --table orders --records 50000
 # Generate all tables with 5,000 records each
 python data_generator.py --table all --records 5000
 
+# Generate 100M page views on 8 cores; output is identical for any --workers
+python data_generator.py --table page_views --records 100000000 --seed 42 --workers 8
+
+# Same, column-at-a-time with NumPy (pip install numpy)
+python data_generator.py --table all --records 5000000 --engine numpy --seed 42 --workers 8
+
+# Keep the shards as part files (generated_data/orders_generated/part-NNNNN.csv)
+python data_generator.py --table orders --records 10000000 --seed 42 --workers 8 --parts
+
+# Parquet typed from the DDL, fact tables split into ds=YYYYMMDD partitions (pip install pyarrow)
+python data_generator.py --table all --records 100000 --format parquet --partition-by-ds
+
+# zstd-compressed CSV into another directory (pip install zstandard)
+python data_generator.py --table orders --records 1000000 --compression zstd --output-dir /data/upload
+
+# Zipf-skewed customers and 10 products in half of all order items, for skew benchmarks
+python data_generator.py --table all --records 100000 --skew customer_id=zipf:1.1 --skew product_id=hot:10:0.5
+
 # Generate web sessions for specific date range
 python data_generator.py --table web_sessions --records 100000 --start-date 2024-01-01 --end-date 2024-06-30
 
-The generated files will be saved in the 'generated_data' directory.
+# Daily deltas for the first week of July into generated_data/<table>_generated/ds=YYYYMMDD/
+python data_generator.py --table all --records 10000 --daily --seed 42 --start-date 2024-07-01 --end-date 2024-07-07
+
+# Next day, continuing from the ID high-water marks in generated_data/generator_state.json
+python data_generator.py --table all --records 10000 --daily
+
+# Sessions derived from the page views and user events (30-minute inactivity gap)
+python data_generator.py --table all --records 5000 --sessionize 30
+
+The generated files will be saved in the 'generated_data' directory (or --output-dir).
 """
\ No newline at end of file
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Single-pass sketch profiler that populates data_profile
+
+Streams each table's files once and keeps a profile of every column with
+mergeable sketches (sketches.py) instead of one exact query per column as in
+sql/06_data_quality.sql section 2:
+
+    total_records, null_count, null_percentage   exact
+    min_value, max_value                          exact
+    avg_value, std_dev                            exact (Welford), population std_dev as STDDEV
+    distinct_count                                HyperLogLog: relative standard error
+                                                  1.04/sqrt(2^precision), 0.81% at precision 14
+    p25/p50/p75 (report and partials only)        KLL: rank error under 1.7% at k=200 (99%)
+
+Each file is profiled on its own and the profiles are merged, so files can be
+spread over --workers processes. Profiles can also be saved as partials
+(--save-partials) and merged later (--merge): shards profiled on different
+machines, or daily partitions rolled up into a weekly profile, merge with the
+same error bounds as one pass over all of the data, without rereading it.
+
+Rows are written in data_profile's layout to
+<output-dir>/data_profile/ds=<ds>/part-00000.csv. With --by-ds every ds=
+partition of the input gets its own profile and output partition.
+
+Usage:
+    python data_profiler.py --data-dir generated_data --bizdate 20240115 --output-dir generated_data
+    python data_profiler.py --data-dir generated_data --table orders --by-ds --workers 4 --save-partials profiles/
+    python data_profiler.py --merge profiles/orders.20240114.json profiles/orders.20240115.json --bizdate 20240115
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from dq_engine import DQ_SCRIPT
+from local_engine import CSV_CONVERTERS, open_csv, table_files
+from output_writers import load_schemas, open_writer
+from sketches import HyperLogLog, KllSketch, Moments
+
+
+NUMERIC_TYPES = {'BIGINT', 'INT', 'SMALLINT', 'TINYINT', 'DOUBLE', 'FLOAT'}
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+class ColumnProfile:
+    """Null count, extremes, distinct sketch and, for numbers, moments and quantiles of one column."""
+
+    def __init__(self, name: str, column_type: str, precision: int = 14, k: int = 200):
+        self.name = name
+        self.column_type = column_type
+        self.numeric = column_type in NUMERIC_TYPES
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.distinct = HyperLogLog(precision)
+        self.moments = Moments() if self.numeric else None
+        self.quantiles = KllSketch(k) if self.numeric else None
+
+    def updater(self, position: Optional[int]):
+        """Per-row update for CSV records with this column at ``position``."""
+        if position is None:
+            def missing(record):
+                self.nulls += 1
+            return missing
+        convert = CSV_CONVERTERS[self.column_type] if self.numeric else None
+        add_distinct = self.distinct.add
+        add_moment = self.moments.add if self.numeric else None
+        add_quantile = self.quantiles.add if self.numeric else None
+
+        def update(record):
+            text = record[position] if position < len(record) else ''
+            if text == '':
+                self.nulls += 1
+                return
+            add_distinct(text)
+            if convert is not None:
+                try:
+                    value = convert(text)
+                except ValueError:
+                    self.nulls += 1
+                    return
+                add_moment(value)
+                add_quantile(value)
+            else:
+                value = text
+            if self.minimum is None or value < self.minimum:
+                self.minimum = value
+            if self.maximum is None or value > self.maximum:
+                self.maximum = value
+        return update
+
+    def merge(self, other: 'ColumnProfile'):
+        self.nulls += other.nulls
+        if other.minimum is not None and (self.minimum is None or other.minimum < self.minimum):
+            self.minimum = other.minimum
+        if other.maximum is not None and (self.maximum is None or other.maximum > self.maximum):
+            self.maximum = other.maximum
+        self.distinct.merge(other.distinct)
+        if self.numeric:
+            self.moments.merge(other.moments)
+            self.quantiles.merge(other.quantiles)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'type': self.column_type, 'nulls': self.nulls, 'min': self.minimum, 'max': self.maximum,
+                'distinct': self.distinct.to_dict()}
+        if self.numeric:
+            data['moments'] = self.moments.to_dict()
+            data['quantiles'] = self.quantiles.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any]) -> 'ColumnProfile':
+        profile = cls(name, data['type'])
+        profile.nulls, profile.minimum, profile.maximum = data['nulls'], data['min'], data['max']
+        profile.distinct = HyperLogLog.from_dict(data['distinct'])
+        if profile.numeric:
+            profile.moments = Moments.from_dict(data['moments'])
+            profile.quantiles = KllSketch.from_dict(data['quantiles'])
+        return profile
+
+
+class TableProfile:
+    """Profiles of every column of a table (or of one of its ds partitions)."""
+
+    def __init__(self, table: str, columns: List[Tuple[str, str]], ds: Optional[str] = None,
+                 precision: int = 14, k: int = 200):
+        self.table = table
+        self.ds = ds
+        self.rows = 0
+        self.columns = {name: ColumnProfile(name, column_type, precision, k) for name, column_type in columns}
+
+    def update_file(self, path: str):
+        """Profile the rows of one CSV file."""
+        with open_csv(path) as csv_file:
+            reader = csv.reader(csv_file)
+            lookup = {name.strip().lower(): index for index, name in enumerate(next(reader, []))}
+            updates = [profile.updater(lookup.get(name.lower())) for name, profile in self.columns.items()]
+            rows = 0
+            for record in reader:
+                rows += 1
+                for update in updates:
+                    update(record)
+        self.rows += rows
+
+    def merge(self, other: 'TableProfile'):
+        if other.table != self.table or set(other.columns) != set(self.columns):
+            raise ValueError(f'Cannot merge a profile of {other.table} into one of {self.table}')
+        self.rows += other.rows
+        for name, profile in other.columns.items():
+            self.columns[name].merge(profile)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'table': self.table, 'ds': self.ds, 'rows': self.rows,
+                'columns': {name: profile.to_dict() for name, profile in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TableProfile':
+        profile = cls(data['table'], [], data.get('ds'))
+        profile.rows = data['rows']
+        profile.columns = {name: ColumnProfile.from_dict(name, column) for name, column in data['columns'].items()}
+        return profile
+
+    def profile_rows(self, profiled_at: datetime) -> List[tuple]:
+        """data_profile rows, one per column."""
+        rows = []
+        for name, profile in self.columns.items():
+            present = self.rows - profile.nulls
+            rows.append((self.table, name, profile.column_type, self.rows, profile.nulls,
+                         profile.nulls * 100.0 / self.rows if self.rows else None,
+                         profile.distinct.estimate() if present else 0,
+                         None if profile.minimum is None else str(profile.minimum),
+                         None if profile.maximum is None else str(profile.maximum),
+                         profile.moments.mean if profile.numeric and profile.moments.count else None,
+                         profile.moments.std_dev if profile.numeric else None,
+                         profiled_at))
+        return rows
+
+
+def profile_file(table: str, columns: List[Tuple[str, str]], path: str, ds: Optional[str],
+                 precision: int, k: int) -> Dict[str, Any]:
+    """Profile of one file, serialized so it can come back from a worker process."""
+    profile = TableProfile(table, columns, ds, precision, k)
+    profile.update_file(path)
+    return profile.to_dict()
+
+
+def profile_tables(data_dir: str, tables: List[str], schemas: Dict[str, Any], bizdate: str, by_ds: bool,
+                   workers: int, precision: int, k: int) -> Dict[Tuple[str, str], TableProfile]:
+    """Merged profiles by (table, ds); ds is the bizdate unless profiling --by-ds."""
+    jobs = []
+    for table in tables:
+        columns = schemas[table].columns
+        for path, ds in table_files(data_dir, table):
+            jobs.append((table, columns, path, (ds or bizdate) if by_ds else bizdate, precision, k))
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(profile_file, *zip(*jobs)))
+    else:
+        parts = [profile_file(*job) for job in jobs]
+    profiles = {}
+    for part in parts:
+        merge_into(profiles, TableProfile.from_dict(part))
+    return profiles
+
+
+def merge_into(profiles: Dict[Tuple[str, str], TableProfile], profile: TableProfile):
+    key = (profile.table, profile.ds)
+    if key in profiles:
+        profiles[key].merge(profile)
+    else:
+        profiles[key] = profile
+
+
+def partial_path(directory: str, profile: TableProfile) -> str:
+    return os.path.join(directory, f"{profile.table}.{profile.ds}.json" if profile.ds else f"{profile.table}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile tables in one pass with mergeable sketches')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--table', action='append',
+                        help='Table to profile (repeatable; default: every DDL table with files)')
+    parser.add_argument('--bizdate', default=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'),
+                        help='ds of the profile partition (default: yesterday)')
+    parser.add_argument('--by-ds', action='store_true',
+                        help='One profile per ds= partition of the input instead of one per table')
+    parser.add_argument('--workers', type=int, default=1, help='Processes profiling files in parallel')
+    parser.add_argument('--precision', type=int, default=14,
+                        help='HyperLogLog precision: 2^p registers per column (default: 14)')
+    parser.add_argument('--k', type=int, default=200, help='KLL sketch size (default: 200)')
+    parser.add_argument('--merge', nargs='+', metavar='PARTIAL',
+                        help='Merge saved partial profiles instead of reading --data-dir')
+    parser.add_argument('--save-partials', metavar='DIR', help='Save the profiles as mergeable JSON partials')
+    parser.add_argument('--output-dir', help='Write <dir>/data_profile/ds=<ds>/part-00000.csv')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    schemas = load_schemas()
+    try:
+        if args.merge:
+            profiles = {}
+            for path in args.merge:
+                with open(path, 'r', encoding='utf-8') as partial_file:
+                    profile = TableProfile.from_dict(json.load(partial_file))
+                if not args.by_ds:
+                    profile.ds = args.bizdate
+                merge_into(profiles, profile)
+            source = f'{len(args.merge)} partial(s)'
+        else:
+            tables = [table.lower() for table in args.table] if args.table else list(schemas)
+            unknown = [table for table in tables if table not in schemas]
+            if unknown:
+                parser.error(f"Unknown table(s): {', '.join(unknown)}")
+            if not args.table:
+                tables = [table for table in tables if table_files(args.data_dir, table)]
+            profiles = profile_tables(args.data_dir, tables, schemas, args.bizdate, args.by_ds,
+                                      args.workers, args.precision, args.k)
+            source = args.data_dir
+    except (OSError, KeyError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+    if not profiles:
+        parser.error('Nothing to profile')
+    seconds = time.perf_counter() - started
+    rows = sum(profile.rows for profile in profiles.values())
+    print(f"\nProfiled {rows:,} rows of {len({table for table, _ in profiles})} table(s) from {source} "
+          f"in {seconds:.3f}s ({rows / seconds if seconds else 0:,.0f} rows/s)")
+    columns = [column for profile in profiles.values() for column in profile.columns.values()]
+    hll = columns[0].distinct
+    print(f"distinct_count: HyperLogLog p={hll.precision}, {hll.relative_error:.2%} relative standard error")
+    kll = next((column.quantiles for column in columns if column.numeric), None)
+    if kll is not None:
+        print(f"quantiles: KLL k={kll.k}, rank error under {1.7 * 200 / kll.k:.1f}% (99%)")
+
+    profiled_at = datetime.now().replace(microsecond=0)
+    print(f"\n{'Table':<14} {'ds':<9} {'Column':<18} {'Type':<8} {'Records':>9} {'Nulls':>7} {'Distinct':>9} "
+          f"{'Min':>12} {'Max':>12} {'Avg':>10} {'StdDev':>10}  p25 / p50 / p75")
+    for (table, ds), profile in sorted(profiles.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+        for row in profile.profile_rows(profiled_at):
+            column = profile.columns[row[1]]
+            quantiles = ' / '.join(f'{value:g}' for value in column.quantiles.quantiles(list(QUANTILES))) \
+                if column.numeric and column.quantiles.count else ''
+            print(f"{table:<14} {ds or '':<9} {row[1]:<18} {row[2]:<8} {row[3]:>9,} {row[4]:>7,} {row[6]:>9,} "
+                  f"{(row[7] or '')[:12]:>12} {(row[8] or '')[:12]:>12} "
+                  f"{'' if row[9] is None else format(row[9], '.4g'):>10} "
+                  f"{'' if row[10] is None else format(row[10], '.4g'):>10}  {quantiles}")
+
+    if args.save_partials:
+        os.makedirs(args.save_partials, exist_ok=True)
+        for profile in profiles.values():
+            with open(partial_path(args.save_partials, profile), 'w', encoding='utf-8') as partial_file:
+                json.dump(profile.to_dict(), partial_file)
+        print(f"\nSaved {len(profiles)} partial profile(s) to {args.save_partials}")
+    if args.output_dir:
+        schema = load_schemas(DQ_SCRIPT)['data_profile']
+        by_ds: Dict[str, List[tuple]] = {}
+        for (_, ds), profile in profiles.items():
+            by_ds.setdefault(ds or args.bizdate, []).extend(profile.profile_rows(profiled_at))
+        for ds, ds_rows in sorted(by_ds.items()):
+            directory = os.path.join(args.output_dir, 'data_profile', f'ds={ds}')
+            os.makedirs(directory, exist_ok=True)
+            with open_writer('csv', os.path.join(directory, 'part-00000'), schema) as writer:
+                writer.write_rows(ds_rows)
+        print(f"\nWrote data_profile rows for {len(by_ds)} partition(s) to "
+              f"{os.path.join(args.output_dir, 'data_profile')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+#!/usr/bin/env python3
+"""
+Streaming data-quality rule engine driven by dq_rules
+
+Evaluates the rules of the ``dq_rules`` table (sql/06_data_quality.sql) over
+generated table files, all active rules of a table in one streaming pass over
+its rows, and writes ``dq_assessment``-shaped results. Adding a rule to
+dq_rules is enough to check it; no hand-written query per rule.
+
+Rule types and the ``rule_definition`` forms they take:
+- NULL_CHECK, RANGE_CHECK, FORMAT_CHECK: a row condition of comparisons
+  (``price > cost``, ``total_amount > 0``), ``IS [NOT] NULL``, ``[NOT] RLIKE``,
+  ``[NOT] BETWEEN`` and ``[NOT] IN (...)`` joined by AND. A row fails when the
+  condition is false; as in SQL, NULL operands make it unknown, not false.
+- UNIQUENESS_CHECK: ``COUNT(col) = COUNT(DISTINCT col)``; every repeat of a
+  non-null key is a failed record.
+- REFERENTIAL_CHECK: ``col EXISTS IN table`` (or ``table(col)``); non-null
+  values missing from that column of the other table fail. Its keys are
+  collected while the other table is streamed, so it is read only once;
+  referenced tables are streamed first, and a rule on a reference cycle
+  (including a table referencing itself) is reported as a rule error.
+
+Memory is bounded by the key sets of uniqueness and referential rules, never
+by the rows. Exact sets hold every distinct key; with --key-set bloom each is a
+Bloom filter sized by --expected-keys and --error-rate, so billions of rows
+fit in fixed memory at the cost of approximate counts (duplicates slightly
+over-counted, missing references slightly under-counted). Results are marked
+"approximate" in error_details.
+
+A rule passes when its failure rate (percent) is at most threshold_value;
+otherwise its status is FAIL for CRITICAL rules and WARNING for the others.
+
+Usage:
+    python dq_engine.py --data-dir generated_data --bizdate 20240115
+    python dq_engine.py --data-dir generated_data --table customers --output-dir generated_data
+    python dq_engine.py --data-dir /data/upload --key-set bloom --expected-keys 2000000000 --error-rate 0.001
+"""
+
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from local_engine import (CSV_CONVERTERS, Translation, open_csv, parenthesized,
+                          split_top_level, table_files)
+from output_writers import load_schemas, open_writer
+from sketches import BloomFilter
+
+
+DQ_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sql', '06_data_quality.sql')
+
+COMPARISONS = {
+    '=': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+COMPARISON_PATTERN = re.compile(r'^(.+?)\s*(>=|<=|<>|!=|=|>|<)\s*(.+)$')
+NULL_PATTERN = re.compile(r'^(\w+)\s+IS\s+(NOT\s+)?NULL$', re.IGNORECASE)
+REGEX_PATTERN = re.compile(r'^(\w+)\s+(NOT\s+)?(?:RLIKE|REGEXP)\s+(\x00\d+\x00)$', re.IGNORECASE)
+BETWEEN_PATTERN = re.compile(r'^(\w+)\s+(NOT\s+)?BETWEEN\s+(.+?)\s+AND\s+(.+)$', re.IGNORECASE)
+IN_PATTERN = re.compile(r'^(\w+)\s+(NOT\s+)?IN\s*\((.*)\)$', re.IGNORECASE | re.DOTALL)
+DISTINCT_PATTERN = re.compile(r'COUNT\s*\(\s*DISTINCT\s+([^)]+)\)', re.IGNORECASE)
+REFERENCE_PATTERN = re.compile(r'^(\w+)\s+EXISTS\s+IN\s+(\w+)(?:\s*\(\s*(\w+)\s*\)|\.(\w+))?$', re.IGNORECASE)
+
+# A row condition: True, False, or None when NULL operands make it unknown
+Condition = Callable[[Sequence[str]], Optional[bool]]
+
+
+class RuleError(Exception):
+    """A dq_rules definition the engine cannot evaluate."""
+
+
+class Rule:
+    """One row of dq_rules."""
+
+    def __init__(self, rule_id: str, table_name: str, column_name: str, rule_type: str,
+                 rule_definition: str, threshold_value: float = 0.0, severity: str = 'WARNING',
+                 active: bool = True):
+        self.rule_id = rule_id
+        self.table_name = table_name.lower()
+        self.column_name = column_name
+        self.rule_type = rule_type.upper()
+        self.rule_definition = rule_definition
+        self.threshold_value = float(threshold_value or 0.0)
+        self.severity = severity.upper()
+        self.active = active
+
+    def __repr__(self):
+        return f'Rule({self.rule_id!r}, {self.rule_type})'
+
+
+def _rule_value(translation: Translation, text: str) -> Any:
+    """Python value of one VALUES item: a literal, number, boolean or NULL."""
+    literal = translation.value(text)
+    if literal is not None:
+        return literal
+    if text.upper() in ('TRUE', 'FALSE'):
+        return text.upper() == 'TRUE'
+    try:
+        return float(text)
+    except ValueError:
+        return None  # NULL, GETDATE() and other expressions
+
+
+def parse_rules_sql(text: str) -> List[Rule]:
+    """Rules inserted by ``INSERT INTO dq_rules VALUES (...), ...`` statements of a script."""
+    translation = Translation(text)
+    masked = translation.text
+    rules = []
+    for match in re.finditer(r'INSERT\s+INTO\s+(?:TABLE\s+)?dq_rules\s+VALUES\s*', masked, re.IGNORECASE):
+        position = match.end()
+        while position < len(masked) and masked[position] == '(':
+            inner, position = parenthesized(masked, position)
+            values = [_rule_value(translation, item) for item in split_top_level(inner)]
+            rules.append(Rule(*values[:8]))
+            separator = re.match(r'\s*,\s*', masked[position:])
+            if not separator:
+                break
+            position += separator.end()
+    return rules
+
+
+def read_rules_csv(path: str) -> List[Rule]:
+    """Rules from a CSV export of dq_rules with a header row."""
+    rules = []
+    with open_csv(path) as rules_file:
+        for record in csv.DictReader(rules_file):
+            record = {name.strip().lower(): value for name, value in record.items()}
+            rules.append(Rule(record['rule_id'], record['table_name'], record['column_name'],
+                              record['rule_type'], record['rule_definition'],
+                              float(record.get('threshold_value') or 0.0), record.get('severity') or 'WARNING',
+                              (record.get('active') or 'true').strip().lower() in ('true', '1')))
+    return rules
+
+
+def load_rules(path: str) -> List[Rule]:
+    if path.endswith(('.csv', '.csv.gz')):
+        return read_rules_csv(path)
+    with open(path, 'r', encoding='utf-8') as script_file:
+        return parse_rules_sql(script_file.read())
+
+
+class Columns:
+    """Typed access to the columns of a table's CSV rows, by the header of one file."""
+
+    def __init__(self, schema_columns: Dict[str, str], header: Sequence[str]):
+        self.types = schema_columns
+        self.positions = {name.strip().lower(): index for index, name in enumerate(header)}
+
+    def getter(self, name: str, typed: bool = True) -> Callable[[Sequence[str]], Any]:
+        name = name.strip('`').lower()
+        if name not in self.types:
+            raise RuleError(f'Unknown column {name}')
+        position = self.positions.get(name)
+        if position is None:
+            return lambda record: None
+        convert = CSV_CONVERTERS.get(self.types[name]) if typed else None
+
+        def value(record):
+            if position >= len(record) or record[position] == '':
+                return None
+            if convert is None:
+                return record[position]
+            try:
+                return convert(record[position])
+            except ValueError:
+                return None
+        return value
+
+
+def _compare(operator: Callable[[Any, Any], bool], left: Any, right: Any) -> Optional[bool]:
+    if left is None or right is None:
+        return None
+    try:
+        return operator(left, right)
+    except TypeError:
+        # A string column against a number, like MaxCompute's implicit cast
+        try:
+            return operator(float(left), float(right))
+        except ValueError:
+            return None
+
+
+def compile_condition(definition: str, columns: Columns) -> Condition:
+    """Row condition of a rule definition, evaluated on raw CSV records."""
+    translation = Translation(definition)
+    masked = translation.text.strip()
+    if re.search(r'\bOR\b', masked, re.IGNORECASE):
+        raise RuleError(f'OR is not supported: {definition}')
+    parts = []
+    for part in re.split(r'\s+AND\s+', masked, flags=re.IGNORECASE):
+        if parts and re.search(r'\bBETWEEN\s+\S+$', parts[-1], re.IGNORECASE):
+            parts[-1] += ' AND ' + part
+        else:
+            parts.append(part.strip())
+    conditions = [_compile_part(part, translation, columns) for part in parts]
+    if len(conditions) == 1:
+        return conditions[0]
+
+    def conjunction(record):
+        result = True
+        for condition in conditions:
+            value = condition(record)
+            if value is False:
+                return False
+            if value is None:
+                result = None
+        return result
+    return conjunction
+
+
+def _operand(text: str, translation: Translation, columns: Columns) -> Callable[[Sequence[str]], Any]:
+    text = text.strip()
+    literal = translation.value(text)
+    if literal is not None:
+        return lambda record: literal
+    if text.upper() in ('TRUE', 'FALSE'):
+        constant = text.upper() == 'TRUE'
+        return lambda record: constant
+    try:
+        number = float(text)
+        return lambda record: number
+    except ValueError:
+        pass
+    if re.match(r'^`?\w+`?$', text):
+        return columns.getter(text)
+    raise RuleError(f'Unsupported operand: {translation.render(text)}')
+
+
+def _compile_part(part: str, translation: Translation, columns: Columns) -> Condition:
+    while part.startswith('(') and part.endswith(')'):
+        part = part[1:-1].strip()
+    match = NULL_PATTERN.match(part)
+    if match:
+        value, negated = columns.getter(match.group(1), typed=False), bool(match.group(2))
+        return lambda record: (value(record) is None) != negated
+    match = REGEX_PATTERN.match(part)
+    if match:
+        value, negated = columns.getter(match.group(1), typed=False), bool(match.group(2))
+        pattern = re.compile(translation.value(match.group(3)))
+
+        def regex(record):
+            text = value(record)
+            return None if text is None else bool(pattern.search(text)) != negated
+        return regex
+    match = BETWEEN_PATTERN.match(part)
+    if match:
+        value = columns.getter(match.group(1))
+        low, high = (_operand(bound, translation, columns) for bound in match.group(3, 4))
+        negated = bool(match.group(2))
+
+        def between(record):
+            item = value(record)
+            inside = _compare(lambda a, b: a >= b, item, low(record))
+            if inside is not False:
+                above = _compare(lambda a, b: a <= b, item, high(record))
+                inside = above if inside is True or above is False else None
+            return None if inside is None else inside != negated
+        return between
+    match = IN_PATTERN.match(part)
+    if match:
+        value, negated = columns.getter(match.group(1)), bool(match.group(2))
+        options = [_operand(option, translation, columns)(()) for option in split_top_level(match.group(3))]
+
+        def member(record):
+            item = value(record)
+            if item is None:
+                return None
+            found = any(_compare(COMPARISONS['='], item, option) for option in options)
+            return found != negated
+        return member
+    match = COMPARISON_PATTERN.match(part)
+    if match:
+        left, right = (_operand(side, translation, columns) for side in match.group(1, 3))
+        operator = COMPARISONS[match.group(2)]
+        return lambda record: _compare(operator, left(record), right(record))
+    raise RuleError(f'Unsupported condition: {translation.render(part)}')
+
+
+def new_key_set(mode: str, capacity: int, error_rate: float):
+    return set() if mode == 'exact' else BloomFilter(capacity, error_rate)
+
+
+class Check:
+    """Failed-record count of one rule over the rows of its table."""
+
+    description = 'records failing the rule'
+
+    def __init__(self, rule: Rule):
+        self.rule = rule
+        self.failed = 0
+        self.approximate = False
+
+    def bind(self, columns: Columns) -> Callable[[Sequence[str]], None]:
+        """Per-row update for the files with these columns."""
+        raise NotImplementedError
+
+    def details(self) -> str:
+        column = self.rule.column_name
+        if self.failed:
+            return f'Found {self.failed} {self.description.format(column=column)}' + (
+                ' (approximate)' if self.approximate else '')
+        return f'No {self.description.format(column=column)}'
+
+
+class ConditionCheck(Check):
+    """NULL_CHECK, RANGE_CHECK and FORMAT_CHECK: rows whose condition is false."""
+
+    descriptions = {
+        'NULL_CHECK': 'null {column} records',
+        'FORMAT_CHECK': 'invalid {column} formats',
+    }
+
+    def __init__(self, rule: Rule):
+        super().__init__(rule)
+        self.description = self.descriptions.get(rule.rule_type, f'records failing {rule.rule_definition}')
+
+    def bind(self, columns: Columns) -> Callable[[Sequence[str]], None]:
+        condition = compile_condition(self.rule.rule_definition, columns)
+
+        def update(record):
+            if condition(record) is False:
+                self.failed += 1
+        return update
+
+
+class UniquenessCheck(Check):
+    """UNIQUENESS_CHECK: every repeat of a non-null key."""
+
+    description = 'duplicate {column} records'
+
+    def __init__(self, rule: Rule, key_set):
+        super().__init__(rule)
+        match = DISTINCT_PATTERN.search(rule.rule_definition)
+        self.key_columns = [name.strip() for name in match.group(1).split(',')] if match else [rule.column_name]
+        self.seen = key_set
+        self.approximate = isinstance(key_set, BloomFilter)
+
+    def bind(self, columns: Columns) -> Callable[[Sequence[str]], None]:
+        getters = [columns.getter(name, typed=False) for name in self.key_columns]
+        seen = self.seen
+        if len(getters) == 1:
+            key_of = getters[0]
+        else:
+            def key_of(record):
+                values = [getter(record) for getter in getters]
+                return None if None in values else '\x1f'.join(values)
+
+        if self.approximate:
+            def update(record):
+                key = key_of(record)
+                if key is not None and seen.add(key):
+                    self.failed += 1
+        else:
+            def update(record):
+                key = key_of(record)
+                if key is None:
+                    return
+                if key in seen:
+                    self.failed += 1
+                else:
+                    seen.add(key)
+        return update
+
+
+class ReferentialCheck(Check):
+    """REFERENTIAL_CHECK: non-null values missing from the referenced column."""
+
+    def __init__(self, rule: Rule, key_set):
+        super().__init__(rule)
+        match = REFERENCE_PATTERN.match(rule.rule_definition.strip())
+        if not match:
+            raise RuleError(f'Expected "column EXISTS IN table", got {rule.rule_definition!r}')
+        self.column = match.group(1)
+        self.referenced_table = match.group(2).lower()
+        self.referenced_column = match.group(3) or match.group(4) or self.column
+        self.keys = key_set
+        self.approximate = isinstance(key_set, BloomFilter)
+        self.description = f'{{column}} values missing from {self.referenced_table}.{self.referenced_column}'
+
+    def collect(self, columns: Columns) -> Callable[[Sequence[str]], None]:
+        """Per-row update that gathers the keys while the referenced table is read."""
+        value, keys = columns.getter(self.referenced_column, typed=False), self.keys
+
+        def update(record):
+            key = value(record)
+            if key is not None:
+                keys.add(key)
+        return update
+
+    def bind(self, columns: Columns) -> Callable[[Sequence[str]], None]:
+        value, keys = columns.getter(self.column, typed=False), self.keys
+
+        def update(record):
+            key = value(record)
+            if key is not None and key not in keys:
+                self.failed += 1
+        return update
+
+
+def build_check(rule: Rule, key_set: Callable[[], Any]) -> Check:
+    if rule.rule_type == 'UNIQUENESS_CHECK':
+        return UniquenessCheck(rule, key_set())
+    if rule.rule_type == 'REFERENTIAL_CHECK':
+        return ReferentialCheck(rule, key_set())
+    if rule.rule_type in ('NULL_CHECK', 'RANGE_CHECK', 'FORMAT_CHECK'):
+        return ConditionCheck(rule)
+    raise RuleError(f'Unknown rule type {rule.rule_type}')
+
+
+def reference_order(tables: List[str], references: List[ReferentialCheck]
+                    ) -> Tuple[List[str], List[ReferentialCheck]]:
+    """Tables with every referenced table before the tables checked against it, and the
+    references on a cycle, which no order can satisfy."""
+    following: Dict[str, List[str]] = {table: [] for table in tables}
+    for check in references:
+        following[check.referenced_table].append(check.rule.table_name)
+
+    def reaches(start: str, goal: str) -> bool:
+        seen, pending = set(), [start]
+        while pending:
+            table = pending.pop()
+            if table == goal:
+                return True
+            if table not in seen:
+                seen.add(table)
+                pending.extend(following[table])
+        return False
+
+    cyclic = [check for check in references if reaches(check.rule.table_name, check.referenced_table)]
+    ordered = [check for check in references if check not in cyclic]
+    waiting = {table: 0 for table in tables}
+    for check in ordered:
+        waiting[check.rule.table_name] += 1
+    ready = [table for table in tables if not waiting[table]]
+    order = []
+    while ready:
+        table = ready.pop(0)
+        order.append(table)
+        for check in ordered:
+            if check.referenced_table == table:
+                waiting[check.rule.table_name] -= 1
+                if not waiting[check.rule.table_name]:
+                    ready.append(check.rule.table_name)
+    return order, cyclic
+
+
+class TableResult:
+    """Rows read and checks evaluated for one table."""
+
+    def __init__(self, table: str, checks: List[Check]):
+        self.table = table
+        self.checks = checks
+        self.rows = 0
+        self.files = 0
+        self.seconds = 0.0
+        self.error = None
+
+
+def stream_table(table: str, schema_columns: Dict[str, str], data_dir: str,
+                 checks: List[Check], collectors: List[ReferentialCheck]) -> TableResult:
+    """One pass over the files of ``table`` updating all of its checks and key collectors."""
+    result = TableResult(table, checks)
+    started = time.perf_counter()
+    for path, _ in table_files(data_dir, table):
+        with open_csv(path) as csv_file:
+            reader = csv.reader(csv_file)
+            columns = Columns(schema_columns, next(reader, []))
+            updates = ([check.bind(columns) for check in checks]
+                       + [collector.collect(columns) for collector in collectors])
+            rows = 0
+            for record in reader:
+                rows += 1
+                for update in updates:
+                    update(record)
+        result.rows += rows
+        result.files += 1
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def assess(rules: List[Rule], data_dir: str, schemas: Dict[str, Any], key_set: Callable[[], Any],
+           log: Callable[[str], None] = print) -> List[TableResult]:
+    """Evaluate active rules, streaming each table once; referenced tables go first."""
+    checks: Dict[str, List[Check]] = {}
+    results = []
+    for rule in rules:
+        if not rule.active:
+            continue
+        try:
+            if rule.table_name not in schemas:
+                raise RuleError(f'Unknown table {rule.table_name}')
+            checks.setdefault(rule.table_name, []).append(build_check(rule, key_set))
+        except RuleError as error:
+            log(f"  {rule.rule_id}: {error}")
+    referential = [check for table_checks in checks.values() for check in table_checks
+                   if isinstance(check, ReferentialCheck)]
+    referenced = [check.referenced_table for check in referential]
+    order, cyclic = reference_order(list(dict.fromkeys(referenced + list(checks))), referential)
+    for check in cyclic:
+        checks[check.rule.table_name].remove(check)
+        referential.remove(check)
+        table, referenced_table = check.rule.table_name, check.referenced_table
+        cycle = (f'{table} references itself' if table == referenced_table
+                 else f'{table} and {referenced_table} are on a reference cycle')
+        error = RuleError(f'{cycle}; its keys cannot all be collected before the check')
+        log(f"  {check.rule.rule_id}: {error}")
+    for table in order:
+        collectors = [check for check in referential if check.referenced_table == table]
+        if not collectors and not checks.get(table):
+            continue
+        if table not in schemas:
+            log(f"  {table}: not in the DDL, rules referencing it are skipped")
+            continue
+        table_checks = [check for check in checks.get(table, [])
+                        if not (isinstance(check, ReferentialCheck) and check.referenced_table not in schemas)]
+        schema_columns = {name.lower(): column_type for name, column_type in schemas[table].columns}
+        try:
+            result = stream_table(table, schema_columns, data_dir, table_checks, collectors)
+        except RuleError as error:
+            result = TableResult(table, table_checks)
+            result.error = str(error)
+        if table_checks or result.error:
+            results.append(result)
+        rate = result.rows / result.seconds if result.seconds else 0.0
+        log(f"  {table:<16} {result.rows:>12,} rows from {result.files} file(s) in {result.seconds:.3f}s "
+            f"({rate:,.0f} rows/s), {len(table_checks)} rule(s)"
+            + (f", keys for {len(collectors)} reference(s)" if collectors else ''))
+    return results
+
+
+def assessment_rows(results: List[TableResult], assessed_at: datetime) -> List[tuple]:
+    """dq_assessment rows in rule order."""
+    rows = []
+    for result in results:
+        for check in result.checks:
+            rule = check.rule
+            if result.error or not result.rows:
+                failure_rate, status = None, 'FAIL'
+                details = result.error or f'No rows found for {rule.table_name}'
+            else:
+                failure_rate = check.failed * 100.0 / result.rows
+                if failure_rate <= rule.threshold_value:
+                    status = 'PASS'
+                else:
+                    status = 'FAIL' if rule.severity == 'CRITICAL' else 'WARNING'
+                details = check.details()
+            rows.append((rule.rule_id, rule.table_name, rule.column_name, rule.rule_type, result.rows,
+                         check.failed, failure_rate, rule.threshold_value, status, rule.severity, details,
+                         assessed_at))
+    return sorted(rows, key=lambda row: row[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate dq_rules over table files in one pass per table')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--rules', default=DQ_SCRIPT,
+                        help='Script with INSERT INTO dq_rules VALUES, or a CSV export of dq_rules '
+                             '(default: sql/06_data_quality.sql)')
+    parser.add_argument('--ddl', default=None, help='DDL of the source tables (default: sql/01_create_tables.sql)')
+    parser.add_argument('--table', action='append', help='Only check rules of this table (repeatable)')
+    parser.add_argument('--rule', action='append', help='Only check this rule ID (repeatable)')
+    parser.add_argument('--bizdate', default=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'),
+                        help='ds of the assessment partition (default: yesterday)')
+    parser.add_argument('--key-set', choices=['exact', 'bloom'], default='exact',
+                        help='Key sets of uniqueness and referential rules (default: exact)')
+    parser.add_argument('--expected-keys', type=int, default=10_000_000,
+                        help='Distinct keys each Bloom filter is sized for (default: 10000000)')
+    parser.add_argument('--error-rate', type=float, default=0.001,
+                        help='Bloom filter false-positive rate (default: 0.001)')
+    parser.add_argument('--output-dir',
+                        help='Write <dir>/dq_assessment/ds=<bizdate>/part-00000.csv')
+    args = parser.parse_args()
+
+    try:
+        rules = load_rules(args.rules)
+    except (OSError, KeyError, TypeError, ValueError) as error:
+        parser.error(f'Cannot read rules from {args.rules}: {error}')
+    if args.table:
+        rules = [rule for rule in rules if rule.table_name in {table.lower() for table in args.table}]
+    if args.rule:
+        rules = [rule for rule in rules if rule.rule_id in args.rule]
+    if not rules:
+        parser.error('No rules to check')
+    schemas = load_schemas(args.ddl) if args.ddl else load_schemas()
+    try:
+        new_key_set(args.key_set, args.expected_keys, args.error_rate)
+    except ValueError as error:
+        parser.error(str(error))
+
+    active = sum(rule.active for rule in rules)
+    print(f"\nChecking {active} active rule(s) of {len(rules)} over {args.data_dir} "
+          f"({args.key_set} key sets)")
+    results = assess(rules, args.data_dir, schemas,
+                     lambda: new_key_set(args.key_set, args.expected_keys, args.error_rate))
+    rows = assessment_rows(results, datetime.now().replace(microsecond=0))
+
+    print(f"\n{'Rule':<8} {'Table':<14} {'Column':<14} {'Type':<18} {'Records':>10} {'Failed':>8} "
+          f"{'Rate %':>8} {'Limit':>6}  Status")
+    for row in rows:
+        rate = f'{row[6]:.3f}' if row[6] is not None else '-'
+        print(f"{row[0]:<8} {row[1]:<14} {row[2]:<14} {row[3]:<18} {row[4]:>10,} {row[5]:>8,} "
+              f"{rate:>8} {row[7]:>6g}  {row[8]:<8} {row[10]}")
+
+    if args.output_dir:
+        schema = load_schemas(DQ_SCRIPT)['dq_assessment']
+        directory = os.path.join(args.output_dir, 'dq_assessment', f'ds={args.bizdate}')
+        os.makedirs(directory, exist_ok=True)
+        with open_writer('csv', os.path.join(directory, 'part-00000'), schema) as writer:
+            writer.write_rows(rows)
+        print(f"\nWrote {len(rows)} assessment row(s) to {writer.path}")
+    if any(row[8] == 'FAIL' for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
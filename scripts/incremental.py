@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Incremental daily-partition generation
+
+Instead of one static snapshot, generates one day's delta per ds: the new
+customers, orders, order items, web sessions, page views and user events of
+that date, plus updates and deletes of existing customers at configurable
+rates. Every table is written as
+``<output_dir>/<table>_generated/ds=YYYYMMDD/part-NNNNN.<ext>``. Customer
+inserts, updates and deletes go to ``customers_delta_generated`` with a
+``change_type`` column (``customers_delta`` in sql/01_create_tables.sql), the
+input of the customer_changes detection in sql/05_etl_workflows.sql. The
+product catalog is generated once, on the first day.
+
+ID high-water marks are saved to a JSON state file after every day, so the
+next run continues with day N+1 and fresh IDs instead of regenerating days
+1..N. Each day draws from RNGs seeded by (seed, ds), and each customer row
+from one seeded by (seed, customer ID), so a day's output does not depend on
+how the days were split across runs.
+
+Usage:
+    python data_generator.py --table all --records 10000 --daily --seed 42 --start-date 2024-07-01 --end-date 2024-07-07
+    python data_generator.py --table all --records 10000 --daily   # the day after the last one in the state file
+"""
+
+import bisect
+import itertools
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from data_generator import DataGenerator, IdRange, generate_sharded
+from key_distributions import KeyDistribution
+
+
+ONE_DAY = timedelta(days=1)
+
+# New rows per day, as multiples of --records (the same mix as --table all)
+DAILY_VOLUMES = {
+    'customers': 1,
+    'orders': 2,
+    'order_items': 3,
+    'web_sessions': 1,
+    'page_views': 5,
+    'user_events': 3,
+}
+
+# Share of customer updates that change the last name (and so the email);
+# the rest change only the email
+NAME_CHANGE_SHARE = 0.3
+
+
+def to_ds(day: datetime) -> str:
+    return day.strftime('%Y%m%d')
+
+
+def from_ds(ds: str) -> datetime:
+    return datetime.strptime(ds, '%Y%m%d')
+
+
+class GeneratorState:
+    """Seed, ID high-water marks and customer history of daily runs.
+
+    ``customer_days`` holds ``[first customer number, ds]`` for every day, so
+    the registration day of any customer can be found without storing rows.
+    ``updated_customers`` holds the fields of the latest update of every live
+    customer updated so far, to apply over the registration-day row.
+    """
+
+    def __init__(self, seed: int, next_ds: Optional[str] = None,
+                 high_water: Optional[Dict[str, int]] = None,
+                 customer_days: Optional[List[List[Any]]] = None,
+                 deleted_customers: Optional[List[int]] = None,
+                 updated_customers: Optional[Dict[str, Dict[str, str]]] = None):
+        self.seed = seed
+        self.next_ds = next_ds
+        self.high_water = dict.fromkeys(['products', *DAILY_VOLUMES], 0)
+        self.high_water.update(high_water or {})
+        self.customer_days = customer_days or []
+        self.deleted_customers = set(deleted_customers or [])
+        # JSON object keys are strings
+        self.updated_customers = {int(number): fields for number, fields in (updated_customers or {}).items()}
+
+    @classmethod
+    def load(cls, path: str) -> Optional['GeneratorState']:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as state_file:
+            return cls(**json.load(state_file))
+
+    def save(self, path: str):
+        """Write the state through a temporary file, so a crash never leaves half of it."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as state_file:
+            json.dump({
+                'seed': self.seed,
+                'next_ds': self.next_ds,
+                'high_water': self.high_water,
+                'customer_days': self.customer_days,
+                'deleted_customers': sorted(self.deleted_customers),
+                'updated_customers': {str(number): self.updated_customers[number]
+                                      for number in sorted(self.updated_customers)},
+            }, state_file, indent=2)
+        os.replace(temporary, path)
+
+    def registration_day(self, number: int) -> datetime:
+        """Day customer ``number`` (1-based) was generated."""
+        firsts = [first for first, _ in self.customer_days]
+        return from_ds(self.customer_days[bisect.bisect_right(firsts, number) - 1][1])
+
+
+class DailyGenerator:
+    """Generate daily deltas and advance a ``GeneratorState``.
+
+    ``options`` are the ``generate_sharded`` options (workers, shard_size,
+    chunk_size, engine and the ``output`` format options).
+    """
+
+    def __init__(self, state: GeneratorState, records: int, update_rate: float = 0.01,
+                 delete_rate: float = 0.001, skew: Dict[str, KeyDistribution] = None,
+                 **options):
+        self.state = state
+        self.records = records
+        self.update_rate = update_rate
+        self.delete_rate = delete_rate
+        self.skew = skew
+        self.options = dict(options, merge=False)
+        self.output = dict(options.get('output') or {})
+        self.output.setdefault('output_dir', 'generated_data')
+        # Rebuilds single customer rows with a per-customer RNG
+        self._customer_rows = DataGenerator()
+
+    def generate_day(self, day: datetime):
+        """Write every table's delta for ``day``; the state advances only in memory."""
+        state, high_water = self.state, self.state.high_water
+        ds = to_ds(day)
+        seed = f'{state.seed}:{ds}'
+        counts = {table: self.records * volume for table, volume in DAILY_VOLUMES.items()}
+        dates = dict(start_date=day, end_date=day + ONE_DAY)
+        print(f"Generating ds={ds}...")
+
+        if not high_water['products']:
+            generate_sharded('products', self.records, 'products_generated', state.seed,
+                             **dict(self.options, merge=True))
+            high_water['products'] = self.records
+
+        # Orders come from live customers only, including today's new ones
+        self._write_customers(day, counts['customers'])
+
+        generate_sharded('orders', counts['orders'], f'orders_generated/ds={ds}', seed,
+                         first_id=high_water['orders'],
+                         customer_ids=IdRange('CUST', high_water['customers'] - len(state.deleted_customers),
+                                              excluded=state.deleted_customers),
+                         skew=self.skew, **dates, **self.options)
+        generate_sharded('order_items', counts['order_items'], f'order_items_generated/ds={ds}',
+                         seed, first_id=high_water['order_items'],
+                         order_ids=IdRange('ORD', counts['orders'], high_water['orders']),
+                         product_ids=IdRange('PROD', high_water['products']),
+                         skew=self.skew, **self.options)
+        generate_sharded('web_sessions', counts['web_sessions'], f'web_sessions_generated/ds={ds}',
+                         seed, first_id=high_water['web_sessions'],
+                         num_users=max(self.records // 10, 1), **dates, **self.options)
+        sessions = IdRange('SES', counts['web_sessions'], high_water['web_sessions'])
+        for table in ('page_views', 'user_events'):
+            generate_sharded(table, counts[table], f'{table}_generated/ds={ds}', seed,
+                             first_id=high_water[table], session_ids=sessions,
+                             skew=self.skew, **dates, **self.options)
+
+        for table in ('orders', 'order_items', 'web_sessions', 'page_views', 'user_events'):
+            high_water[table] += counts[table]
+        state.next_ds = to_ds(day + ONE_DAY)
+
+    def customer_row(self, number: int, day: datetime) -> Dict[str, Any]:
+        """Customer ``number`` as first generated, on ``day``; a pure function of the seed."""
+        rows = self._customer_rows
+        rows.rng = random.Random(f'{self.state.seed}:customers:{number}')
+        return next(rows.iter_customers(1, start=number - 1, start_date=day,
+                                        end_date=day + ONE_DAY))
+
+    def current_customer(self, number: int) -> Dict[str, Any]:
+        """Customer ``number`` as of its latest update."""
+        row = self.customer_row(number, self.state.registration_day(number))
+        row.update(self.state.updated_customers.get(number, {}))
+        return row
+
+    def _write_customers(self, day: datetime, count: int):
+        """Write the day's customer inserts, updates and deletes to customers_delta."""
+        state = self.state
+        ds = to_ds(day)
+        existing = state.high_water['customers']
+        generator = DataGenerator(seed=f'{state.seed}:{ds}:customers')
+
+        live = existing - len(state.deleted_customers)
+        delete_count = round(live * self.delete_rate)
+        picks = self._pick_live(generator.rng, existing,
+                                delete_count + round(live * self.update_rate))
+        deleted, updated = picks[:delete_count], picks[delete_count:]
+
+        inserts = (dict(self.customer_row(number, day), change_type='INSERT')
+                   for number in range(existing + 1, existing + count + 1))
+        updates = (self._update(generator, number, day) for number in updated)
+        deletes = (dict(self.current_customer(number), change_type='DELETE')
+                   for number in deleted)
+
+        generator.save('customers_delta', itertools.chain(inserts, updates, deletes),
+                       f'customers_delta_generated/ds={ds}/part-00000',
+                       self.options.get('chunk_size', 10000), **self.output)
+
+        state.customer_days.append([existing + 1, ds])
+        state.deleted_customers.update(deleted)
+        for number in deleted:
+            state.updated_customers.pop(number, None)
+        state.high_water['customers'] += count
+
+    def _update(self, generator: DataGenerator, number: int, day: datetime) -> Dict[str, Any]:
+        """A changed version of customer ``number``: new email, sometimes a new last name."""
+        row = self.current_customer(number)
+        rng = generator.rng
+        if rng.random() < NAME_CHANGE_SHARE:
+            row['last_name'] = rng.choice(generator.last_names)
+        row['email'] = (f"{row['first_name'].lower()}.{row['last_name'].lower()}"
+                        f"{rng.randint(1, 999)}@email.com")
+        self.state.updated_customers[number] = {'last_name': row['last_name'], 'email': row['email']}
+        row['change_type'] = 'UPDATE'
+        return row
+
+    def _pick_live(self, rng: random.Random, existing: int, count: int) -> List[int]:
+        """``count`` distinct, not yet deleted customer numbers in random order."""
+        deleted = self.state.deleted_customers
+        count = min(count, existing - len(deleted))
+        picked = set()
+        while len(picked) < count:
+            number = rng.randint(1, existing)
+            if number not in deleted:
+                picked.add(number)
+        picked = sorted(picked)
+        rng.shuffle(picked)
+        return picked
+
+
+def days_between(first: datetime, last: datetime) -> Iterator[datetime]:
+    day = first
+    while day <= last:
+        yield day
+        day += ONE_DAY
+
+
+def generate_daily(records: int, state_path: str, start_date: Optional[datetime] = None,
+                   end_date: Optional[datetime] = None, seed: Optional[int] = None,
+                   update_rate: float = 0.01, delete_rate: float = 0.001,
+                   skew: Dict[str, KeyDistribution] = None, **options):
+    """Generate the days ``start_date``..``end_date`` (inclusive) not generated yet.
+
+    Without ``start_date`` generation continues at the state's next ds; without
+    ``end_date`` one day is generated. Days before the state's next ds are
+    skipped, and the state is saved after every day.
+    """
+    state = GeneratorState.load(state_path)
+    if state is None:
+        if start_date is None:
+            raise ValueError(f'No state in {state_path}: pass --start-date for the first day')
+        state = GeneratorState(seed if seed is not None else random.randrange(2 ** 32))
+    elif seed is not None and seed != state.seed:
+        raise ValueError(f'--seed {seed} does not match seed {state.seed} of {state_path}')
+
+    first = start_date or from_ds(state.next_ds)
+    last = end_date or first
+    if first > last:
+        raise ValueError('--start-date must not be after --end-date')
+    if state.next_ds and first < from_ds(state.next_ds):
+        print(f"Skipping days before ds={state.next_ds}, already generated")
+        first = from_ds(state.next_ds)
+    print(f"Using seed {state.seed}, state in {state_path}")
+
+    daily = DailyGenerator(state, records, update_rate, delete_rate, skew, **options)
+    for day in days_between(first, last):
+        daily.generate_day(day)
+        state.save(state_path)
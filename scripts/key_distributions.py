@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Skewed foreign-key distributions for the sample data generator
+
+By default every foreign key (orders.customer_id, order_items.order_id and
+product_id, page_views/user_events.session_id) is a uniform pick from its
+parent table. The distributions here concentrate picks on a few parent keys
+instead, to reproduce the hot-key skew that makes joins and GROUP BYs on
+those keys straggle. Rank 0 (the most frequent key) is the first parent ID,
+e.g. CUST000001, so hot keys are easy to find in the generated data.
+
+Every draw is O(1) whatever the size of the parent table:
+- zipf:S      P(rank k) proportional to 1/k^S. Exact through an alias table
+              for the first 65536 ranks, continuous approximation beyond.
+- power:A     Continuous power law x^-A over the ranks, by inverse CDF.
+- hot:K:SHARE The first K keys get SHARE of the picks, the rest are uniform.
+
+Usage:
+    python data_generator.py --table all --records 100000 --skew customer_id=zipf:1.1
+    python data_generator.py --table all --records 100000 --skew product_id=hot:10:0.5 --skew order_id=power:1.5
+"""
+
+import math
+import random
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Ranks covered exactly by a Zipf alias table; rarer ranks use the continuous tail
+ZIPF_TABLE_SIZE = 1 << 16
+
+# Foreign-key columns --skew can be applied to
+SKEWABLE_KEYS = ('customer_id', 'order_id', 'product_id', 'session_id')
+
+
+def alias_table(weights: List[float]) -> Tuple[List[float], List[int]]:
+    """Vose's alias method: ``(probability, alias)`` lists for ``weights``.
+
+    A draw picks a column ``i`` uniformly and keeps it with ``probability[i]``,
+    otherwise takes ``alias[i]``.
+    """
+    count = len(weights)
+    total = sum(weights)
+    scaled = [weight * count / total for weight in weights]
+    probability, alias = [1.0] * count, list(range(count))
+    small = [i for i, value in enumerate(scaled) if value < 1.0]
+    large = [i for i, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probability[less], alias[less] = scaled[less], more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    return probability, alias
+
+
+def _power_integral(exponent: float, low: float, high: float) -> float:
+    """Integral of ``x^-exponent`` over ``[low, high)``."""
+    if exponent == 1:
+        return math.log(high / low)
+    return (high ** (1 - exponent) - low ** (1 - exponent)) / (1 - exponent)
+
+
+def _power_inverse(exponent: float, low: float, high: float) -> Callable[[float], float]:
+    """Inverse CDF of the ``x^-exponent`` density on ``[low, high)``."""
+    if exponent == 1:
+        ratio = high / low
+        return lambda u: low * ratio ** u
+    start = low ** (1 - exponent)
+    span = high ** (1 - exponent) - start
+    power = 1 / (1 - exponent)
+    return lambda u: (start + u * span) ** power
+
+
+@lru_cache(maxsize=None)
+def _zipf_head(exponent: float, n: int) -> Tuple[List[float], List[int], int, float]:
+    """Alias table over the first ``ZIPF_TABLE_SIZE`` ranks and their share of the mass."""
+    head = min(n, ZIPF_TABLE_SIZE)
+    weights = [(rank + 1) ** -exponent for rank in range(head)]
+    head_mass = sum(weights)
+    tail_mass = _power_integral(exponent, head + 0.5, n + 0.5) if n > head else 0.0
+    probability, alias = alias_table(weights)
+    return probability, alias, head, head_mass / (head_mass + tail_mass)
+
+
+@lru_cache(maxsize=None)
+def _zipf_head_arrays(exponent: float, n: int):
+    """``_zipf_head`` probability and alias columns as NumPy arrays."""
+    import numpy as np
+    probability, alias, _, _ = _zipf_head(exponent, n)
+    return np.asarray(probability), np.asarray(alias, dtype=np.int64)
+
+
+class KeyDistribution:
+    """Distribution of picks over the ranks ``0..n-1`` of a parent key list.
+
+    ``sampler`` returns a no-argument function drawing one rank from a
+    ``random.Random``; ``sample_array`` draws ``count`` ranks at once from a
+    ``numpy.random.Generator`` for the columnar engine.
+    """
+
+    def sampler(self, n: int, rng: random.Random) -> Callable[[], int]:
+        raise NotImplementedError
+
+    def sample_array(self, n: int, rng, count: int):
+        raise NotImplementedError
+
+
+class Zipf(KeyDistribution):
+    """``P(rank k) ~ 1/k^exponent``, exact over the first ``ZIPF_TABLE_SIZE`` ranks."""
+
+    def __init__(self, exponent: float):
+        if exponent <= 0:
+            raise ValueError('Zipf exponent must be positive')
+        self.exponent = exponent
+
+    def _parts(self, n: int):
+        """Alias table of the head, its size and share of the mass, and the tail inverse CDF."""
+        probability, alias, head, head_share = _zipf_head(self.exponent, n)
+        tail = None
+        if n > head:
+            # Rank k of the tail stands for [k - 0.5, k + 0.5) of the density
+            tail = _power_inverse(self.exponent, head + 0.5, n + 0.5)
+        return (probability, alias), head, head_share, tail
+
+    def sampler(self, n: int, rng: random.Random) -> Callable[[], int]:
+        (probability, alias), head, head_share, tail = self._parts(n)
+        draw = rng.random
+        last = n - 1
+
+        def sample() -> int:
+            if tail is not None and draw() >= head_share:
+                return min(int(tail(draw()) + 0.5) - 1, last)
+            column = draw() * head
+            index = int(column)
+            return index if column - index < probability[index] else alias[index]
+        return sample
+
+    def sample_array(self, n: int, rng, count: int):
+        import numpy as np
+        _, head, head_share, tail = self._parts(n)
+        probability, alias = _zipf_head_arrays(self.exponent, n)
+        column = rng.random(count) * head
+        index = column.astype(np.int64)
+        ranks = np.where(column - index < probability[index], index, alias[index])
+        if tail is not None:
+            in_tail = rng.random(count) >= head_share
+            tail_ranks = np.rint(tail(rng.random(int(in_tail.sum())))).astype(np.int64) - 1
+            ranks[in_tail] = np.minimum(tail_ranks, n - 1)
+        return ranks
+
+    def __repr__(self):
+        return f'zipf:{self.exponent:g}'
+
+
+class PowerLaw(KeyDistribution):
+    """Continuous ``x^-exponent`` density over ``[1, n + 1)``, floored to a rank."""
+
+    def __init__(self, exponent: float):
+        if exponent <= 0:
+            raise ValueError('Power-law exponent must be positive')
+        self.exponent = exponent
+
+    def sampler(self, n: int, rng: random.Random) -> Callable[[], int]:
+        inverse = _power_inverse(self.exponent, 1, n + 1)
+        draw = rng.random
+        last = n - 1
+        return lambda: min(int(inverse(draw())) - 1, last)
+
+    def sample_array(self, n: int, rng, count: int):
+        import numpy as np
+        inverse = _power_inverse(self.exponent, 1, n + 1)
+        return np.minimum(inverse(rng.random(count)).astype(np.int64) - 1, n - 1)
+
+    def __repr__(self):
+        return f'power:{self.exponent:g}'
+
+
+class HotKeys(KeyDistribution):
+    """The first ``count`` keys get ``share`` of the picks; the rest are uniform."""
+
+    def __init__(self, count: int, share: float):
+        if count < 1 or not 0 <= share <= 1:
+            raise ValueError('Hot keys need a count >= 1 and a share between 0 and 1')
+        self.count = count
+        self.share = share
+
+    def sampler(self, n: int, rng: random.Random) -> Callable[[], int]:
+        hot = min(self.count, n)
+        cold = n - hot
+        draw = rng.random
+        share = self.share if cold else 1.0
+        return lambda: int(draw() * hot) if draw() < share else hot + int(draw() * cold)
+
+    def sample_array(self, n: int, rng, count: int):
+        import numpy as np
+        hot = min(self.count, n)
+        cold = n - hot
+        share = self.share if cold else 1.0
+        return np.where(rng.random(count) < share,
+                        rng.integers(0, hot, count),
+                        hot + rng.integers(0, max(cold, 1), count))
+
+    def __repr__(self):
+        return f'hot:{self.count}:{self.share:g}'
+
+
+def parse_distribution(spec: str) -> KeyDistribution:
+    """Parse ``zipf:S``, ``power:A`` or ``hot:K:SHARE``."""
+    name, *params = spec.split(':')
+    try:
+        if name == 'zipf' and len(params) == 1:
+            return Zipf(float(params[0]))
+        if name == 'power' and len(params) == 1:
+            return PowerLaw(float(params[0]))
+        if name == 'hot' and len(params) == 2:
+            return HotKeys(int(params[0]), float(params[1]))
+    except ValueError as error:
+        raise ValueError(f'Invalid key distribution {spec!r}: {error}')
+    raise ValueError(f'Invalid key distribution {spec!r}: expected zipf:S, power:A or hot:K:SHARE')
+
+
+def parse_skew(specs: Iterable[str]) -> Dict[str, KeyDistribution]:
+    """Parse ``COLUMN=DISTRIBUTION`` options into a ``{column: distribution}`` dict."""
+    skew = {}
+    for spec in specs:
+        column, separator, distribution = spec.partition('=')
+        if not separator or column not in SKEWABLE_KEYS:
+            raise ValueError(f'Invalid --skew {spec!r}: expected COLUMN=DISTRIBUTION with '
+                             f'COLUMN one of {", ".join(SKEWABLE_KEYS)}')
+        skew[column] = parse_distribution(distribution)
+    return skew
@@ -0,0 +1,1032 @@
+#!/usr/bin/env python3
+"""
+Local SQL engine for the MaxCompute scripts in sql/
+
+Runs the ETL and data quality scripts against an embedded database instead
+of a MaxCompute project: DuckDB when it is installed (columnar, fast on
+millions of rows), SQLite from the standard library otherwise. The tables of
+sql/01_create_tables.sql are created first and loaded from the CSV files in
+``--data-dir``, as written by data_generator.py:
+    <table>.csv, <table>_generated.csv       ds taken from the rows' event time
+    <table>_generated/part-NNNNN.csv         (or the --bizdate, see below)
+    <table>_generated/ds=YYYYMMDD/*.csv      ds taken from the directory
+Partitions are an ordinary ``ds`` column, appended after the table's columns.
+Rows outside ds= directories get the ds of their event-time column (as with
+--partition-by-ds), order items that of their order, and everything else
+the --bizdate.
+
+The scripts are then translated statement by statement from the MaxCompute
+dialect:
+- ``${bizdate}`` and other ``${name}`` parameters (--bizdate, --var)
+- ``CREATE TABLE ... PARTITIONED BY (...) COMMENT ... LIFECYCLE n``
+- ``INSERT OVERWRITE|INTO TABLE t PARTITION (ds = '...')``, overwrite as a
+  delete of the partition followed by an insert
+- backslash escapes in string literals, double-quoted strings, `quoted` names
+- GETDATE, DATE_FORMAT, DATETRUNC, DATEDIFF, DATEADD, DATE_ADD, DATE_SUB,
+  YEAR, MONTH, DAY, DAYOFWEEK, CONCAT, CONCAT_WS, INITCAP, REGEXP_REPLACE,
+  RLIKE, STDDEV and PERCENTILE with MaxCompute semantics. DATE_ADD and
+  DATE_SUB also accept ``YYYYMMDD`` partition values and return one.
+
+Every statement prints its time and row count, grouped by the numbered
+sections of the script (``-- 3. PRODUCT PERFORMANCE ETL``); --explain prints
+each statement's query plan and --show-sql the translated SQL. A failing
+statement is reported and the script continues (--fail-fast stops instead).
+
+Usage:
+    python local_engine.py ../sql/05_etl_workflows.sql --data-dir generated_data --bizdate 20240115
+    python local_engine.py ../sql/05_etl_workflows.sql ../sql/06_data_quality.sql --section 3 --explain
+    python local_engine.py ../sql/06_data_quality.sql --database local.duckdb --no-load --var start_time='2024-01-16 00:00:00'
+"""
+
+import argparse
+import csv
+import gzip
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from output_writers import DEFAULT_DDL, PARTITION_SOURCES, TableSchema, load_schemas, to_ds
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+SECTION_PATTERN = re.compile(r'^--\s*(\d+)\.\s+(.+?)\s*$')
+VARIABLE_PATTERN = re.compile(r'\$\{(\w+)\}')
+LITERAL_PATTERN = re.compile(r'\x00(\d+)\x00')
+CALL_PATTERN = re.compile(r'(?<![\w."])([A-Za-z_]\w*)\s*\(')
+CAST_PATTERN = re.compile(r'^(.*)\s+AS\s+(\w+)(\s*\([^)]*\))?\s*$', re.IGNORECASE | re.DOTALL)
+CREATE_PATTERN = re.compile(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?([\w."]+)\s*',
+                            re.IGNORECASE)
+INSERT_PATTERN = re.compile(r'^\s*INSERT\s+(OVERWRITE|INTO)\s+(?:TABLE\s+)?([\w."]+)\s*'
+                            r'(PARTITION\s*(?=\())?', re.IGNORECASE)
+DESCRIBE_PATTERN = re.compile(r'^\s*(DROP\s+TABLE(?:\s+IF\s+EXISTS)?|CREATE\s+TABLE(?:\s+IF\s+NOT\s+EXISTS)?|'
+                              r'INSERT\s+(?:OVERWRITE|INTO)(?:\s+TABLE)?|DELETE\s+FROM)\s+([\w."]+)',
+                              re.IGNORECASE)
+
+# MaxCompute escapes in string literals; other escaped characters lose the backslash
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '%': '\\%', '_': '\\_'}
+
+# Java date format letters (DATE_FORMAT) to strftime
+DATE_FORMAT_CODES = {'yyyy': '%Y', 'yy': '%y', 'MM': '%m', 'dd': '%d', 'HH': '%H',
+                     'mm': '%M', 'ss': '%S'}
+DATE_FORMAT_PATTERN = re.compile('|'.join(sorted(DATE_FORMAT_CODES, key=len, reverse=True)))
+
+# DATETRUNC/DATEDIFF/DATEADD units
+DATE_UNITS = {'yyyy': 'year', 'year': 'year', 'q': 'quarter', 'quarter': 'quarter',
+              'mm': 'month', 'month': 'month', 'mon': 'month', 'week': 'week',
+              'dd': 'day', 'day': 'day', 'hh': 'hour', 'hour': 'hour',
+              'mi': 'minute', 'minute': 'minute', 'ss': 'second', 'second': 'second'}
+
+CSV_CONVERTERS = {
+    'BIGINT': int,
+    'INT': int,
+    'SMALLINT': int,
+    'TINYINT': int,
+    'DOUBLE': float,
+    'FLOAT': float,
+    'BOOLEAN': lambda value: value.lower() == 'true',
+}
+
+
+class EngineError(Exception):
+    """A statement the engine cannot translate."""
+
+
+class Statement:
+    """One statement of a script, with the numbered section it belongs to."""
+
+    def __init__(self, script: str, section: Optional[str], line: int, text: str):
+        self.script = script
+        self.section = section
+        self.line = line
+        self.text = text
+
+    @property
+    def description(self) -> str:
+        match = DESCRIBE_PATTERN.match(self.text)
+        if match:
+            return f"{' '.join(match.group(1).upper().split())} {match.group(2)}"
+        return ' '.join(self.text.split()[:1]).upper() or 'EMPTY'
+
+    @property
+    def target(self) -> Optional[str]:
+        """Table the statement drops, creates or writes; None for queries."""
+        match = DESCRIBE_PATTERN.match(self.text)
+        return match.group(2).strip('`"').lower() if match else None
+
+
+def split_script(text: str, script: str = '') -> List[Statement]:
+    """Statements of a script without comments, split at semicolons outside literals."""
+    statements, buffer = [], []
+    section, line, start_line = None, 1, None
+    index, length = 0, len(text)
+    while index < length:
+        char = text[index]
+        if char in '\'"`':
+            end = index + 1
+            while end < length and text[end] != char:
+                end += 2 if text[end] == '\\' and char != '`' else 1
+            if start_line is None:
+                start_line = line
+            buffer.append(text[index:end + 1])
+            line += text.count('\n', index, end + 1)
+            index = end + 1
+            continue
+        if text.startswith('--', index):
+            end = text.find('\n', index)
+            end = length if end < 0 else end
+            heading = SECTION_PATTERN.match(text[index:end])
+            if heading and not ''.join(buffer).strip():
+                section = f'{heading.group(1)}. {heading.group(2)}'
+            buffer.append(' ')
+            index = end
+            continue
+        if text.startswith('/*', index):
+            end = text.find('*/', index + 2)
+            end = length if end < 0 else end + 2
+            line += text.count('\n', index, end)
+            buffer.append(' ')
+            index = end
+            continue
+        if char == ';':
+            statement = ''.join(buffer).strip()
+            if statement:
+                statements.append(Statement(script, section, start_line, statement))
+            buffer, start_line = [], None
+        else:
+            if start_line is None and not char.isspace():
+                start_line = line
+            buffer.append(char)
+        if char == '\n':
+            line += 1
+        index += 1
+    statement = ''.join(buffer).strip()
+    if statement:
+        statements.append(Statement(script, section, start_line, statement))
+    return statements
+
+
+def substitute(text: str, variables: Dict[str, str]) -> str:
+    """Replace ``${name}`` parameters, as DataWorks does before submitting a script."""
+    def value(match):
+        if match.group(1) not in variables:
+            raise EngineError(f'Undefined parameter ${{{match.group(1)}}}: pass --var {match.group(1)}=...')
+        return variables[match.group(1)]
+    return VARIABLE_PATTERN.sub(value, text)
+
+
+def parenthesized(text: str, start: int) -> Tuple[str, int]:
+    """Text inside the parentheses opening at ``text[start]`` and the index after them."""
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] == '(':
+            depth += 1
+        elif text[index] == ')':
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:index], index + 1
+    raise EngineError('Unbalanced parentheses')
+
+
+def split_top_level(text: str) -> List[str]:
+    """Split at commas outside parentheses."""
+    parts, depth, start = [], 0, 0
+    for index, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:index])
+            start = index + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts] if text.strip() else []
+
+
+class Translation:
+    """A statement with its string literals masked while it is rewritten.
+
+    Literals become ``\\x00n\\x00`` placeholders, so rewrites never look inside
+    them, and are written back in standard SQL quoting.
+    """
+
+    def __init__(self, text: str):
+        self.literals: List[str] = []
+        out, index, length = [], 0, len(text)
+        while index < length:
+            char = text[index]
+            if char == '`':
+                end = text.index('`', index + 1)
+                out.append(f'"{text[index + 1:end]}"')
+                index = end + 1
+            elif char in '\'"':
+                value, index = self._read_literal(text, index)
+                out.append(self.literal(value))
+            else:
+                out.append(char)
+                index += 1
+        self.text = ''.join(out)
+
+    @staticmethod
+    def _read_literal(text: str, start: int) -> Tuple[str, int]:
+        quote, value, index = text[start], [], start + 1
+        while index < len(text):
+            char = text[index]
+            if char == '\\' and index + 1 < len(text):
+                escaped = text[index + 1]
+                value.append(ESCAPES.get(escaped, escaped))
+                index += 2
+            elif char == quote:
+                if text.startswith(quote * 2, index):
+                    value.append(quote)
+                    index += 2
+                    continue
+                return ''.join(value), index + 1
+            else:
+                value.append(char)
+                index += 1
+        raise EngineError('Unterminated string literal')
+
+    def literal(self, value: str) -> str:
+        """Placeholder of a new literal."""
+        self.literals.append(value)
+        return f'\x00{len(self.literals) - 1}\x00'
+
+    def value(self, argument: str) -> Optional[str]:
+        """Value of an argument that is a single literal, else None."""
+        match = LITERAL_PATTERN.fullmatch(argument.strip())
+        return self.literals[int(match.group(1))] if match else None
+
+    def require(self, argument: str, function: str) -> str:
+        value = self.value(argument)
+        if value is None:
+            raise EngineError(f'{function} needs a literal format or unit, got {self.render(argument)}')
+        return value
+
+    def render(self, text: str) -> str:
+        return LITERAL_PATTERN.sub(
+            lambda match: "'" + self.literals[int(match.group(1))].replace("'", "''") + "'", text)
+
+    def rewrite_calls(self, text: str, handlers: Dict[str, Callable]) -> str:
+        """Replace calls of the functions in ``handlers``, innermost arguments first."""
+        out, position = [], 0
+        while True:
+            match = CALL_PATTERN.search(text, position)
+            if not match:
+                break
+            handler = handlers.get(match.group(1).upper())
+            if handler is None:
+                out.append(text[position:match.end()])
+                position = match.end()
+                continue
+            inner, end = parenthesized(text, match.end() - 1)
+            arguments = [self.rewrite_calls(argument, handlers) for argument in split_top_level(inner)]
+            out.append(text[position:match.start()])
+            out.append(handler(self, arguments))
+            position = end
+        out.append(text[position:])
+        return ''.join(out)
+
+
+def java_date_format(pattern: str) -> str:
+    """strftime format of a DATE_FORMAT pattern like ``yyyy-MM-dd HH:mm:ss``."""
+    return DATE_FORMAT_PATTERN.sub(lambda match: DATE_FORMAT_CODES[match.group(0)],
+                                   pattern.replace('%', '%%'))
+
+
+def date_unit(unit: str) -> str:
+    if unit.lower() not in DATE_UNITS:
+        raise EngineError(f'Unsupported date unit {unit!r}')
+    return DATE_UNITS[unit.lower()]
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """A DATETIME value: a datetime, ``YYYY-MM-DD[ HH:MM:SS]`` or ``YYYYMMDD`` text."""
+    if value is None or isinstance(value, datetime):
+        return value
+    value = str(value)
+    if len(value) == 8 and value.isdigit():
+        return datetime.strptime(value, '%Y%m%d')
+    return datetime.fromisoformat(value[:19])
+
+
+def format_datetime(value: datetime) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def shift_date(value: Any, days: int) -> Optional[str]:
+    """DATE_ADD: ``YYYY-MM-DD`` of a date ``days`` later; ``YYYYMMDD`` stays ``YYYYMMDD``."""
+    if value is None or days is None:
+        return None
+    shifted = parse_datetime(value) + timedelta(days=int(days))
+    text = str(value)
+    return shifted.strftime('%Y%m%d' if len(text) == 8 and text.isdigit() else '%Y-%m-%d')
+
+
+def truncate_datetime(value: datetime, unit: str) -> datetime:
+    if unit == 'year':
+        return value.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'quarter':
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1, hour=0, minute=0,
+                             second=0, microsecond=0)
+    if unit == 'month':
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'week':
+        return (value - timedelta(days=value.weekday())).replace(hour=0, minute=0, second=0,
+                                                                 microsecond=0)
+    fields = ('day', 'hour', 'minute', 'second')
+    keep = fields.index(unit)
+    return value.replace(**{name: 0 for name in ('hour', 'minute', 'second')[keep:]}, microsecond=0)
+
+
+def add_to_datetime(value: datetime, amount: int, unit: str) -> datetime:
+    if unit in ('year', 'quarter', 'month'):
+        months = value.month - 1 + amount * {'year': 12, 'quarter': 3, 'month': 1}[unit]
+        year, month = value.year + months // 12, months % 12 + 1
+        days_in_month = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+        return value.replace(year=year, month=month, day=min(value.day, days_in_month))
+    return value + timedelta(**{f'{unit}s': amount}) if unit != 'week' else value + timedelta(weeks=amount)
+
+
+def datetime_difference(first: datetime, second: datetime, unit: str) -> int:
+    """DATEDIFF: ``first - second`` in whole ``unit``s, counted on truncated values."""
+    if unit in ('year', 'quarter', 'month'):
+        months = (first.year - second.year) * 12 + first.month - second.month
+        return {'year': (first.year - second.year), 'quarter': months // 3, 'month': months}[unit]
+    first, second = truncate_datetime(first, unit), truncate_datetime(second, unit)
+    seconds = (first - second).total_seconds()
+    return int(seconds // {'week': 604800, 'day': 86400, 'hour': 3600, 'minute': 60, 'second': 1}[unit])
+
+
+def initcap(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    return re.sub(r'[A-Za-z0-9]+', lambda match: match.group(0).capitalize(), value)
+
+
+class Backend:
+    """An embedded database and the translation of MaxCompute SQL into its dialect."""
+
+    name = ''
+    # DDL column types that differ from MaxCompute's
+    types: Dict[str, str] = {}
+    # Function rewrites, by upper-case MaxCompute name
+    functions: Dict[str, Callable[[Translation, List[str]], str]] = {}
+
+    def translate(self, text: str, variables: Dict[str, str]) -> List[str]:
+        """SQL statements of this backend that perform one MaxCompute statement."""
+        translation = Translation(substitute(text, variables))
+        masked = translation.text
+        if CREATE_PATTERN.match(masked):
+            statements = [self._create(masked)]
+        elif INSERT_PATTERN.match(masked):
+            statements = self._insert(masked)
+        else:
+            statements = [masked]
+        return [translation.render(self._rewrite(translation, statement)) for statement in statements]
+
+    def _rewrite(self, translation: Translation, text: str) -> str:
+        return translation.rewrite_calls(text, self.functions)
+
+    def _column_type(self, column_type: str) -> str:
+        base = re.match(r'\w+', column_type).group(0).upper()
+        return self.types.get(base, column_type)
+
+    def _create(self, masked: str) -> str:
+        """CREATE TABLE with partition columns appended; COMMENT and LIFECYCLE dropped."""
+        match = CREATE_PATTERN.match(masked)
+        head = f"CREATE TABLE {match.group(1) or ''}{match.group(2)}"
+        rest = masked[match.end():]
+        if not rest.startswith('('):
+            # CREATE TABLE ... [LIFECYCLE n] AS SELECT
+            rest = re.sub(r'^(?:COMMENT\s+\x00\d+\x00\s*|LIFECYCLE\s+\d+\s*)*', '', rest, flags=re.IGNORECASE)
+            return f'{head} {rest}'
+        body, end = parenthesized(rest, 0)
+        columns = split_top_level(body)
+        partition = re.search(r'PARTITIONED\s+BY\s*(?=\()', rest[end:], re.IGNORECASE)
+        if partition:
+            columns += split_top_level(parenthesized(rest, end + partition.end())[0])
+        definitions = []
+        for column in columns:
+            column = re.sub(r'\s+COMMENT\s+\x00\d+\x00', '', column, flags=re.IGNORECASE)
+            name, column_type = column.split(None, 1)
+            definitions.append(f'{name} {self._column_type(column_type.strip())}')
+        return f"{head} ({', '.join(definitions)})"
+
+    def _insert(self, masked: str) -> List[str]:
+        """INSERT OVERWRITE/INTO ... PARTITION as a partition delete and an INSERT INTO."""
+        match = INSERT_PATTERN.match(masked)
+        overwrite, table = match.group(1).upper() == 'OVERWRITE', match.group(2)
+        rest = masked[match.end():]
+        static_values, conditions, spec = [], [], []
+        if match.group(3):
+            inner, end = parenthesized(rest, 0)
+            spec, rest = split_top_level(inner), rest[end:]
+        for part in spec:
+            if '=' not in part:
+                raise EngineError(f'Dynamic partition {part} is not supported; use PARTITION ({part} = ...)')
+            column, value = (piece.strip() for piece in part.split('=', 1))
+            static_values.append(value)
+            conditions.append(f'{column} = {value}')
+        statements = []
+        if overwrite:
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+            statements.append(f'DELETE FROM {table}{where}')
+        rest = rest.strip()
+        if static_values:
+            rest = f"SELECT *, {', '.join(static_values)} FROM ({rest}) AS partition_source"
+        statements.append(f'INSERT INTO {table} {rest}')
+        return statements
+
+    def execute(self, sql: str) -> Tuple[Optional[List[str]], List[tuple], int]:
+        """Column names (None for statements without a result), result rows and row count."""
+        raise NotImplementedError
+
+    def explain(self, sql: str) -> List[str]:
+        raise NotImplementedError
+
+    def load_table(self, schema: TableSchema, files: List[Tuple[str, Optional[str]]],
+                   default_ds: str) -> int:
+        raise NotImplementedError
+
+    def session(self) -> 'Backend':
+        """Another connection to the same database, for running statements on another thread."""
+        raise NotImplementedError
+
+    def interrupt(self):
+        """Abort the running statement from another thread."""
+        self.connection.interrupt()
+
+    def close(self):
+        self.connection.close()
+
+
+def _cast_sqlite(translation: Translation, arguments: List[str]) -> str:
+    match = CAST_PATTERN.match(arguments[0])
+    if not match:
+        raise EngineError(f'Invalid CAST({translation.render(arguments[0])})')
+    value, target = match.group(1), match.group(2).upper()
+    if target in ('DATETIME', 'TIMESTAMP', 'DATE'):
+        return f'datetime({value})'
+    return f'CAST({value} AS {SqliteBackend.types.get(target, target)})'
+
+
+def _date_format_sqlite(translation: Translation, arguments: List[str]) -> str:
+    pattern = java_date_format(translation.require(arguments[1], 'DATE_FORMAT'))
+    return f'strftime({translation.literal(pattern)}, {arguments[0]})'
+
+
+class StandardDeviation:
+    """STDDEV (population) or STDDEV_SAMP, as an aggregate and window function."""
+
+    ddof = 0
+
+    def __init__(self):
+        self.count, self.total, self.squares = 0, 0.0, 0.0
+
+    def step(self, value):
+        if value is not None:
+            self.count += 1
+            self.total += value
+            self.squares += value * value
+
+    def inverse(self, value):
+        if value is not None:
+            self.count -= 1
+            self.total -= value
+            self.squares -= value * value
+
+    def value(self):
+        if self.count <= self.ddof:
+            return None
+        mean = self.total / self.count
+        return math.sqrt(max(self.squares / self.count - mean * mean, 0.0) * self.count
+                         / (self.count - self.ddof))
+
+    finalize = value
+
+
+class SampleStandardDeviation(StandardDeviation):
+    ddof = 1
+
+
+class Percentile:
+    """PERCENTILE(column, p): exact, interpolated between the nearest values."""
+
+    def __init__(self):
+        self.values, self.share, self.ordered = [], None, None
+
+    def step(self, value, share):
+        if value is not None:
+            self.values.append(value)
+            self.share, self.ordered = share, None
+
+    def inverse(self, value, share):
+        if value is not None:
+            self.values.remove(value)
+            self.ordered = None
+
+    def value(self):
+        if not self.values:
+            return None
+        if self.ordered is None:
+            self.ordered = sorted(self.values)
+        position = self.share * (len(self.ordered) - 1)
+        lower = math.floor(position)
+        upper = min(lower + 1, len(self.ordered) - 1)
+        return self.ordered[lower] + (self.ordered[upper] - self.ordered[lower]) * (position - lower)
+
+    finalize = value
+
+
+def _datetime_function(function: Callable) -> Callable:
+    """Wrap a function of datetimes for SQLite, where DATETIME values are text."""
+    def wrapper(value, *arguments):
+        if value is None:
+            return None
+        result = function(parse_datetime(value), *arguments)
+        return format_datetime(result) if isinstance(result, datetime) else result
+    return wrapper
+
+
+def _datediff(first, second, unit='dd'):
+    if first is None or second is None:
+        return None
+    return datetime_difference(parse_datetime(first), parse_datetime(second), date_unit(unit))
+
+
+def _regexp_replace(value, pattern, replacement, occurrence=0):
+    if value is None or pattern is None or replacement is None:
+        return None
+    replacement = re.sub(r'\$(\d)', r'\\g<\1>', replacement)
+    return re.sub(pattern, replacement, value, count=max(int(occurrence), 0))
+
+
+def _concat(*values):
+    return None if any(value is None for value in values) else ''.join(str(value) for value in values)
+
+
+def _concat_ws(separator, *values):
+    if separator is None:
+        return None
+    return separator.join(str(value) for value in values if value is not None)
+
+
+# Python implementations of MaxCompute functions SQLite lacks: name -> (function, arguments)
+SQLITE_FUNCTIONS = {
+    'getdate': (lambda: format_datetime(datetime.now()), 0),
+    'datetrunc': (_datetime_function(lambda value, unit: truncate_datetime(value, date_unit(unit))), 2),
+    'dateadd': (_datetime_function(lambda value, amount, unit: add_to_datetime(value, int(amount), date_unit(unit))), 3),
+    'datediff': (_datediff, -1),
+    'date_add': (shift_date, 2),
+    'date_sub': (lambda value, days: shift_date(value, None if days is None else -int(days)), 2),
+    'year': (_datetime_function(lambda value: value.year), 1),
+    'month': (_datetime_function(lambda value: value.month), 1),
+    'day': (_datetime_function(lambda value: value.day), 1),
+    'dayofweek': (_datetime_function(lambda value: value.isoweekday() % 7 + 1), 1),
+    'initcap': (initcap, 1),
+    'concat': (_concat, -1),
+    'concat_ws': (_concat_ws, -1),
+    'regexp_replace': (_regexp_replace, -1),
+    'regexp': (lambda pattern, value: None if value is None or pattern is None
+               else re.search(pattern, str(value)) is not None, 2),
+}
+
+SQLITE_AGGREGATES = {
+    'stddev': (StandardDeviation, 1),
+    'stddev_pop': (StandardDeviation, 1),
+    'stddev_samp': (SampleStandardDeviation, 1),
+    'percentile': (Percentile, 2),
+}
+
+
+class SqliteBackend(Backend):
+    """SQLite from the standard library; MaxCompute functions it lacks run in Python."""
+
+    name = 'sqlite'
+    types = {
+        'STRING': 'TEXT', 'VARCHAR': 'TEXT', 'CHAR': 'TEXT',
+        'DATETIME': 'TEXT', 'TIMESTAMP': 'TEXT', 'DATE': 'TEXT',
+        'BIGINT': 'INTEGER', 'INT': 'INTEGER', 'SMALLINT': 'INTEGER', 'TINYINT': 'INTEGER',
+        'BOOLEAN': 'INTEGER', 'DOUBLE': 'REAL', 'FLOAT': 'REAL', 'DECIMAL': 'REAL',
+    }
+    functions = {
+        'CAST': _cast_sqlite,
+        'DATE_FORMAT': _date_format_sqlite,
+    }
+
+    def __init__(self, database: str = ':memory:'):
+        self.database = database
+        # Connections of parallel workflow nodes wait for each other's writes
+        self.connection = sqlite3.connect(database, isolation_level=None, timeout=600)
+        if database != ':memory:':
+            self.connection.execute('PRAGMA journal_mode = WAL')
+        for name, (function, arguments) in SQLITE_FUNCTIONS.items():
+            self.connection.create_function(name, arguments, function)
+        for name, (aggregate, arguments) in SQLITE_AGGREGATES.items():
+            if hasattr(self.connection, 'create_window_function'):
+                self.connection.create_window_function(name, arguments, aggregate)
+            else:
+                self.connection.create_aggregate(name, arguments, aggregate)
+
+    def session(self) -> 'SqliteBackend':
+        # A connection of its own: sqlite3 connections stay on the thread that made them
+        return SqliteBackend(self.database)
+
+    def _rewrite(self, translation: Translation, text: str) -> str:
+        text = re.sub(r'\bRLIKE\b', 'REGEXP', text, flags=re.IGNORECASE)
+        return super()._rewrite(translation, text)
+
+    def execute(self, sql: str) -> Tuple[Optional[List[str]], List[tuple], int]:
+        cursor = self.connection.execute(sql)
+        if cursor.description is None:
+            return None, [], cursor.rowcount
+        rows = cursor.fetchall()
+        return [column[0] for column in cursor.description], rows, len(rows)
+
+    def explain(self, sql: str) -> List[str]:
+        return [detail for *_, detail in self.connection.execute(f'EXPLAIN QUERY PLAN {sql}')]
+
+    def load_table(self, schema: TableSchema, files: List[Tuple[str, Optional[str]]],
+                   default_ds: str) -> int:
+        converters = [CSV_CONVERTERS.get(column_type) for _, column_type in schema.columns]
+        width = len(schema.columns) + (1 if schema.partitioned else 0)
+        insert = f"INSERT INTO {schema.name} VALUES ({', '.join('?' * width)})"
+        partition_of = self._partition_function(schema, default_ds)
+        rows = 0
+        for path, ds in files:
+            with open_csv(path) as csv_file:
+                reader = csv.reader(csv_file)
+                positions = column_positions(schema, next(reader, []))
+
+                def converted(reader=reader, positions=positions, ds=ds):
+                    for record in reader:
+                        values = [None if position is None or position >= len(record) or record[position] == ''
+                                  else convert(record[position]) if convert else record[position]
+                                  for position, convert in zip(positions, converters)]
+                        if schema.partitioned:
+                            values.append(ds or partition_of(values))
+                        yield values
+
+                rows += self.connection.executemany(insert, converted()).rowcount
+        return rows
+
+    def _partition_function(self, schema: TableSchema, default_ds: str) -> Callable[[list], str]:
+        names = schema.column_names
+        if schema.name in PARTITION_SOURCES:
+            position = names.index(PARTITION_SOURCES[schema.name])
+            return lambda values: to_ds(values[position]) if values[position] else default_ds
+        if schema.name == 'order_items' and 'order_id' in names:
+            order_ds = dict(self.connection.execute('SELECT order_id, ds FROM orders'))
+            position = names.index('order_id')
+            return lambda values: order_ds.get(values[position], default_ds)
+        return lambda values: default_ds
+
+
+def _duckdb_call(name: str) -> Callable[[Translation, List[str]], str]:
+    return lambda translation, arguments: f"{name}({', '.join(arguments)})"
+
+
+def _duckdb_timestamp(argument: str) -> str:
+    return f'CAST({argument} AS TIMESTAMP)'
+
+
+def _date_format_duckdb(translation: Translation, arguments: List[str]) -> str:
+    pattern = java_date_format(translation.require(arguments[1], 'DATE_FORMAT'))
+    return f'strftime({_duckdb_timestamp(arguments[0])}, {translation.literal(pattern)})'
+
+
+def _datetrunc_duckdb(translation: Translation, arguments: List[str]) -> str:
+    unit = date_unit(translation.require(arguments[1], 'DATETRUNC'))
+    return f'date_trunc({translation.literal(unit)}, {_duckdb_timestamp(arguments[0])})'
+
+
+def _datediff_duckdb(translation: Translation, arguments: List[str]) -> str:
+    unit = date_unit(translation.require(arguments[2], 'DATEDIFF') if len(arguments) > 2 else 'dd')
+    return (f'date_diff({translation.literal(unit)}, {_duckdb_timestamp(arguments[1])}, '
+            f'{_duckdb_timestamp(arguments[0])})')
+
+
+def _dateadd_duckdb(translation: Translation, arguments: List[str]) -> str:
+    unit = date_unit(translation.require(arguments[2], 'DATEADD'))
+    if unit == 'quarter':
+        return f'({_duckdb_timestamp(arguments[0])} + to_months(3 * CAST({arguments[1]} AS INTEGER)))'
+    return f'({_duckdb_timestamp(arguments[0])} + to_{unit}s(CAST({arguments[1]} AS INTEGER)))'
+
+
+def _date_shift_duckdb(name: str) -> Callable[[Translation, List[str]], str]:
+    return lambda translation, arguments: (f'{name}(CAST({arguments[0]} AS VARCHAR), '
+                                           f'CAST({arguments[1]} AS BIGINT))')
+
+
+def _datetime_part_duckdb(expression: str) -> Callable[[Translation, List[str]], str]:
+    return lambda translation, arguments: expression.format(_duckdb_timestamp(arguments[0]))
+
+
+class DuckdbBackend(Backend):
+    """DuckDB: columnar and vectorized; most MaxCompute functions map onto built-ins."""
+
+    name = 'duckdb'
+    functions = {
+        'GETDATE': lambda translation, arguments: 'CAST(now() AS TIMESTAMP)',
+        'DATE_FORMAT': _date_format_duckdb,
+        'DATETRUNC': _datetrunc_duckdb,
+        'DATEDIFF': _datediff_duckdb,
+        'DATEADD': _dateadd_duckdb,
+        'DATE_ADD': _date_shift_duckdb('mc_date_add'),
+        'DATE_SUB': _date_shift_duckdb('mc_date_sub'),
+        'YEAR': _datetime_part_duckdb('year({})'),
+        'MONTH': _datetime_part_duckdb('month({})'),
+        'DAY': _datetime_part_duckdb('day({})'),
+        'DAYOFWEEK': _datetime_part_duckdb('(dayofweek({}) + 1)'),
+        # MaxCompute CONCAT is NULL when any argument is; DuckDB's skips NULLs
+        'CONCAT': lambda translation, arguments: f"({' || '.join(arguments)})",
+        'REGEXP_REPLACE': lambda translation, arguments: (
+            f"regexp_replace({', '.join(arguments[:3])}, {translation.literal('g')})"),
+        'INITCAP': _duckdb_call('mc_initcap'),
+        'STDDEV': _duckdb_call('stddev_pop'),
+        'PERCENTILE': _duckdb_call('quantile_cont'),
+    }
+
+    # SQL macros rather than Python UDFs: those need numpy, and differ between
+    # duckdb releases. Temporary macros belong to one connection, so
+    # connections to the same database file never clash over them.
+    macros = [
+        # initcap: each run of ASCII letters and digits capitalized
+        r"""CREATE OR REPLACE TEMP MACRO mc_initcap(value) AS
+            array_to_string(list_transform(range(1, length(value) + 1), i ->
+                CASE WHEN NOT regexp_full_match(value[i], '[A-Za-z0-9]') THEN value[i]
+                     WHEN i > 1 AND regexp_full_match(value[i - 1], '[A-Za-z0-9]') THEN lower(value[i])
+                     ELSE upper(value[i]) END), '')""",
+        # shift_date: YYYYMMDD stays YYYYMMDD, anything else becomes YYYY-MM-DD
+        r"""CREATE OR REPLACE TEMP MACRO mc_date_add(value, days) AS
+            CASE WHEN regexp_full_match(value, '[0-9]{8}')
+                 THEN strftime(strptime(value, '%Y%m%d') + to_days(CAST(days AS INTEGER)), '%Y%m%d')
+                 ELSE strftime(CAST(value AS TIMESTAMP) + to_days(CAST(days AS INTEGER)), '%Y-%m-%d') END""",
+        'CREATE OR REPLACE TEMP MACRO mc_date_sub(value, days) AS mc_date_add(value, -days)',
+    ]
+
+    def __init__(self, database: str = ':memory:', connection=None):
+        self.connection = duckdb.connect(database) if connection is None else connection
+        for macro in self.macros:
+            self.connection.execute(macro)
+
+    def session(self) -> 'DuckdbBackend':
+        # A cursor shares the open database instead of attaching the file again
+        return DuckdbBackend(connection=self.connection.cursor())
+
+    def _rewrite(self, translation: Translation, text: str) -> str:
+        # RLIKE on a column: MaxCompute matches anywhere in the value, like regexp_matches
+        text = re.sub(r'([\w."]+)\s+(NOT\s+)?RLIKE\s+(\x00\d+\x00)',
+                      lambda match: f"{match.group(2) or ''}regexp_matches({match.group(1)}, {match.group(3)})",
+                      text, flags=re.IGNORECASE)
+        return super()._rewrite(translation, text)
+
+    def execute(self, sql: str) -> Tuple[Optional[List[str]], List[tuple], int]:
+        cursor = self.connection.execute(sql)
+        if cursor.description is None:
+            return None, [], -1
+        rows = cursor.fetchall()
+        columns = [column[0] for column in cursor.description]
+        # DML returns its row count as a single "Count" row
+        if columns == ['Count'] and re.match(r'\s*(INSERT|DELETE|UPDATE)\b', sql, re.IGNORECASE):
+            return None, [], rows[0][0] if rows else 0
+        return columns, rows, len(rows)
+
+    def explain(self, sql: str) -> List[str]:
+        return [line for _, plan in self.connection.execute(f'EXPLAIN {sql}').fetchall()
+                for line in plan.splitlines()]
+
+    def load_table(self, schema: TableSchema, files: List[Tuple[str, Optional[str]]],
+                   default_ds: str) -> int:
+        rows = 0
+        for path, ds in files:
+            with open_csv(path) as csv_file:
+                header = next(csv.reader(csv_file), [])
+            positions = column_positions(schema, header)
+            expressions = [
+                'NULL' if position is None else
+                f"TRY_CAST(NULLIF(src.\"{header[position]}\", '') AS {column_type})"
+                for position, (_, column_type) in zip(positions, schema.columns)]
+            quoted_path = path.replace("'", "''")
+            source, join = f"read_csv('{quoted_path}', header = true, all_varchar = true) AS src", ''
+            if schema.partitioned:
+                if ds:
+                    expressions.append(f"'{ds}'")
+                elif schema.name in PARTITION_SOURCES and PARTITION_SOURCES[schema.name] in header:
+                    expressions.append(f"COALESCE(strftime(TRY_CAST(src.\"{PARTITION_SOURCES[schema.name]}\" "
+                                       f"AS TIMESTAMP), '%Y%m%d'), '{default_ds}')")
+                elif schema.name == 'order_items' and 'order_id' in header:
+                    join = (' LEFT JOIN (SELECT order_id, MIN(ds) AS ds FROM orders GROUP BY order_id) '
+                            'AS parent ON parent.order_id = src.order_id')
+                    expressions.append(f"COALESCE(parent.ds, '{default_ds}')")
+                else:
+                    expressions.append(f"'{default_ds}'")
+            sql = f"INSERT INTO {schema.name} SELECT {', '.join(expressions)} FROM {source}{join}"
+            rows += self.connection.execute(sql).fetchone()[0]
+        return rows
+
+
+BACKENDS = {'sqlite': SqliteBackend, 'duckdb': DuckdbBackend}
+
+
+def open_backend(name: str = 'auto', database: str = ':memory:') -> Backend:
+    """The named backend; ``auto`` is DuckDB when installed, else SQLite."""
+    if name == 'auto':
+        name = 'duckdb' if duckdb is not None else 'sqlite'
+    if name == 'duckdb' and duckdb is None:
+        raise ImportError('The duckdb backend needs duckdb (pip install duckdb)')
+    return BACKENDS[name](database)
+
+
+def open_csv(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def column_positions(schema: TableSchema, header: Sequence[str]) -> List[Optional[int]]:
+    """Position in the CSV header of every schema column, None when it is missing."""
+    lookup = {name.strip().lower(): index for index, name in enumerate(header)}
+    return [lookup.get(name.lower()) for name in schema.column_names]
+
+
+def table_files(data_dir: str, table: str) -> List[Tuple[str, Optional[str]]]:
+    """CSV files of ``table`` in ``data_dir``, with the ds of their ds= directory."""
+    files = []
+    for name in (table, f'{table}_generated'):
+        for extension in ('.csv', '.csv.gz'):
+            path = os.path.join(data_dir, name + extension)
+            if os.path.isfile(path):
+                files.append((path, None))
+        directory = os.path.join(data_dir, name)
+        for root, directories, filenames in os.walk(directory):
+            directories.sort()
+            partition = re.search(r'(?:^|[\\/])ds=(\w+)', os.path.relpath(root, directory))
+            for filename in sorted(filenames):
+                if filename.endswith(('.csv', '.csv.gz')):
+                    files.append((os.path.join(root, filename), partition.group(1) if partition else None))
+    return files
+
+
+def schema_ddl(schema: TableSchema) -> str:
+    ddl = f"CREATE TABLE {schema.name} ({', '.join(f'`{n}` {t}' for n, t in schema.columns)})"
+    if schema.partitioned:
+        ddl += f" PARTITIONED BY ({', '.join(f'{n} {t}' for n, t in schema.partition_columns)})"
+    return ddl
+
+
+class Engine:
+    """Loads the source tables and runs scripts, timing every statement."""
+
+    def __init__(self, backend: Backend, variables: Dict[str, str], show_rows: int = 5,
+                 explain: bool = False, show_sql: bool = False, fail_fast: bool = False):
+        self.backend = backend
+        self.variables = variables
+        self.show_rows = show_rows
+        self.explain = explain
+        self.show_sql = show_sql
+        self.fail_fast = fail_fast
+        self.errors = 0
+
+    def load(self, data_dir: str, ddl_path: str = DEFAULT_DDL, default_ds: str = None):
+        """Create the tables of the DDL script and load their CSV files from ``data_dir``."""
+        default_ds = default_ds or self.variables['bizdate']
+        print(f"Loading {data_dir} into {self.backend.name} (ds {default_ds} where rows have none)")
+        for schema in load_schemas(ddl_path).values():
+            for sql in [f'DROP TABLE IF EXISTS {schema.name}',
+                        *self.backend.translate(schema_ddl(schema), self.variables)]:
+                self.backend.execute(sql)
+            files = table_files(data_dir, schema.name)
+            if not files:
+                continue
+            started = time.perf_counter()
+            rows = self.backend.load_table(schema, files, default_ds)
+            elapsed = time.perf_counter() - started
+            print(f"  {schema.name:<20} {rows:>12,} rows from {len(files)} file(s) in {elapsed:.3f}s")
+
+    def run_script(self, path: str, sections: Optional[List[str]] = None) -> float:
+        """Run the (selected sections of the) script; returns the seconds spent executing."""
+        with open(path, 'r', encoding='utf-8') as script_file:
+            statements = split_script(script_file.read(), os.path.basename(path))
+        print(f"\n== {os.path.basename(path)} ==")
+        total, section, section_time = 0.0, object(), 0.0
+        for statement in statements:
+            if sections is not None and not section_selected(statement.section, sections):
+                continue
+            if statement.section != section:
+                if section_time:
+                    print(f"   {section_time:9.3f}s  section total")
+                section, section_time = statement.section, 0.0
+                print(f"-- {section or '(before the first section)'}")
+            elapsed = self.run_statement(statement)
+            section_time += elapsed
+            total += elapsed
+        if section_time:
+            print(f"   {section_time:9.3f}s  section total")
+        return total
+
+    def run_statement(self, statement: Statement) -> float:
+        """Translate and execute one statement, printing its time, rows and plan."""
+        elapsed = 0.0
+        rows = None
+        try:
+            for sql in self.backend.translate(statement.text, self.variables):
+                if self.show_sql:
+                    print('\n'.join(f'      | {line}' for line in sql.splitlines()))
+                if self.explain and re.match(r'\s*(SELECT|WITH|INSERT|DELETE|UPDATE)\b', sql, re.IGNORECASE):
+                    for line in self.backend.explain(sql):
+                        print(f'      > {line}')
+                started = time.perf_counter()
+                columns, result, count = self.backend.execute(sql)
+                elapsed += time.perf_counter() - started
+                if columns is not None or count >= 0:
+                    rows = count
+        except (EngineError, sqlite3.Error, *((duckdb.Error,) if duckdb else ())) as error:
+            self.errors += 1
+            print(f"   {'ERROR':>9}   {statement.description} "
+                  f"({statement.script}:{statement.line}): {str(error).splitlines()[0]}")
+            if self.fail_fast:
+                raise
+            return elapsed
+        suffix = f'  {rows:,} rows' if rows is not None else ''
+        print(f"   {elapsed:9.3f}s  {statement.description}{suffix}")
+        if columns is not None and self.show_rows:
+            print_rows(columns, result[:self.show_rows])
+        return elapsed
+
+
+def section_selected(section: Optional[str], selected: List[str]) -> bool:
+    """Whether a section matches any --section value: its number or part of its title."""
+    if section is None:
+        return False
+    number = section.split('.', 1)[0]
+    return any(value == number or value.lower() in section.lower() for value in selected)
+
+
+def print_rows(columns: List[str], rows: List[tuple]):
+    widths = [min(max([len(str(column))] + [len(str(row[index])) for row in rows]), 40)
+              for index, column in enumerate(columns)]
+    print('      ' + '  '.join(str(column)[:40].ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('      ' + '  '.join(str(value)[:40].ljust(width) for value, width in zip(row, widths)))
+
+
+def parse_variable(text: str) -> Tuple[str, str]:
+    name, separator, value = text.partition('=')
+    if not separator or not re.match(r'^\w+$', name):
+        raise argparse.ArgumentTypeError(f'Invalid --var {text!r}: expected name=value')
+    return name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run MaxCompute SQL scripts on a local embedded database')
+    parser.add_argument('scripts', nargs='+', help='SQL scripts to run, in order')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--bizdate', default=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'),
+                        help='Value of ${bizdate}, and the ds of rows without one (default: yesterday)')
+    parser.add_argument('--var', type=parse_variable, action='append', default=[],
+                        help='Another ${name} parameter as name=value (repeatable)')
+    parser.add_argument('--backend', choices=['auto', *BACKENDS], default='auto',
+                        help='Embedded database (default: duckdb when installed, else sqlite)')
+    parser.add_argument('--database', default=':memory:',
+                        help='Database file, to keep tables between runs (default: in memory)')
+    parser.add_argument('--no-load', action='store_true',
+                        help='Do not create and load the source tables (use those in --database)')
+    parser.add_argument('--section', action='append',
+                        help='Only run sections with this number or title text (repeatable)')
+    parser.add_argument('--show-rows', type=int, default=5,
+                        help='Result rows to print for queries (default: 5)')
+    parser.add_argument('--explain', action='store_true', help='Print the query plan of every statement')
+    parser.add_argument('--show-sql', action='store_true', help='Print the translated SQL')
+    parser.add_argument('--fail-fast', action='store_true', help='Stop at the first failing statement')
+    args = parser.parse_args()
+
+    if not re.match(r'^\d{8}$', args.bizdate):
+        parser.error('--bizdate must be YYYYMMDD')
+    variables = dict(args.var, bizdate=args.bizdate)
+    backend = open_backend(args.backend, args.database)
+    engine = Engine(backend, variables, args.show_rows, args.explain, args.show_sql, args.fail_fast)
+    try:
+        if not args.no_load:
+            engine.load(args.data_dir)
+        total = sum(engine.run_script(path, args.section) for path in args.scripts)
+    finally:
+        backend.close()
+    print(f"\nRan {len(args.scripts)} script(s) on {backend.name} in {total:.3f}s, "
+          f"{engine.errors} failed statement(s)")
+    if engine.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Incremental rolling-baseline outlier detection across ds partitions
+
+The outlier check of sql/06_data_quality.sql section 5 recomputes AVG, STDDEV,
+PERCENTILE and PERCENT_RANK over the whole orders table every day, so its cost
+grows with history. This detector keeps a small persisted summary per ds
+partition instead: the Welford moments and KLL quantile sketch of the column
+(sketches.py). Scoring a day reads only that day's partition; its baseline is
+the merge of the summaries of the --window days before it, and the day's own
+summary is saved for the days after.
+
+Each value is scored like the SQL check, against the baseline:
+    z_score           (value - mean) / std_dev
+    percentile_rank   fraction of baseline values below it
+    fences            q1 - 1.5 IQR and q3 + 1.5 IQR from baseline quartiles
+Rows with |z| > 2 or outside the fences become data_outliers rows with the
+same outlier_type (STATISTICAL, IQR_OUTLIER) and severity (HIGH, MEDIUM, LOW)
+rules, written to <output-dir>/data_outliers/ds=<ds>/part-00000.csv.
+
+State files are <state-dir>/<table>.<ds>.json, the partial profile format of
+data_profiler.py, so ``data_profiler.py --by-ds --save-partials <state-dir>``
+seeds a baseline from history in one run. Reading only the new partition
+needs ds= partition directories (data_generator.py --partition-by-ds); with a
+single file per table, each day's rows are filtered from the whole file.
+
+Usage:
+    python outlier_detector.py --data-dir generated_data --ds 20240115 --output-dir generated_data
+    python outlier_detector.py --data-dir generated_data --all --window 7      # backfill day by day
+    python outlier_detector.py --data-dir generated_data --table products --column price --ds 20240115
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from data_profiler import NUMERIC_TYPES, ColumnProfile, TableProfile, partial_path
+from dq_engine import DQ_SCRIPT
+from local_engine import open_csv, table_files
+from output_writers import PARTITION_SOURCES, load_schemas, open_writer, to_ds
+
+
+class Baseline:
+    """Moments and quartiles of one column over the days before a partition."""
+
+    def __init__(self, column: ColumnProfile, days: List[str]):
+        self.days = days
+        self.count = column.moments.count
+        self.mean = column.moments.mean
+        self.std_dev = column.moments.std_dev
+        self.sketch = column.quantiles
+        q1, q3 = self.sketch.quantiles([0.25, 0.75])
+        self.lower_fence = q1 - 1.5 * (q3 - q1)
+        self.upper_fence = q3 + 1.5 * (q3 - q1)
+
+    def score(self, value: float) -> Tuple[Optional[float], float, bool]:
+        """z-score, percentile rank and whether ``value`` is outside the fences."""
+        z_score = (value - self.mean) / self.std_dev if self.std_dev else None
+        return z_score, self.sketch.rank(value), not self.lower_fence <= value <= self.upper_fence
+
+
+class StateStore:
+    """Per-ds column summaries in ``<directory>/<table>.<ds>.json``."""
+
+    def __init__(self, directory: str, table: str):
+        self.directory = directory
+        self.table = table
+
+    def path(self, ds: str) -> str:
+        return partial_path(self.directory, TableProfile(self.table, [], ds))
+
+    def load(self, ds: str) -> Optional[TableProfile]:
+        try:
+            with open(self.path(ds), 'r', encoding='utf-8') as state_file:
+                return TableProfile.from_dict(json.load(state_file))
+        except FileNotFoundError:
+            return None
+
+    def save(self, profile: TableProfile):
+        """Write the summaries of ``profile``, keeping other columns already stored for its ds."""
+        os.makedirs(self.directory, exist_ok=True)
+        stored = self.load(profile.ds)
+        if stored is not None and stored.rows == profile.rows:
+            stored.columns.update(profile.columns)
+            profile = stored
+        with open(self.path(profile.ds), 'w', encoding='utf-8') as state_file:
+            json.dump(profile.to_dict(), state_file)
+
+    def baseline(self, column: str, ds: str, window: int) -> Optional[Baseline]:
+        """Merged summaries of ``column`` over the ``window`` days before ``ds``."""
+        day = datetime.strptime(ds, '%Y%m%d')
+        merged, days = None, []
+        for offset in range(window, 0, -1):
+            previous = (day - timedelta(days=offset)).strftime('%Y%m%d')
+            profile = self.load(previous)
+            if profile is None or column not in profile.columns:
+                continue
+            days.append(previous)
+            if merged is None:
+                merged = profile.columns[column]
+            else:
+                merged.merge(profile.columns[column])
+        if merged is None or not merged.moments.count:
+            return None
+        return Baseline(merged, days)
+
+
+def partition_rows(data_dir: str, table: str, ds: str) -> Iterator[Tuple[dict, list]]:
+    """Header lookup and record of every row of ``table`` in partition ``ds``."""
+    files = table_files(data_dir, table)
+    partitioned = [(path, file_ds) for path, file_ds in files if file_ds is not None]
+    if partitioned:
+        files, event_column = [(path, file_ds) for path, file_ds in partitioned if file_ds == ds], None
+    elif table in PARTITION_SOURCES:
+        event_column = PARTITION_SOURCES[table]
+    else:
+        raise ValueError(f'{table} has no ds= directories and no event column to derive its ds from')
+    for path, _ in files:
+        with open_csv(path) as csv_file:
+            reader = csv.reader(csv_file)
+            lookup = {name.strip().lower(): index for index, name in enumerate(next(reader, []))}
+            event = lookup.get(event_column) if event_column else None
+            for record in reader:
+                if event is not None and (event >= len(record) or not record[event]
+                                          or to_ds(record[event]) != ds):
+                    continue
+                yield lookup, record
+
+
+def available_partitions(data_dir: str, table: str) -> List[str]:
+    files = table_files(data_dir, table)
+    partitions = {file_ds for _, file_ds in files if file_ds is not None}
+    if partitions or table not in PARTITION_SOURCES:
+        return sorted(partitions)
+    for path, _ in files:
+        with open_csv(path) as csv_file:
+            reader = csv.reader(csv_file)
+            header = [name.strip().lower() for name in next(reader, [])]
+            event = header.index(PARTITION_SOURCES[table])
+            partitions.update(to_ds(record[event]) for record in reader if event < len(record) and record[event])
+    return sorted(partitions)
+
+
+def score_partition(data_dir: str, table: str, columns: List[Tuple[str, str]], id_column: str, ds: str,
+                    store: StateStore, window: int, min_days: int, detected_at: datetime,
+                    log=print) -> List[tuple]:
+    """data_outliers rows of one partition; saves the partition's summaries."""
+    started = time.perf_counter()
+    baselines = {}
+    for name, _ in columns:
+        baseline = store.baseline(name, ds, window)
+        if baseline is None:
+            log(f"  {ds} {name}: no summaries in the {window} days before, summarizing only")
+        elif len(baseline.days) < min_days:
+            log(f"  {ds} {name}: {len(baseline.days)} of {min_days} baseline day(s) needed, summarizing only")
+        else:
+            baselines[name] = baseline
+    profile = TableProfile(table, columns, ds)
+    outliers = []
+    updates, positions, id_position, lookup_seen = None, None, None, None
+    for lookup, record in partition_rows(data_dir, table, ds):
+        if lookup is not lookup_seen:
+            lookup_seen = lookup
+            updates = [column.updater(lookup.get(name)) for name, column in profile.columns.items()]
+            positions = {name: lookup.get(name) for name, _ in columns}
+            id_position = lookup.get(id_column)
+        profile.rows += 1
+        for update in updates:
+            update(record)
+        for name, baseline in baselines.items():
+            position = positions[name]
+            if position is None or position >= len(record) or record[position] == '':
+                continue
+            try:
+                value = float(record[position])
+            except ValueError:
+                continue
+            z_score, percentile_rank, outside = baseline.score(value)
+            extreme = z_score is not None and abs(z_score) > 2
+            if not (extreme or outside):
+                continue
+            if z_score is not None and abs(z_score) > 3:
+                outlier_type, severity = 'STATISTICAL', 'HIGH'
+            else:
+                outlier_type = 'IQR_OUTLIER' if outside else 'BUSINESS_RULE'
+                severity = 'MEDIUM' if extreme else 'LOW'
+            record_id = record[id_position] if id_position is not None and id_position < len(record) else None
+            outliers.append((table, name, record_id, record[position], outlier_type, z_score, percentile_rank,
+                             f'Expected range: {round(baseline.lower_fence, 2)} - {round(baseline.upper_fence, 2)}',
+                             f'Rolling {window}-day Z-Score and IQR Analysis', severity, detected_at))
+    store.save(profile)
+    scored = ', '.join(f"{name} against {len(baseline.days)} day(s) of {baseline.count:,} values"
+                       for name, baseline in baselines.items())
+    log(f"  {ds}: {profile.rows:,} rows in {time.perf_counter() - started:.3f}s, {len(outliers)} outlier(s)"
+        + (f", {scored}" if scored else ''))
+    return outliers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score ds partitions for outliers against a rolling baseline')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--table', default='orders', help='Table to check (default: orders)')
+    parser.add_argument('--column', action='append',
+                        help='Numeric column to check (repeatable; default: total_amount)')
+    parser.add_argument('--id-column', help='Column reported as record_id (default: the first column)')
+    parser.add_argument('--ds', action='append',
+                        help='Partition to score (repeatable; default: yesterday)')
+    parser.add_argument('--all', action='store_true',
+                        help='Score every partition of the table in date order (backfill)')
+    parser.add_argument('--window', type=int, default=28, help='Baseline days before each partition (default: 28)')
+    parser.add_argument('--min-days', type=int, default=3,
+                        help='Baseline days needed before a partition is scored (default: 3)')
+    parser.add_argument('--state-dir', default=os.path.join('generated_data', 'outlier_state'),
+                        help='Directory of the per-ds summaries (default: generated_data/outlier_state)')
+    parser.add_argument('--output-dir', help='Write <dir>/data_outliers/ds=<ds>/part-00000.csv')
+    parser.add_argument('--show', type=int, default=10, help='Outliers to print per partition (default: 10)')
+    args = parser.parse_args()
+
+    table = args.table.lower()
+    schemas = load_schemas()
+    if table not in schemas:
+        parser.error(f'Unknown table {table}')
+    types = dict(schemas[table].columns)
+    names = [name.lower() for name in (args.column or ['total_amount'])]
+    for name in names:
+        if types.get(name) not in NUMERIC_TYPES:
+            parser.error(f'{table}.{name} is not a numeric column')
+    columns = [(name, types[name]) for name in names]
+    id_column = (args.id_column or schemas[table].column_names[0]).lower()
+    if args.all:
+        partitions = available_partitions(args.data_dir, table)
+    else:
+        partitions = sorted(set(args.ds or [(datetime.now() - timedelta(days=1)).strftime('%Y%m%d')]))
+    if not partitions:
+        parser.error(f'No partitions of {table} in {args.data_dir}')
+
+    print(f"\nScoring {len(partitions)} partition(s) of {table}.{'/'.join(names)} against "
+          f"{args.window}-day baselines in {args.state_dir}")
+    store = StateStore(args.state_dir, table)
+    detected_at = datetime.now().replace(microsecond=0)
+    outlier_schema = load_schemas(DQ_SCRIPT)['data_outliers']
+    try:
+        for ds in partitions:
+            outliers = score_partition(args.data_dir, table, columns, id_column, ds, store, args.window,
+                                       args.min_days, detected_at)
+            for row in sorted(outliers, key=lambda row: -abs(row[5] or 0))[:args.show]:
+                z_score = f'{row[5]:+.2f}' if row[5] is not None else '-'
+                print(f"      {row[2] or '':<14} {row[1]:<16} {row[3]:>12}  z {z_score:>7}  "
+                      f"rank {row[6]:.3f}  {row[4]:<12} {row[9]:<6} {row[7]}")
+            if args.output_dir:
+                directory = os.path.join(args.output_dir, 'data_outliers', f'ds={ds}')
+                os.makedirs(directory, exist_ok=True)
+                with open_writer('csv', os.path.join(directory, 'part-00000'), outlier_schema) as writer:
+                    writer.write_rows(outliers)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Pluggable output writers for generated data
+
+Writes generated rows as CSV (optionally gzip or zstd compressed), Parquet or
+ORC, with column types taken from the MaxCompute DDL in
+sql/01_create_tables.sql instead of being inferred on upload. Tables the DDL
+declares ``PARTITIONED BY (ds STRING)`` can be split into ``ds=YYYYMMDD``
+directories by event date, matching the partitions the ETL scripts read with
+``ds = '${bizdate}'``.
+
+Dependencies:
+- CSV and gzip: Python standard library only
+- zstd: zstandard (pip install zstandard)
+- Parquet and ORC: pyarrow (pip install pyarrow)
+
+Usage:
+    python data_generator.py --table all --records 100000 --format parquet --partition-by-ds
+    python data_generator.py --table orders --records 100000 --compression zstd --output-dir /data/upload
+"""
+
+import csv
+import gzip
+import io
+import mmap
+import os
+import re
+from array import array
+from collections import OrderedDict, defaultdict
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_DDL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'sql', '01_create_tables.sql')
+
+# Event-time column that decides a row's ds partition. order_items has no
+# date of its own and takes the ds of its parent order (see DsIndex).
+PARTITION_SOURCES = {
+    'orders': 'order_date',
+    'web_sessions': 'session_start',
+    'page_views': 'timestamp',
+    'user_events': 'event_timestamp',
+}
+
+CSV_EXTENSIONS = {None: '.csv', 'gzip': '.csv.gz', 'zstd': '.csv.zst'}
+
+
+class TableSchema:
+    """Columns and MaxCompute types of one table, as declared in the DDL."""
+
+    def __init__(self, name: str, columns: List[Tuple[str, str]],
+                 partition_columns: List[Tuple[str, str]] = None):
+        self.name = name
+        self.columns = columns
+        self.partition_columns = partition_columns or []
+
+    @property
+    def column_names(self) -> List[str]:
+        return [name for name, _ in self.columns]
+
+    @property
+    def partitioned(self) -> bool:
+        return bool(self.partition_columns)
+
+    def __repr__(self):
+        return f'TableSchema({self.name!r}, {len(self.columns)} columns)'
+
+
+def _parenthesized(text: str, start: int) -> Tuple[str, int]:
+    """Return the text inside the parentheses opening at ``text[start]`` and the end index."""
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] == '(':
+            depth += 1
+        elif text[index] == ')':
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:index], index + 1
+    raise ValueError('Unbalanced parentheses in DDL')
+
+
+def _column_definitions(body: str) -> List[Tuple[str, str]]:
+    """Parse ``name TYPE`` pairs from a column list, allowing types like DECIMAL(10,2)."""
+    return [(name, column_type.upper().replace(' ', ''))
+            for name, column_type in re.findall(r'`?(\w+)`?\s+(\w+(?:\s*\([^)]*\))?)', body)]
+
+
+def load_schemas(ddl_path: str = DEFAULT_DDL) -> Dict[str, TableSchema]:
+    """Read every ``CREATE TABLE`` statement in a DDL script."""
+    with open(ddl_path, 'r', encoding='utf-8') as ddl_file:
+        ddl = re.sub(r'--[^\n]*', '', ddl_file.read())
+
+    schemas = {}
+    for match in re.finditer(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*(?=\()',
+                             ddl, re.IGNORECASE):
+        body, end = _parenthesized(ddl, match.end())
+        partition_columns = []
+        partition = re.match(r'\s*(?:COMMENT\s+\'[^\']*\'\s*)?PARTITIONED\s+BY\s*(?=\()',
+                             ddl[end:], re.IGNORECASE)
+        if partition:
+            partition_body, _ = _parenthesized(ddl, end + partition.end())
+            partition_columns = _column_definitions(partition_body)
+        schemas[match.group(1)] = TableSchema(match.group(1), _column_definitions(body),
+                                              partition_columns)
+    return schemas
+
+
+_schemas = None
+
+
+def get_schema(table: str) -> TableSchema:
+    """Schema of ``table`` from the default DDL, parsed once per process."""
+    global _schemas
+    if _schemas is None:
+        _schemas = load_schemas()
+    if table not in _schemas:
+        raise KeyError(f'No CREATE TABLE for {table} in {DEFAULT_DDL}')
+    return _schemas[table]
+
+
+def to_ds(value: Any) -> str:
+    """``YYYYMMDD`` partition value of a datetime or ``YYYY-MM-DD ...`` string."""
+    if isinstance(value, datetime):
+        return f'{value.year:04d}{value.month:02d}{value.day:02d}'
+    return value[:10].replace('-', '')
+
+
+class DsIndex(Sequence):
+    """Partition (as a ``YYYYMMDD`` int) of every order, indexed by order number - 1.
+
+    Written by the orders pass and memory-mapped by order_items shards, so each
+    item can be routed to its parent order's ds without regenerating orders.
+    Pickles as its path.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._length = os.path.getsize(path) // 4
+        self._view = None
+        if self._length:
+            with open(path, 'rb') as index_file:
+                self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map).cast('I')
+
+    @staticmethod
+    def write(path: str, values: array):
+        with open(path, 'wb') as index_file:
+            values.tofile(index_file)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if self._view is None:
+            raise IndexError('DsIndex index out of range')
+        return self._view[index]
+
+    def __reduce__(self):
+        return (DsIndex, (self.path,))
+
+
+def partition_function(table: str, schema: TableSchema,
+                       ds_index: Optional[Sequence] = None) -> Callable[[Sequence], str]:
+    """Return a ``row -> ds`` function for a partitioned table."""
+    names = schema.column_names
+    if table in PARTITION_SOURCES:
+        position = names.index(PARTITION_SOURCES[table])
+        return lambda row: to_ds(row[position])
+    if table == 'order_items':
+        if ds_index is None:
+            raise ValueError('order_items partitions need the ds index of the orders pass')
+        position = names.index('order_id')
+        # Order IDs are sequential ORDnnnnnn keys
+        return lambda row: str(ds_index[int(row[position][3:]) - 1])
+    raise ValueError(f'No partition source for {table}')
+
+
+class DatetimeFormatter:
+    """``YYYY-MM-DD HH:MM:SS`` text of datetimes without a ``strftime`` per value.
+
+    The date part is formatted once per day seen and the time part comes from
+    a table of every second of the day, so formatting is two lookups and a
+    concatenation.
+    """
+
+    _times = None
+
+    def __init__(self):
+        self._dates = {}
+        if DatetimeFormatter._times is None:
+            DatetimeFormatter._times = [f'{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}'
+                                        for second in range(24 * 60 * 60)]
+
+    def __call__(self, value: datetime) -> str:
+        day = value.toordinal()
+        date = self._dates.get(day)
+        if date is None:
+            date = self._dates[day] = f'{value.year:04d}-{value.month:02d}-{value.day:02d} '
+        return date + self._times[value.hour * 3600 + value.minute * 60 + value.second]
+
+
+# Column types whose Python values need formatting before csv.writer sees them
+CSV_FORMATTERS = {
+    'DATETIME': DatetimeFormatter,
+    'TIMESTAMP': DatetimeFormatter,
+}
+
+
+def output_size(path: str) -> int:
+    """Bytes on disk of an output file, or of every file under an output directory."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(directory, name))
+                   for directory, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def throughput(rows: int, nbytes: int, seconds: float) -> str:
+    """``rows/s`` and ``MiB/s`` summary of a write."""
+    seconds = max(seconds, 1e-9)
+    return f'{rows / seconds:,.0f} rows/s, {nbytes / seconds / 2 ** 20:,.1f} MiB/s'
+
+
+class CsvWriter:
+    """CSV output, plain or compressed with gzip or zstd.
+
+    Rows are tuples in schema order. Only columns whose DDL type has an entry
+    in ``CSV_FORMATTERS`` are converted, a whole column per batch, and
+    everything else goes to ``csv.writer`` untouched through a large buffer.
+    """
+
+    buffer_size = 1 << 20
+
+    def __init__(self, path: str, schema: TableSchema, compression: Optional[str] = None,
+                 header: bool = True, append: bool = False):
+        if compression not in CSV_EXTENSIONS:
+            raise ValueError(f'Unsupported CSV compression: {compression}')
+        self.path = path + CSV_EXTENSIONS[compression]
+        self.rows_written = 0
+        self._formatters = [(position, CSV_FORMATTERS[column_type]())
+                            for position, (_, column_type) in enumerate(schema.columns)
+                            if column_type in CSV_FORMATTERS]
+        self._file = self._open(self.path, compression, 'a' if append else 'w')
+        self._writer = csv.writer(self._file)
+        if header and not append:
+            self._writer.writerow(schema.column_names)
+
+    def _open(self, path: str, compression: Optional[str], mode: str = 'w'):
+        # Appending adds a gzip member or zstd frame, which readers decode as one stream
+        if compression == 'gzip':
+            stream = gzip.open(path, mode + 'b')
+        elif compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError('zstd output requires zstandard: pip install zstandard')
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, mode + 'b'))
+        else:
+            return open(path, mode, newline='', encoding='utf-8', buffering=self.buffer_size)
+        return io.TextIOWrapper(io.BufferedWriter(stream, self.buffer_size),
+                                newline='', encoding='utf-8')
+
+    def write_rows(self, rows: Iterable[Sequence]):
+        if self._formatters:
+            self.write_columns(list(zip(*rows)))
+            return
+        rows = rows if isinstance(rows, list) else list(rows)
+        self._writer.writerows(rows)
+        self.rows_written += len(rows)
+
+    def write_columns(self, columns: List[Sequence]):
+        if not columns or not len(columns[0]):
+            return
+        columns = list(columns)
+        for position, formatter in self._formatters:
+            columns[position] = list(map(formatter, columns[position]))
+        self._writer.writerows(zip(*columns))
+        self.rows_written += len(columns[0])
+
+    def write_text_columns(self, columns: List[Sequence[str]]):
+        """Write columns of pre-formatted strings known not to need CSV quoting."""
+        lines = list(map(','.join, zip(*columns)))
+        if lines:
+            self._file.write('\r\n'.join(lines))
+            self._file.write('\r\n')
+        self.rows_written += len(lines)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ParquetWriter:
+    """Parquet output typed from the DDL, buffered into row groups."""
+
+    extension = '.parquet'
+
+    def __init__(self, path: str, schema: TableSchema, compression: Optional[str] = None,
+                 header: bool = True, row_group_size: int = 100000):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError(f'{type(self).__name__} requires pyarrow: pip install pyarrow')
+        self._pa = pa
+        self.path = path + self.extension
+        self.rows_written = 0
+        self.row_group_size = row_group_size
+        self._arrow_schema = pa.schema([(name, self._arrow_type(column_type))
+                                        for name, column_type in schema.columns])
+        self._buffer = [[] for _ in schema.columns]
+        self._buffered = 0
+        # Opened on the first flush, so partitions that stay under a row group
+        # only hold Python values rather than an open Arrow writer each
+        self._compression = compression
+        self._writer = None
+
+    def _arrow_type(self, column_type: str):
+        pa = self._pa
+        if column_type.startswith('DECIMAL'):
+            precision, scale = re.findall(r'\d+', column_type) or (38, 18)
+            return pa.decimal128(int(precision), int(scale))
+        return {
+            'STRING': pa.string(),
+            'VARCHAR': pa.string(),
+            'BIGINT': pa.int64(),
+            'INT': pa.int32(),
+            'DOUBLE': pa.float64(),
+            'FLOAT': pa.float32(),
+            'BOOLEAN': pa.bool_(),
+            'DATETIME': pa.timestamp('ms'),
+            'TIMESTAMP': pa.timestamp('ms'),
+            'DATE': pa.date32(),
+        }.get(re.sub(r'\(.*', '', column_type), pa.string())
+
+    def _open(self, compression: Optional[str]):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.path, self._arrow_schema,
+                                compression=compression or 'snappy')
+
+    def _write_table(self, table):
+        self._writer.write_table(table)
+
+    def write_rows(self, rows: Iterable[Sequence]):
+        rows = list(rows)
+        if rows:
+            self.write_columns(list(zip(*rows)))
+
+    def write_columns(self, columns: List[Sequence]):
+        for buffer, values in zip(self._buffer, columns):
+            buffer.extend(values)
+        self._buffered += len(columns[0]) if columns else 0
+        if self._buffered >= self.row_group_size:
+            self._flush()
+
+    write_text_columns = write_columns
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        pa = self._pa
+        arrays = []
+        for values, field in zip(self._buffer, self._arrow_schema):
+            # Python values (datetime, float, bool) and pre-formatted strings
+            # from the columnar engine are both cast to the DDL type
+            converted = pa.array(values)
+            if converted.type != field.type:
+                converted = converted.cast(field.type)
+            arrays.append(converted)
+        if self._writer is None:
+            self._writer = self._open(self._compression)
+        self._write_table(pa.Table.from_arrays(arrays, schema=self._arrow_schema))
+        self.rows_written += self._buffered
+        self._buffer = [[] for _ in self._buffer]
+        self._buffered = 0
+
+    def close(self):
+        self._flush()
+        if self._writer is None:
+            self._writer = self._open(self._compression)
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OrcWriter(ParquetWriter):
+    """ORC output typed from the DDL, buffered into stripes."""
+
+    extension = '.orc'
+
+    def _open(self, compression: Optional[str]):
+        import pyarrow.orc as orc
+        compression = {'gzip': 'zlib'}.get(compression, compression)
+        return orc.ORCWriter(self.path, compression=compression or 'zstd')
+
+    def _write_table(self, table):
+        self._writer.write(table)
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+    'orc': OrcWriter,
+}
+
+
+def file_extension(fmt: str, compression: Optional[str] = None) -> str:
+    """File extension a writer adds for ``fmt``/``compression``."""
+    if fmt == 'csv':
+        return CSV_EXTENSIONS[compression]
+    return WRITERS[fmt].extension
+
+
+def open_writer(fmt: str, path: str, schema: TableSchema,
+                compression: Optional[str] = None, header: bool = True):
+    """Open a writer for ``path`` (without extension) in the given format."""
+    if fmt not in WRITERS:
+        raise ValueError(f'Unsupported output format: {fmt}')
+    return WRITERS[fmt](path, schema, compression=compression, header=header)
+
+
+class PartitionedWriter:
+    """Route rows into ``<base_dir>/ds=YYYYMMDD/<filename>`` writers.
+
+    At most ``max_open`` writers stay open, so file handles and buffers stay
+    bounded however many days the rows span. The least recently written
+    partition is closed to make room; when it is written to again, a CSV
+    file is reopened for appending and Parquet/ORC continue in a new
+    ``<filename>-NNNNN`` file. ``ds_record``, when given, receives the ds of
+    every row in input order (used to build a DsIndex for orders).
+    """
+
+    def __init__(self, base_dir: str, filename: str, schema: TableSchema,
+                 partition_of: Callable[[Sequence], str], fmt: str = 'csv',
+                 compression: Optional[str] = None, header: bool = True,
+                 ds_record: Optional[array] = None, max_open: int = 64):
+        self.base_dir = self.path = base_dir
+        self.filename = filename
+        self.schema = schema
+        self.partition_of = partition_of
+        self.fmt = fmt
+        self.compression = compression
+        self.header = header
+        self.ds_record = ds_record
+        self.max_open = max(1, max_open)
+        # Open writers, least recently written first
+        self._writers = OrderedDict()
+        # Times each partition's writer has been opened
+        self._opened = defaultdict(int)
+        self._closed_rows = 0
+
+    @property
+    def rows_written(self) -> int:
+        return self._closed_rows + sum(writer.rows_written for writer in self._writers.values())
+
+    @property
+    def partitions(self) -> List[str]:
+        return sorted(self._opened)
+
+    def _writer(self, ds: str):
+        writer = self._writers.get(ds)
+        if writer is not None:
+            self._writers.move_to_end(ds)
+            return writer
+        if len(self._writers) >= self.max_open:
+            _, cold = self._writers.popitem(last=False)
+            cold.close()
+            self._closed_rows += cold.rows_written
+        directory = os.path.join(self.base_dir, f'ds={ds}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename)
+        reopened = self._opened[ds]
+        if not reopened:
+            writer = open_writer(self.fmt, path, self.schema, self.compression, self.header)
+        elif self.fmt == 'csv':
+            writer = CsvWriter(path, self.schema, self.compression, self.header, append=True)
+        else:
+            writer = open_writer(self.fmt, f'{path}-{reopened:05d}', self.schema, self.compression, self.header)
+        self._opened[ds] += 1
+        self._writers[ds] = writer
+        return writer
+
+    def write_rows(self, rows: Iterable[Sequence]):
+        buckets = defaultdict(list)
+        partition_of = self.partition_of
+        for row in rows:
+            ds = partition_of(row)
+            buckets[ds].append(row)
+            if self.ds_record is not None:
+                self.ds_record.append(int(ds))
+        for ds, bucket in buckets.items():
+            self._writer(ds).write_rows(bucket)
+
+    def write_columns(self, columns: List[Sequence]):
+        self.write_rows(zip(*columns))
+
+    write_text_columns = write_columns
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+            self._closed_rows += writer.rows_written
+        self._writers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Incremental rollup store for daily_sales_summary and product_performance
+
+Sections 1 and 3 of sql/05_etl_workflows.sql rebuild their figures from the
+fact tables on every run: daily_sales_summary scans orders and joins
+order_items back to orders twice more for its top category and top product,
+product_performance joins products, order_items and orders over all history,
+and any weekly or monthly report scans the same rows again. Here each ds of
+orders/order_items is read once and reduced to two small rollups:
+
+    items   (category, product_id, customer_bucket)  lines, quantity, revenue,
+            unit_price_sum, orders, customers, customer_sketch
+    orders  (order_status, customer_bucket)         orders, amount, customers,
+            customer_sketch
+
+stored as <store-dir>/ds=<ds>/{items,orders}.csv.gz with a manifest.json.
+Summaries of a day, ISO week or calendar month merge the rollups of its days
+instead of rescanning facts. Sums and order counts merge exactly (an order
+belongs to one ds and one customer). Distinct customers are exact for a
+single day; across days each row's customer_sketch, a HyperLogLog of its
+customers (--precision, sparse: only the registers they set), is merged
+per product or for completed orders, and the estimate kept between the
+largest daily count and the sum of the daily counts. customer_bucket (a
+hash partition of customer_id, --buckets) splits a cell's customers
+between rows; buckets are disjoint, so their sketches merge into the union.
+
+The manifest records the size and modification time of the source files a
+rollup was built from, so a run rebuilds only the days whose files changed
+(with ds= partitions, only those partitions' files). --rebuild recomputes a
+ds range outright, e.g. after restating products: categories are kept as of
+the build.
+
+Summaries are written in the daily_sales_summary and product_performance
+layouts to <output-dir>/<table>/ds=<ds>/part-00000.csv, with weekly_ and
+monthly_ tables (weekly_sales_summary, weekly_product_performance, ...) for
+the longer periods. Unlike section 3, product_performance covers the period
+rather than all history (--start widens it).
+
+Usage:
+    python rollup_store.py --data-dir generated_data --ds 20240115 --output-dir generated_data
+    python rollup_store.py --data-dir generated_data --ds 20240121 --period week --show 5
+    python rollup_store.py --data-dir generated_data --ds 20240131 --period month --rebuild --start 20240101
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from local_engine import open_csv, table_files
+from output_writers import load_schemas, open_writer, to_ds
+from sketches import HyperLogLog, hash64
+
+
+ETL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sql', '05_etl_workflows.sql')
+
+ITEM_COLUMNS = ['category', 'product_id', 'customer_bucket', 'lines', 'quantity', 'revenue',
+                'unit_price_sum', 'orders', 'customers', 'customer_sketch']
+ORDER_COLUMNS = ['order_status', 'customer_bucket', 'orders', 'amount', 'customers', 'customer_sketch']
+
+PERIOD_TABLES = {
+    'day': ('daily_sales_summary', 'product_performance'),
+    'week': ('weekly_sales_summary', 'weekly_product_performance'),
+    'month': ('monthly_sales_summary', 'monthly_product_performance'),
+}
+
+
+def customer_sketch(customers: Iterable[str], precision: int) -> str:
+    """Sparse HyperLogLog of a cell's ``customers``."""
+    sketch = HyperLogLog(precision)
+    for customer in customers:
+        sketch.add(customer)
+    return sketch.to_sparse()
+
+
+def distinct_count(daily: Dict[str, int], sketches: List[str], precision: int) -> int:
+    """Distinct customers over days with exact ``daily`` counts, from the union of their rows' ``sketches``."""
+    if len(daily) <= 1:
+        return sum(daily.values())
+    union = HyperLogLog(precision)
+    for sketch in sketches:
+        union.merge_sparse(sketch)
+    return min(max(union.estimate(), max(daily.values())), sum(daily.values()))
+
+
+def period_days(ds: str, period: str, start: Optional[str] = None) -> List[str]:
+    """Days of the ``period`` (day, ISO week or month) that contains ``ds``, or from ``start`` to ``ds``."""
+    day = datetime.strptime(ds, '%Y%m%d')
+    if start:
+        first = datetime.strptime(start, '%Y%m%d')
+    elif period == 'week':
+        first = day - timedelta(days=day.weekday())
+    elif period == 'month':
+        first = day.replace(day=1)
+    else:
+        first = day
+    if period == 'week' and not start:
+        last = first + timedelta(days=6)
+    elif period == 'month' and not start:
+        last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    else:
+        last = day
+    return [(first + timedelta(days=offset)).strftime('%Y%m%d') for offset in range((last - first).days + 1)]
+
+
+def _records(path: str) -> Iterable[Dict[str, str]]:
+    with open_csv(path) as csv_file:
+        reader = csv.reader(csv_file)
+        header = [name.strip().lower() for name in next(reader, [])]
+        for record in reader:
+            yield dict(zip(header, record))
+
+
+def _number(value: Optional[str]) -> float:
+    try:
+        return float(value) if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+def read_products(data_dir: str) -> Dict[str, Dict[str, str]]:
+    return {row['product_id']: row for path, _ in table_files(data_dir, 'products')
+            for row in _records(path) if row.get('product_id')}
+
+
+def _signature(paths: Iterable[str]) -> List[list]:
+    return [[path, os.path.getsize(path), os.stat(path).st_mtime_ns] for path in sorted(set(paths))]
+
+
+class RollupStore:
+    """Per-ds rollups in ``<directory>/ds=<ds>/``."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, ds: str, name: str) -> str:
+        return os.path.join(self.directory, f'ds={ds}', name)
+
+    def manifest(self, ds: str) -> Optional[dict]:
+        try:
+            with open(self.path(ds, 'manifest.json'), 'r', encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, ds: str, items: List[tuple], orders: List[tuple], manifest: dict):
+        os.makedirs(os.path.dirname(self.path(ds, 'manifest.json')), exist_ok=True)
+        for name, header, rows in (('items', ITEM_COLUMNS, items), ('orders', ORDER_COLUMNS, orders)):
+            with gzip.open(self.path(ds, f'{name}.csv.gz'), 'wt', encoding='utf-8', newline='') as rollup:
+                writer = csv.writer(rollup)
+                writer.writerow(header)
+                writer.writerows(rows)
+        # The manifest goes last: a rollup without one is rebuilt
+        with open(self.path(ds, 'manifest.json'), 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+    def read(self, ds: str, name: str) -> Iterable[Dict[str, str]]:
+        return _records(self.path(ds, f'{name}.csv.gz'))
+
+
+Sources = Dict[str, List[Tuple[str, Optional[str]]]]
+
+
+def source_files(data_dir: str, days: List[str]) -> Tuple[Sources, Sources]:
+    """orders and order_items files per day, with their ds: the day's ds= files, or the whole flat files."""
+    sources = {}
+    for table in ('orders', 'order_items'):
+        files = table_files(data_dir, table)
+        partitioned = any(file_ds is not None for _, file_ds in files)
+        sources[table] = {ds: [(path, file_ds) for path, file_ds in files if not partitioned or file_ds == ds]
+                          for ds in days}
+    return sources['orders'], sources['order_items']
+
+
+def build_rollups(days: List[str], buckets: int, precision: int, products: Dict[str, Dict[str, str]],
+                  order_sources: Sources, item_sources: Sources) -> Dict[str, Tuple[List[tuple], List[tuple], int]]:
+    """Items and orders rollups of ``days`` and the fact rows read, in one pass over each file."""
+    wanted = set(days)
+    order_index = {}
+    order_cells = {ds: {} for ds in days}
+    fact_rows = dict.fromkeys(days, 0)
+    for path, partition in sorted({source for ds in days for source in order_sources[ds]}):
+        # As the SQL, a ds= directory decides the ds; flat files take it from order_date
+        for row in _records(path):
+            ds = partition or (to_ds(row['order_date']) if row.get('order_date') else None)
+            if ds not in wanted or not row.get('order_id'):
+                continue
+            customer = row.get('customer_id') or ''
+            bucket = hash64(customer) % buckets
+            order_index[row['order_id']] = (ds, customer, bucket)
+            fact_rows[ds] += 1
+            cell = order_cells[ds].setdefault((row.get('order_status') or '', bucket), [0, 0.0, set()])
+            cell[0] += 1
+            cell[1] += _number(row.get('total_amount'))
+            cell[2].add(customer)
+
+    item_cells = {ds: {} for ds in days}
+    for path, _ in sorted({source for ds in days for source in item_sources[ds]}):
+        for row in _records(path):
+            order = order_index.get(row.get('order_id'))
+            if order is None:
+                continue
+            ds, customer, bucket = order
+            fact_rows[ds] += 1
+            product_id = row.get('product_id') or ''
+            category = products.get(product_id, {}).get('category') or ''
+            cell = item_cells[ds].setdefault((category, product_id, bucket), [0, 0, 0.0, 0.0, set(), set()])
+            cell[0] += 1
+            cell[1] += int(_number(row.get('quantity')))
+            cell[2] += _number(row.get('line_total'))
+            cell[3] += _number(row.get('unit_price'))
+            cell[4].add(row['order_id'])
+            cell[5].add(customer)
+
+    rollups = {}
+    for ds in days:
+        items = [(*key, lines, quantity, round(revenue, 4), round(unit_prices, 4), len(orders), len(customers),
+                  customer_sketch(customers, precision))
+                 for key, (lines, quantity, revenue, unit_prices, orders, customers)
+                 in sorted(item_cells[ds].items())]
+        orders = [(*key, count, round(amount, 4), len(customers), customer_sketch(customers, precision))
+                  for key, (count, amount, customers) in sorted(order_cells[ds].items())]
+        rollups[ds] = (items, orders, fact_rows[ds])
+    return rollups
+
+
+def refresh(store: RollupStore, data_dir: str, days: List[str], buckets: int, precision: int,
+            rebuild: bool = False, log=print) -> List[str]:
+    """Build the rollups of ``days`` that are missing, stale or (``rebuild``) all of them."""
+    order_sources, item_sources = source_files(data_dir, days)
+    stale = []
+    for ds in days:
+        signature = _signature(path for path, _ in order_sources[ds] + item_sources[ds])
+        manifest = store.manifest(ds)
+        if rebuild or manifest is None or manifest['sources'] != signature:
+            stale.append(ds)
+        elif manifest['buckets'] != buckets:
+            raise ValueError(f'ds {ds} was rolled up with {manifest["buckets"]} buckets, not {buckets}; '
+                             f'use --rebuild for the whole range')
+        elif manifest.get('precision') != precision:
+            raise ValueError(f'ds {ds} was rolled up with customer sketches of precision '
+                             f'{manifest.get("precision")}, not {precision}; use --rebuild for the whole range')
+    if not stale:
+        return []
+    started = time.perf_counter()
+    products = read_products(data_dir)
+    built_at = datetime.now().replace(microsecond=0).isoformat(sep=' ')
+    rollups = build_rollups(stale, buckets, precision, products, order_sources, item_sources)
+    for ds in stale:
+        items, orders, fact_rows = rollups[ds]
+        store.save(ds, items, orders, {
+            'ds': ds, 'buckets': buckets, 'precision': precision, 'built_at': built_at, 'fact_rows': fact_rows,
+            'item_rows': len(items), 'order_rows': len(orders),
+            'sources': _signature(path for path, _ in order_sources[ds] + item_sources[ds]),
+        })
+    facts = sum(rollup[2] for rollup in rollups.values())
+    cells = sum(len(rollup[0]) + len(rollup[1]) for rollup in rollups.values())
+    log(f"Rolled up {len(stale)} day(s) ({stale[0]}..{stale[-1]}): {facts:,} fact rows into "
+        f"{cells:,} rollup rows in {time.perf_counter() - started:.3f}s")
+    return stale
+
+
+def sales_summary(store: RollupStore, days: List[str], sales_date: str, precision: int) -> Optional[tuple]:
+    """daily_sales_summary row of ``days`` from their rollups; None without completed orders."""
+    orders, revenue = 0, 0.0
+    daily: Dict[str, int] = {}
+    sketches: List[str] = []
+    categories: Dict[str, float] = {}
+    products: Dict[str, float] = {}
+    for ds in days:
+        for row in store.read(ds, 'orders'):
+            if row['order_status'] != 'completed':
+                continue
+            orders += int(row['orders'])
+            revenue += float(row['amount'])
+            # Buckets are disjoint, so a day's distinct customers are the sum over them
+            daily[ds] = daily.get(ds, 0) + int(row['customers'])
+            sketches.append(row['customer_sketch'])
+        for row in store.read(ds, 'items'):
+            # As the SQL: top category and product over the day's items of any status
+            line_revenue = float(row['revenue'])
+            if row['category']:
+                categories[row['category']] = categories.get(row['category'], 0.0) + line_revenue
+            products[row['product_id']] = products.get(row['product_id'], 0.0) + line_revenue
+    if not orders:
+        return None
+    customers = distinct_count(daily, sketches, precision)
+    top = lambda totals: max(sorted(totals), key=totals.get) if totals else None
+    return (sales_date, orders, round(revenue, 2), customers, revenue / orders, top(categories), top(products))
+
+
+def product_performance(store: RollupStore, days: List[str], products: Dict[str, Dict[str, str]],
+                        analysis_date: datetime, precision: int) -> List[tuple]:
+    """product_performance rows of every product over ``days`` from their rollups."""
+    totals: Dict[str, list] = {}
+    for ds in days:
+        for row in store.read(ds, 'items'):
+            if row['product_id'] not in products:
+                continue
+            total = totals.setdefault(row['product_id'], [0, 0, 0.0, 0.0, 0, {}, []])
+            total[0] += int(row['lines'])
+            total[1] += int(row['quantity'])
+            total[2] += float(row['revenue'])
+            total[3] += float(row['unit_price_sum'])
+            total[4] += int(row['orders'])
+            total[5][ds] = total[5].get(ds, 0) + int(row['customers'])
+            total[6].append(row['customer_sketch'])
+    metrics = []
+    for product_id, product in products.items():
+        lines, quantity, revenue, unit_prices, orders, daily, sketches = totals.get(product_id,
+                                                                                  (0, 0, 0.0, 0.0, 0, {}, []))
+        cost = _number(product.get('cost'))
+        profit = revenue - quantity * cost if lines else 0.0
+        customers = distinct_count(daily, sketches, precision)
+        metrics.append([product_id, product.get('product_name'), product.get('category'), quantity,
+                        round(revenue, 2), round(profit, 2), profit / revenue * 100 if revenue > 0 else 0.0,
+                        orders, customers, unit_prices / lines if lines else 0.0])
+    metrics.sort(key=lambda metric: (-metric[4], metric[0]))
+    rows = []
+    for rank, metric in enumerate(metrics, 1):
+        if rank <= 5:
+            tier = 'Top Performer'
+        elif rank <= 20:
+            tier = 'Good Performer'
+        elif rank <= 50:
+            tier = 'Average Performer'
+        elif metric[4] > 0:
+            tier = 'Under Performer'
+        else:
+            tier = 'No Sales'
+        rows.append((*metric, rank, tier, analysis_date))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build per-ds sales rollups and summarize periods from them')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--store-dir', default=os.path.join('generated_data', 'rollups'),
+                        help='Directory of the per-ds rollups (default: generated_data/rollups)')
+    parser.add_argument('--ds', default=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'),
+                        help='Day in the period to summarize (default: yesterday)')
+    parser.add_argument('--period', choices=sorted(PERIOD_TABLES), default='day',
+                        help='Summarize the day, its ISO week or its month (default: day)')
+    parser.add_argument('--start', help='Summarize from this ds through --ds instead of a whole period')
+    parser.add_argument('--buckets', type=int, default=64,
+                        help='Customer buckets of the rollups (default: 64)')
+    parser.add_argument('--precision', type=int, default=14,
+                        help='HyperLogLog precision of the customer sketches, 4-18 (default: 14)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Recompute the rollups of every day in the period (backfill)')
+    parser.add_argument('--no-build', action='store_true',
+                        help='Only use stored rollups; do not read the fact tables')
+    parser.add_argument('--output-dir', help='Write <dir>/<summary table>/ds=<ds>/part-00000.csv')
+    parser.add_argument('--show', type=int, default=10, help='Products to print (default: 10)')
+    args = parser.parse_args()
+
+    try:
+        days = period_days(args.ds, args.period, args.start)
+    except ValueError:
+        parser.error('--ds and --start must be YYYYMMDD')
+    if not days:
+        parser.error('--start is after --ds')
+    if args.buckets < 1:
+        parser.error('--buckets must be at least 1')
+    if not 4 <= args.precision <= 18:
+        parser.error('--precision must be between 4 and 18')
+
+    store = RollupStore(args.store_dir)
+    sales_date = datetime.strptime(days[0], '%Y%m%d').strftime('%Y-%m-%d')
+    label = 'Range' if args.start else f'{args.period.capitalize()} of {args.ds}'
+    print(f"\n{label}: {days[0]}..{days[-1]} ({len(days)} day(s))")
+    try:
+        if not args.no_build:
+            built = refresh(store, args.data_dir, days, args.buckets, args.precision, args.rebuild)
+            if not built:
+                print("All rollups up to date")
+        missing = [ds for ds in days if store.manifest(ds) is None]
+        if missing:
+            print(f"No rollups for {len(missing)} day(s): {', '.join(missing)}")
+            days = [ds for ds in days if ds not in missing]
+        started = time.perf_counter()
+        products = read_products(args.data_dir)
+        summary = sales_summary(store, days, sales_date, args.precision) if days else None
+        performance = product_performance(store, days, products, datetime.now().replace(microsecond=0),
+                                          args.precision)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+    rollup_rows = sum(store.manifest(ds)['item_rows'] + store.manifest(ds)['order_rows'] for ds in days)
+    fact_rows = sum(store.manifest(ds)['fact_rows'] for ds in days)
+    print(f"Merged {rollup_rows:,} rollup rows (standing for {fact_rows:,} fact rows) "
+          f"in {time.perf_counter() - started:.3f}s")
+
+    if summary:
+        print(f"\n  {'sales_date':<12}{'orders':>8}{'revenue':>14}{'customers':>11}{'avg':>10}  top category / product")
+        print(f"  {summary[0]:<12}{summary[1]:>8,}{summary[2]:>14,.2f}{summary[3]:>11,}{summary[4]:>10.2f}  "
+              f"{summary[5]} / {summary[6]}")
+    else:
+        print("\n  No completed orders in the period")
+    if args.show:
+        print(f"\n  {'rank':>4}  {'product_id':<12}{'category':<14}{'quantity':>9}{'revenue':>12}"
+              f"{'margin %':>10}{'orders':>8}{'customers':>10}  tier")
+        for row in performance[:args.show]:
+            print(f"  {row[10]:>4}  {row[0]:<12}{(row[2] or '')[:13]:<14}{row[3]:>9,}{row[4]:>12,.2f}"
+                  f"{row[6]:>10.1f}{row[7]:>8,}{row[8]:>10,}  {row[11]}")
+
+    if args.output_dir:
+        schemas = load_schemas(ETL_SCRIPT)
+        summary_table, performance_table = (('range_sales_summary', 'range_product_performance') if args.start
+                                            else PERIOD_TABLES[args.period])
+        for table, schema, rows in ((summary_table, schemas['daily_sales_summary'], [summary] if summary else []),
+                                    (performance_table, schemas['product_performance'], performance)):
+            directory = os.path.join(args.output_dir, table, f'ds={args.ds}')
+            os.makedirs(directory, exist_ok=True)
+            with open_writer('csv', os.path.join(directory, 'part-00000'), schema) as writer:
+                writer.write_rows(rows)
+            print(f"Wrote {len(rows):,} row(s) to {writer.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Streaming sessionization of page_views and user_events into web_sessions
+
+data_generator.py draws web_sessions, page_views and user_events
+independently, so a session's page_views count, start and end never match
+the page views and events that point at it, and the bounce rate and session
+duration of web_analytics_summary say nothing. This derives sessions from
+the activity instead, the way a clickstream pipeline would.
+
+The Sessionizer takes one time-ordered stream of page views and events. A
+user's activity belongs to their open session until they have been inactive
+for longer than the gap (--gap-minutes, 30 by default); the next activity
+then opens a new session. Open sessions sit in a heap ordered by the time
+they expire. As the stream's clock advances, expired sessions are popped and
+closed, so only sessions active within the last gap are held. With more than
+--max-open sessions open, the one idle longest is closed early; such
+evictions are counted.
+
+When a session closes, its rows are made consistent:
+- page views and events get its session_id;
+- each page view's time_on_page_seconds runs to the next page view, except
+  for the last one, which keeps its own and is the only exit_page;
+- session_start is the first activity and session_end the last activity
+  (a last page view ends after its time on page), and page_views counts
+  the session's page views;
+- traffic_source is read from the first page view's referrer (direct when
+  there is none).
+Device, browser and country are not in the activity. They are taken from
+the user's first session in the input web_sessions, or left NULL; with
+--fill-attributes, users without one get those of an input session picked
+by hashing their user_id.
+
+Offline, the activity in --data-dir is sorted by time with the external
+sort of change_capture.py (runs of --buffer-rows spilled to disk) and the
+results are written as page_views_generated, user_events_generated and
+web_sessions_generated in --output-dir. The output is split into ds=
+directories when the input page views were. data_generator.py
+--sessionize runs the same pass over the tables it has just written.
+
+Usage:
+    python sessionizer.py --data-dir generated_data --output-dir sessionized
+    python sessionizer.py --data-dir generated_data --output-dir sessionized --gap-minutes 15 --fill-attributes
+    python data_generator.py --table all --records 5000 --sessionize 30
+"""
+
+import argparse
+import csv
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from change_capture import ExternalSorter
+from local_engine import column_positions, open_csv, table_files
+from output_writers import PartitionedWriter, load_schemas, open_writer, partition_function
+from sketches import hash64
+
+
+ACTIVITY_TABLES = ('page_views', 'user_events')
+
+# Sort tag of each activity table: page views first at equal timestamps
+PAGE_VIEW, EVENT = '0', '1'
+
+
+class Session:
+    """An open session and the rows it has collected so far."""
+
+    __slots__ = ('session_id', 'user_id', 'start', 'last_seen', 'deadline', 'page_views', 'rows')
+
+    def __init__(self, session_id: str, user_id: str, start: datetime):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.start = self.last_seen = start
+        self.deadline = None
+        self.page_views = 0
+        self.rows: List[Tuple[str, datetime, list]] = []
+
+
+class Sessionizer:
+    """Closes each user's session after ``gap`` of inactivity in a time-ordered stream.
+
+    Activity must arrive in time order, as after a sort on its timestamp.
+    """
+
+    def __init__(self, gap: timedelta, max_open: int = 100_000, id_prefix: str = 'SES', first_id: int = 1):
+        if gap <= timedelta(0) or max_open < 1:
+            raise ValueError('Sessionizer needs a positive gap and max_open >= 1')
+        self.gap = gap
+        self.max_open = max_open
+        self.id_prefix = id_prefix
+        self.next_id = first_id
+        self.open: Dict[str, Session] = {}
+        self._expiry: List[Tuple[datetime, str]] = []
+        self.stats = {'activities': 0, 'sessions': 0, 'evicted': 0, 'peak_open': 0}
+
+    def add(self, user_id: str, timestamp: datetime, kind: str, row: list) -> List[Session]:
+        """Add one activity of ``kind`` (PAGE_VIEW or EVENT); returns the sessions it closed."""
+        closed = self._expire(timestamp)
+        session = self.open.get(user_id)
+        if session is None:
+            session = Session(f'{self.id_prefix}{self.next_id:06d}', user_id, timestamp)
+            self.next_id += 1
+            self.open[user_id] = session
+            self.stats['sessions'] += 1
+            if len(self.open) > self.max_open:
+                closed.append(self._evict())
+            self.stats['peak_open'] = max(self.stats['peak_open'], len(self.open))
+        session.rows.append((kind, timestamp, row))
+        session.page_views += kind == PAGE_VIEW
+        session.last_seen = max(session.last_seen, timestamp)
+        session.deadline = session.last_seen + self.gap
+        heapq.heappush(self._expiry, (session.deadline, user_id))
+        self.stats['activities'] += 1
+        return closed
+
+    def _expire(self, now: datetime) -> List[Session]:
+        closed = []
+        expiry = self._expiry
+        while expiry and expiry[0][0] < now:
+            deadline, user_id = heapq.heappop(expiry)
+            session = self.open.get(user_id)
+            # Entries of sessions extended since they were pushed are stale
+            if session is not None and session.deadline == deadline:
+                closed.append(self.open.pop(user_id))
+        return closed
+
+    def _evict(self) -> Session:
+        while True:
+            deadline, user_id = heapq.heappop(self._expiry)
+            session = self.open.get(user_id)
+            if session is not None and session.deadline == deadline:
+                self.stats['evicted'] += 1
+                return self.open.pop(user_id)
+
+    def flush(self) -> List[Session]:
+        """Close every open session, at the end of the stream."""
+        closed = sorted(self.open.values(), key=lambda session: session.start)
+        self.open.clear()
+        self._expiry.clear()
+        return closed
+
+
+def traffic_source(referrer: Optional[str]) -> str:
+    """Source of a referrer URL: https://www.google.com -> google; none -> direct."""
+    if not referrer:
+        return 'direct'
+    host = urlparse(referrer).netloc or referrer
+    if host.startswith('www.'):
+        host = host[4:]
+    return host.split('.')[0] or 'direct'
+
+
+class Layout:
+    """Positions of the columns the sessionizer reads and rewrites, from the DDL."""
+
+    def __init__(self, schemas):
+        page_views, user_events = schemas['page_views'].column_names, schemas['user_events'].column_names
+        self.view_session = page_views.index('session_id')
+        self.view_time = page_views.index('timestamp')
+        self.view_dwell = page_views.index('time_on_page_seconds')
+        self.view_referrer = page_views.index('referrer_url')
+        self.view_exit = page_views.index('exit_page')
+        self.event_session = user_events.index('session_id')
+        self.event_time = user_events.index('event_timestamp')
+
+
+def _dwell(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def session_rows(session: Session, layout: Layout,
+                 attributes: Callable[[str], Sequence[Optional[str]]]) -> Tuple[tuple, List[list], List[list]]:
+    """web_sessions row of a closed session and its page view and event rows, rewritten to match."""
+    views, events = [], []
+    for kind, timestamp, row in session.rows:
+        if kind == PAGE_VIEW:
+            row[layout.view_session], row[layout.view_time] = session.session_id, timestamp
+            views.append(row)
+        else:
+            row[layout.event_session], row[layout.event_time] = session.session_id, timestamp
+            events.append(row)
+    view_times = [timestamp for kind, timestamp, _ in session.rows if kind == PAGE_VIEW]
+    for index, row in enumerate(views):
+        if index + 1 < len(views):
+            row[layout.view_dwell] = int((view_times[index + 1] - view_times[index]).total_seconds())
+            row[layout.view_exit] = False
+        else:
+            row[layout.view_dwell] = _dwell(row[layout.view_dwell])
+            row[layout.view_exit] = True
+    end = session.last_seen
+    if views:
+        end = max(end, view_times[-1] + timedelta(seconds=views[-1][layout.view_dwell]))
+    source = traffic_source(views[0][layout.view_referrer]) if views else 'direct'
+    device_type, browser, country = attributes(session.user_id)
+    web_session = (session.session_id, session.user_id, session.start, end, session.page_views,
+                   int((end - session.start).total_seconds()), source, device_type, browser, country)
+    return web_session, views, events
+
+
+def read_activity(data_dir: str, schemas) -> Iterator[tuple]:
+    """(timestamp, user_id, tag, *row) of every page view and event in ``data_dir``."""
+    for table, tag in zip(ACTIVITY_TABLES, (PAGE_VIEW, EVENT)):
+        schema = schemas[table]
+        names = schema.column_names
+        time_position = names.index('timestamp' if table == 'page_views' else 'event_timestamp')
+        user_position = names.index('user_id')
+        for path, _ in table_files(data_dir, table):
+            with open_csv(path) as csv_file:
+                reader = csv.reader(csv_file)
+                positions = column_positions(schema, next(reader, []))
+                for record in reader:
+                    row = [record[position] if position is not None and position < len(record) else ''
+                           for position in positions]
+                    if row[time_position] and row[user_position]:
+                        yield (row[time_position], row[user_position], tag, *row)
+
+
+def read_attributes(data_dir: str, schemas) -> Dict[str, Tuple[str, str, str]]:
+    """device_type, browser and country of each user's first session in ``data_dir``."""
+    schema = schemas['web_sessions']
+    first: Dict[str, Tuple[str, tuple]] = {}
+    for path, _ in table_files(data_dir, 'web_sessions'):
+        with open_csv(path) as csv_file:
+            reader = csv.reader(csv_file)
+            lookup = dict(zip(schema.column_names, column_positions(schema, next(reader, []))))
+            wanted = [lookup[name] for name in ('user_id', 'session_start', 'device_type', 'browser', 'country')]
+            if None in wanted:
+                continue
+            for record in reader:
+                user_id, start, *values = (record[position] if position < len(record) else '' for position in wanted)
+                if user_id and (user_id not in first or start < first[user_id][0]):
+                    first[user_id] = (start, tuple(value or None for value in values))
+    return {user_id: values for user_id, (_, values) in first.items()}
+
+
+def attribute_lookup(known: Dict[str, Tuple[str, str, str]], fill: bool) -> Callable[[str], Sequence[Optional[str]]]:
+    pool = sorted(set(known.values())) if fill else []
+
+    def attributes(user_id: str) -> Sequence[Optional[str]]:
+        values = known.get(user_id)
+        if values is None and pool:
+            values = pool[hash64(user_id) % len(pool)]
+        return values or (None, None, None)
+    return attributes
+
+
+def sessionize(data_dir: str, output_dir: str, gap: timedelta, max_open: int = 100_000,
+               buffer_rows: int = 500_000, fill_attributes: bool = False, id_prefix: str = 'SES',
+               log=print) -> Dict[str, int]:
+    """Derive web_sessions from the activity in ``data_dir`` and write all three tables to ``output_dir``.
+
+    ``output_dir`` may be ``data_dir``: the tables are written to a staging
+    directory first and replace the inputs once complete.
+    """
+    started = time.perf_counter()
+    schemas = load_schemas()
+    layout = Layout(schemas)
+    partition = any(file_ds is not None for _, file_ds in table_files(data_dir, 'page_views'))
+    attributes = attribute_lookup(read_attributes(data_dir, schemas), fill_attributes)
+    sessionizer = Sessionizer(gap, max_open, id_prefix)
+    os.makedirs(output_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.sessionize_', dir=output_dir)
+    sorter = ExternalSorter(buffer_rows)
+    profile = dict.fromkeys(('page_views', 'bounces', 'without_page_views'), 0)
+    try:
+        writers = {}
+        for table in ('web_sessions',) + ACTIVITY_TABLES:
+            path, schema = os.path.join(staging, f'{table}_generated'), schemas[table]
+            # Sessions close in time order, so a few open partitions per table are enough
+            writers[table] = (PartitionedWriter(path, 'part-00000', schema, partition_function(table, schema),
+                                                max_open=8)
+                              if partition else open_writer('csv', path, schema))
+        try:
+            def close(sessions: Iterable[Session]):
+                for session in sessions:
+                    profile['page_views'] += session.page_views
+                    profile['bounces'] += session.page_views == 1
+                    profile['without_page_views'] += not session.page_views
+                    web_session, views, events = session_rows(session, layout, attributes)
+                    writers['web_sessions'].write_rows([web_session])
+                    writers['page_views'].write_rows(views)
+                    writers['user_events'].write_rows(events)
+
+            for timestamp, user_id, tag, *row in sorter.sort(read_activity(data_dir, schemas)):
+                close(sessionizer.add(user_id, datetime.fromisoformat(timestamp), tag, row))
+            close(sessionizer.flush())
+        finally:
+            for writer in writers.values():
+                writer.close()
+        for table in ('web_sessions',) + ACTIVITY_TABLES:
+            name = f'{table}_generated'
+            for path, _ in table_files(output_dir, table):
+                os.remove(path)
+            if os.path.isdir(os.path.join(output_dir, name)):
+                shutil.rmtree(os.path.join(output_dir, name))
+            source = os.path.join(staging, name) if partition else os.path.join(staging, f'{name}.csv')
+            os.replace(source, os.path.join(output_dir, os.path.basename(source)))
+    finally:
+        sorter.cleanup()
+        shutil.rmtree(staging, ignore_errors=True)
+    stats = dict(sessionizer.stats, runs=len(sorter.runs), **profile)
+    log(f"Sessionized {stats['activities']:,} page views and events into {stats['sessions']:,} sessions "
+        f"(gap {gap}) in {time.perf_counter() - started:.3f}s: at most {stats['peak_open']:,} open, "
+        f"{stats['evicted']:,} closed early, {stats['runs']} sort run(s) spilled")
+    if stats['sessions']:
+        log(f"  {stats['page_views'] / stats['sessions']:.2f} page views per session, "
+            f"{stats['bounces'] / stats['sessions']:.1%} bounced, "
+            f"{stats['without_page_views'] / stats['sessions']:.1%} without page views")
+    return stats
+
+
+def implausible_sessions(stats: Dict[str, int]) -> List[str]:
+    """What about the sessions of ``sessionize`` stats does not look like web traffic; empty if nothing.
+
+    Sessions should average 1.5 to 50 page views, bounce (one page view) 5% to
+    80% of the time and nearly always have a page view, as when the activity
+    comes in visits rather than at independent random times.
+    """
+    sessions = stats['sessions']
+    if not sessions:
+        return []
+    problems = []
+    pages, bounce_rate = stats['page_views'] / sessions, stats['bounces'] / sessions
+    if not 1.5 <= pages <= 50:
+        problems.append(f'{pages:.2f} page views per session')
+    if not 0.05 <= bounce_rate <= 0.8:
+        problems.append(f'bounce rate {bounce_rate:.1%}')
+    if stats['without_page_views'] > 0.05 * sessions:
+        problems.append(f'{stats["without_page_views"] / sessions:.1%} of sessions without page views')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Derive web_sessions from page_views and user_events')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--output-dir', required=True,
+                        help='Directory for the sessionized tables (may be --data-dir to rewrite it)')
+    parser.add_argument('--gap-minutes', type=float, default=30,
+                        help='Inactivity that closes a session (default: 30)')
+    parser.add_argument('--max-open', type=int, default=100_000,
+                        help='Open sessions held before the longest idle one is closed (default: 100000)')
+    parser.add_argument('--buffer-rows', type=int, default=500_000,
+                        help='Activity rows sorted in memory before spilling a run to disk (default: 500000)')
+    parser.add_argument('--fill-attributes', action='store_true',
+                        help='Give users without an input session the device, browser and country '
+                             'of an input session picked by user_id')
+    parser.add_argument('--id-prefix', default='SES', help='Prefix of the new session IDs (default: SES)')
+    args = parser.parse_args()
+
+    if args.gap_minutes <= 0:
+        parser.error('--gap-minutes must be positive')
+    if args.max_open < 1 or args.buffer_rows < 1:
+        parser.error('--max-open and --buffer-rows must be at least 1')
+    if not any(table_files(args.data_dir, table) for table in ACTIVITY_TABLES):
+        parser.error(f'No page_views or user_events in {args.data_dir}')
+    try:
+        stats = sessionize(args.data_dir, args.output_dir, timedelta(minutes=args.gap_minutes), args.max_open,
+                           args.buffer_rows, args.fill_attributes, args.id_prefix)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+    problems = implausible_sessions(stats)
+    if problems:
+        print(f"Warning: implausible sessions: {'; '.join(problems)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Fixed-memory sketches for single-pass checks over large tables
+
+Exact key sets grow with the number of distinct keys, which does not fit in
+memory for billion-row tables. The sketches here use a fixed amount of memory
+chosen up front and trade it for a bounded, known error:
+- BloomFilter   Set membership. No false negatives; false positives at the
+                rate the filter was sized for, as long as it holds no more
+                than its capacity.
+- HyperLogLog   Distinct count. 2^p one-byte registers; relative standard
+                error 1.04/sqrt(2^p), 0.81% at the default p=14 (16 KiB).
+- KllSketch     Quantiles. About 3k retained values; rank error under 1.7%
+                of the count with 99% confidence at the default k=200.
+- Moments       Count, mean and variance by Welford's method. Exact up to
+                floating-point rounding.
+
+HyperLogLog, KllSketch and Moments are mergeable: sketches of shards or daily
+partitions merge into the sketch of their union with the same error bound as
+one pass over all of it, and serialize to JSON-compatible dicts for storage.
+
+Usage:
+    from sketches import BloomFilter, HyperLogLog
+    seen = BloomFilter(capacity=100_000_000, error_rate=0.001)   # ~171 MiB
+    duplicate = seen.add(key)
+    distinct = HyperLogLog(); distinct.add(value); distinct.merge(other_shard); distinct.estimate()
+"""
+
+import base64
+import bisect
+import hashlib
+import math
+import random
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def hash_pair(value: str) -> Tuple[int, int]:
+    """Two independent 64-bit hashes of ``value``, for double hashing."""
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter:
+    """Bloom filter sized for ``capacity`` keys at ``error_rate`` false positives."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError('BloomFilter needs capacity >= 1 and 0 < error_rate < 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        first, second = hash_pair(value)
+        size = self.size
+        return [(first + index * second) % size for index in range(self.hashes)]
+
+    def add(self, value: str) -> bool:
+        """Add ``value``; True if it was (probably) already present."""
+        bits, present = self.bits, True
+        for position in self._positions(value):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def __len__(self) -> int:
+        """Keys added that were not already present."""
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+    @property
+    def expected_error(self) -> float:
+        """False-positive rate at the current fill."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+def hash64(value: str) -> int:
+    """64-bit hash of ``value``."""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HyperLogLog:
+    """Distinct-count estimate from 2^``precision`` registers."""
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError('HyperLogLog precision must be between 4 and 18')
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._suffix_bits = 64 - precision
+        self._suffix_mask = (1 << self._suffix_bits) - 1
+
+    def add(self, value: str):
+        hashed = hash64(value)
+        index = hashed >> self._suffix_bits
+        rank = self._suffix_bits - (hashed & self._suffix_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLogs of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        raw = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * size and zeros:
+            # Linear counting is more accurate while many registers are empty
+            return round(size * math.log(size / zeros))
+        return round(raw)
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of the estimate."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'precision': self.precision, 'registers': base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    def to_sparse(self) -> str:
+        """The non-empty registers as base64 (3-byte index, 1-byte rank each), for small sets."""
+        registers = self.registers
+        return base64.b64encode(b''.join(match.start().to_bytes(3, 'little') + match.group()
+                                         for match in re.finditer(rb'[^\x00]', registers))).decode('ascii')
+
+    def merge_sparse(self, data: str):
+        """Merge registers serialized by ``to_sparse`` at the same precision."""
+        registers = self.registers
+        packed = base64.b64decode(data)
+        for offset in range(0, len(packed), 4):
+            index = int.from_bytes(packed[offset:offset + 3], 'little')
+            if packed[offset + 3] > registers[index]:
+                registers[index] = packed[offset + 3]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HyperLogLog':
+        sketch = cls(data['precision'])
+        sketch.registers = bytearray(base64.b64decode(data['registers']))
+        return sketch
+
+
+class KllSketch:
+    """Quantiles of a stream from a hierarchy of compactors (Karnin, Lang and Liberty).
+
+    Level h holds values that each stand for 2^h inputs. A full level is sorted
+    and every other value, from a random offset, is promoted to the next level.
+    """
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        if k < 8:
+            raise ValueError('KllSketch needs k >= 8')
+        self.k = k
+        self.count = 0
+        self.levels: List[list] = [[]]
+        self._random = random.Random(seed)
+        self._sorted = None
+        self._update_limit()
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _update_limit(self):
+        self._limit = sum(self._capacity(level) for level in range(len(self.levels)))
+        self._first_capacity = self._capacity(0)
+
+    def add(self, value: float):
+        self.levels[0].append(value)
+        self.count += 1
+        self._sorted = None
+        if len(self.levels[0]) >= self._first_capacity:
+            self._compress()
+
+    def _compress(self):
+        while sum(map(len, self.levels)) >= self._limit:
+            for level, items in enumerate(self.levels):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.levels):
+                        self.levels.append([])
+                        self._update_limit()
+                    items.sort()
+                    # An odd item out stays behind
+                    keep = [items.pop()] if len(items) % 2 else []
+                    self.levels[level + 1].extend(items[self._random.randrange(2)::2])
+                    self.levels[level] = keep
+                    break
+            else:
+                break
+
+    def merge(self, other: 'KllSketch'):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        self._update_limit()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._sorted = None
+        self._compress()
+
+    def _sorted_view(self) -> Tuple[list, list]:
+        """Retained values in order and the cumulative weight up to each."""
+        if self._sorted is None:
+            weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+            values, cumulative, total = [], [], 0
+            for value, weight in weighted:
+                total += weight
+                values.append(value)
+                cumulative.append(total)
+            self._sorted = (values, cumulative)
+        return self._sorted
+
+    def quantiles(self, fractions: List[float]) -> List[Optional[float]]:
+        """Values at the given fractions (0..1) of the sorted stream."""
+        values, cumulative = self._sorted_view()
+        if not values:
+            return [None] * len(fractions)
+        return [values[min(bisect.bisect_left(cumulative, fraction * cumulative[-1]), len(values) - 1)]
+                for fraction in fractions]
+
+    def rank(self, value: float) -> Optional[float]:
+        """Fraction (0..1) of the stream below ``value``."""
+        values, cumulative = self._sorted_view()
+        if not values:
+            return None
+        below = bisect.bisect_left(values, value)
+        return cumulative[below - 1] / cumulative[-1] if below else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.k, 'count': self.count, 'levels': self.levels}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'KllSketch':
+        sketch = cls(data['k'])
+        sketch.count = data['count']
+        sketch.levels = [list(items) for items in data['levels']]
+        sketch._update_limit()
+        sketch._sorted = None
+        return sketch
+
+
+class Moments:
+    """Count, mean and variance, updated with Welford's method and merged with Chan's."""
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other: 'Moments'):
+        count = self.count + other.count
+        if not count:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> Optional[float]:
+        """Population variance, as MaxCompute's VARIANCE/STDDEV."""
+        return self.m2 / self.count if self.count else None
+
+    @property
+    def std_dev(self) -> Optional[float]:
+        return math.sqrt(self.variance) if self.count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Moments':
+        return cls(data['count'], data['mean'], data['m2'])
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Critical-path and SLA simulator for the DataWorks workflow definitions
+
+Ties a workflow's ``monitoring.sla`` thresholds to the runtimes of its nodes.
+Node runtimes come from measured samples (workflow_runner.py --report files or
+a JSON file of seconds per node) or from distributions given per node:
+
+    600                       always 600 seconds
+    normal:600,60             mean and standard deviation (truncated at 0)
+    lognormal:600,120         mean and standard deviation of a right-skewed runtime
+    uniform:500,700           anywhere between the two
+    triangular:500,600,900    low, most likely, high
+
+The report first gives the critical path, makespan and slack of every node for
+the mean runtimes, then runs Monte Carlo trials: each trial draws every node's
+runtime, fails attempts that exceed the node's ``timeout`` (or, with
+--failure-rate, at random), retries them per ``retry_count`` after
+``retry_policy.retry_interval`` and schedules the nodes like workflow_runner.py
+does - on the cores of ``resource_management.cpu``, longest remaining path
+first. It prints makespan percentiles, the probability of exceeding each SLA
+threshold, how often each node is on the critical path and how often the run
+fails. What-ifs (--scale, --workers) are simulated against the declared
+workflow with the same random draws, so the difference is the change alone.
+
+Usage:
+    python sla_simulator.py ../workflows/daily_etl_workflow.json --samples run1.json --samples run2.json
+    python sla_simulator.py ../workflows/daily_etl_workflow.json --runtimes runtimes.json --scale product_performance=2
+    python sla_simulator.py ../workflows/daily_etl_workflow.json --runtimes runtimes.json --workers 4 --trials 50000
+"""
+
+import argparse
+import heapq
+import json
+import math
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from workflow_runner import SUCCESS, Workflow
+
+
+PERCENTILES = (50, 90, 95, 99)
+THRESHOLDS = ('expected_duration', 'warning_threshold', 'critical_threshold')
+
+
+class Runtime:
+    """Distribution of the runtime of one node attempt, in seconds."""
+
+    KINDS = {'fixed': 1, 'normal': 2, 'lognormal': 2, 'uniform': 2, 'triangular': 3}
+
+    def __init__(self, kind: str, parameters: Sequence[float] = (), samples: Sequence[float] = ()):
+        self.kind = kind
+        self.parameters = list(parameters)
+        self.samples = list(samples)
+        if kind == 'lognormal':
+            mean, deviation = self.parameters
+            self._sigma = math.sqrt(math.log(1 + (deviation / mean) ** 2))
+            self._mu = math.log(mean) - self._sigma ** 2 / 2
+
+    @classmethod
+    def parse(cls, spec: Any) -> 'Runtime':
+        """A runtime from a number, a list of samples or a ``kind:a,b,...`` string."""
+        if isinstance(spec, (int, float)):
+            return cls('fixed', [float(spec)])
+        if isinstance(spec, list):
+            if not spec:
+                raise ValueError('Empty list of runtime samples')
+            return cls('samples', samples=[float(value) for value in spec])
+        kind, separator, values = str(spec).partition(':')
+        if not separator:
+            return cls('fixed', [float(kind)])
+        kind = kind.strip().lower()
+        if kind not in cls.KINDS:
+            raise ValueError(f"Unknown runtime distribution {kind!r} (expected one of {', '.join(cls.KINDS)})")
+        parameters = [float(value) for value in values.split(',')]
+        if len(parameters) != cls.KINDS[kind]:
+            raise ValueError(f'{kind} takes {cls.KINDS[kind]} parameter(s), got {spec!r}')
+        if any(value < 0 for value in parameters) or (kind == 'lognormal' and parameters[0] <= 0):
+            raise ValueError(f'Runtime parameters must be positive: {spec!r}')
+        if kind == 'triangular' and not parameters[0] <= parameters[1] <= parameters[2]:
+            raise ValueError(f'triangular needs low <= mode <= high: {spec!r}')
+        return cls(kind, parameters)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'samples':
+            return rng.choice(self.samples)
+        if self.kind == 'fixed':
+            return self.parameters[0]
+        if self.kind == 'normal':
+            return max(rng.gauss(*self.parameters), 0.0)
+        if self.kind == 'lognormal':
+            return rng.lognormvariate(self._mu, self._sigma)
+        if self.kind == 'uniform':
+            return rng.uniform(*self.parameters)
+        low, mode, high = self.parameters
+        return rng.triangular(low, high, mode)
+
+    @property
+    def mean(self) -> float:
+        if self.kind == 'samples':
+            return sum(self.samples) / len(self.samples)
+        if self.kind == 'uniform':
+            return sum(self.parameters) / 2
+        if self.kind == 'triangular':
+            return sum(self.parameters) / 3
+        return self.parameters[0]
+
+    def describe(self) -> str:
+        if self.kind == 'samples':
+            return f'{len(self.samples)} sample(s)'
+        if self.kind == 'fixed':
+            return 'fixed'
+        return f"{self.kind}({', '.join(f'{value:g}' for value in self.parameters)})"
+
+
+def read_samples(path: str) -> Tuple[Dict[str, List[float]], Dict[str, List[int]]]:
+    """Runtime samples and (failed, total) attempt counts per node from ``path``.
+
+    A workflow_runner.py report contributes the duration of every node that
+    succeeded at the first attempt and its attempt counts; any other JSON object
+    maps node IDs to a runtime in seconds or a list of them.
+    """
+    with open(path, 'r', encoding='utf-8') as samples_file:
+        data = json.load(samples_file)
+    samples, attempts = {}, {}
+    if isinstance(data, dict) and isinstance(data.get('nodes'), list):
+        for entry in data['nodes']:
+            if not entry.get('attempts'):
+                continue
+            failures = entry['attempts'] - (1 if entry['status'] == SUCCESS else 0)
+            counts = attempts.setdefault(entry['node'], [0, 0])
+            counts[0] += failures
+            counts[1] += entry['attempts']
+            if entry['status'] == SUCCESS and entry['attempts'] == 1:
+                samples.setdefault(entry['node'], []).append(float(entry['duration']))
+        return samples, attempts
+    for node_id, values in data.items():
+        values = values if isinstance(values, list) else [values]
+        samples.setdefault(node_id, []).extend(float(value) for value in values)
+    return samples, attempts
+
+
+def parse_assignment(text: str) -> Tuple[str, str]:
+    node_id, separator, value = text.partition('=')
+    if not separator or not node_id:
+        raise argparse.ArgumentTypeError(f'Invalid {text!r}: expected node=value')
+    return node_id.strip(), value.strip()
+
+
+class Simulator:
+    """Monte Carlo makespans of a workflow on a fixed number of workers."""
+
+    def __init__(self, workflow: Workflow, runtimes: Dict[str, Runtime], workers: int,
+                 scales: Optional[Dict[str, float]] = None, failure_rates: Optional[Dict[str, float]] = None,
+                 retry_interval: Optional[float] = None):
+        self.workflow = workflow
+        self.runtimes = runtimes
+        self.workers = workers
+        self.scales = scales or {}
+        self.failure_rates = failure_rates or {}
+        self.retry_interval = (workflow.retry_policy.get('retry_interval', 0)
+                               if retry_interval is None else retry_interval)
+        self.dependents = {node_id: workflow.dependents(node_id) for node_id in workflow.order}
+        self.rank = {node_id: index for index, node_id in enumerate(workflow.order)}
+        # Same dispatch order as workflow_runner.py, which ranks ready nodes by timeout
+        timeouts = {node_id: float(node.timeout or 0) for node_id, node in workflow.nodes.items()}
+        self.priority = workflow.bottom_levels(timeouts)
+
+    def mean_durations(self) -> Dict[str, float]:
+        return {node_id: runtime.mean * self.scales.get(node_id, 1.0)
+                for node_id, runtime in self.runtimes.items()}
+
+    def node_duration(self, node_id: str, rng: random.Random) -> Tuple[float, bool]:
+        """Time a node holds its worker, retries included, and whether it failed."""
+        node = self.workflow.nodes[node_id]
+        runtime, scale = self.runtimes[node_id], self.scales.get(node_id, 1.0)
+        failure_rate = self.failure_rates.get(node_id, 0.0)
+        total = 0.0
+        for attempt in range(1 + max(int(node.retry_count or 0), 0)):
+            if attempt:
+                total += self.retry_interval
+            seconds = runtime.sample(rng) * scale
+            failed = rng.random() < failure_rate
+            if node.timeout and seconds > node.timeout:
+                seconds, failed = float(node.timeout), True
+            total += seconds
+            if not failed:
+                return total, False
+        return total, True
+
+    def makespan(self, durations: Dict[str, float], failed: set) -> float:
+        """End of a run that dispatches ready nodes longest-remaining-path first."""
+        waiting = {node_id: len(node.dependencies) for node_id, node in self.workflow.nodes.items()}
+        ready = [node_id for node_id in self.workflow.order if not waiting[node_id]]
+        running = []
+        clock = 0.0
+        while ready or running:
+            ready.sort(key=lambda node_id: (-self.priority[node_id], self.rank[node_id]))
+            while ready and len(running) < self.workers:
+                node_id = ready.pop(0)
+                heapq.heappush(running, (clock + durations[node_id], self.rank[node_id], node_id))
+            clock, _, node_id = heapq.heappop(running)
+            if node_id in failed:
+                continue
+            for dependent in self.dependents[node_id]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        return clock
+
+    def run(self, trials: int, seed: int) -> Dict[str, Any]:
+        makespans, completed = [], []
+        critical = dict.fromkeys(self.workflow.order, 0)
+        for trial in range(trials):
+            durations, failed = {}, set()
+            for node_id in self.workflow.order:
+                # One stream per node and trial: every scenario draws the same runtimes
+                rng = random.Random(f'{seed}:{trial}:{node_id}')
+                durations[node_id], node_failed = self.node_duration(node_id, rng)
+                if node_failed:
+                    failed.add(node_id)
+            makespan = self.makespan(durations, failed)
+            makespans.append(math.inf if failed else makespan)
+            if not failed:
+                completed.append(makespan)
+            for node_id in self.workflow.critical_path(durations)[1]:
+                critical[node_id] += 1
+        # A failed run never delivers, so it breaches every threshold
+        completed.sort()
+        count = len(completed)
+        sla = self.workflow.sla
+        return {
+            'workers': self.workers,
+            'scales': self.scales,
+            'trials': trials,
+            'mean': sum(completed) / count if count else None,
+            'percentiles': {p: completed[min(count - 1, math.ceil(p / 100 * count) - 1)] if count else None
+                            for p in PERCENTILES},
+            'max': completed[-1] if count else None,
+            'breach': {name: sum(value > sla[name] for value in makespans) / trials
+                       for name in THRESHOLDS if name in sla},
+            'failure': (trials - count) / trials,
+            'criticality': {node_id: count / trials for node_id, count in critical.items()},
+        }
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+    if seconds >= 3600:
+        return f'{seconds / 3600:.2f}h'
+    if seconds >= 60:
+        return f'{seconds / 60:.1f}m'
+    return f'{seconds:.2f}s'
+
+
+def print_static(workflow: Workflow, simulator: Simulator):
+    durations = simulator.mean_durations()
+    schedule = workflow.schedule(durations)
+    length, path = workflow.critical_path(durations)
+    print('\nMean runtimes, dependencies only:')
+    print(f"{'Node':<24} {'Runtime':<32} {'Mean':>9} {'Start':>9} {'Slack':>9} {'Timeout':>9}")
+    for node_id in workflow.order:
+        earliest_start, _, latest_start = schedule[node_id]
+        runtime = simulator.runtimes[node_id].describe()
+        scale = simulator.scales.get(node_id)
+        if scale:
+            runtime += f' x{scale:g}'
+        timeout = workflow.nodes[node_id].timeout
+        over = '!' if timeout and durations[node_id] > timeout else ' '
+        print(f"{node_id:<24} {runtime:<32} {format_seconds(durations[node_id]):>9} "
+              f"{format_seconds(earliest_start):>9} {format_seconds(max(latest_start - earliest_start, 0.0)):>9} "
+              f"{format_seconds(timeout) if timeout else '-':>9}{over}{'*' if node_id in path else ''}")
+    print(f"Critical path (*): {' -> '.join(path)} ({format_seconds(length)})")
+    if any(timeout and durations[node_id] > timeout for node_id, timeout in
+           ((node_id, workflow.nodes[node_id].timeout) for node_id in workflow.order)):
+        print('Mean runtime over the timeout (!): most attempts of these nodes time out')
+
+
+def print_results(workflow: Workflow, scenarios: List[Tuple[str, Dict[str, Any]]]):
+    width = 14
+
+    def row(label: str, values: List[str]):
+        print(f"{label:<36}" + ''.join(f'{value:>{width}}' for value in values))
+
+    print(f"\nMakespan of completed runs over {scenarios[0][1]['trials']:,} trials")
+    row('', [name for name, _ in scenarios])
+    row('workers', [str(result['workers']) for _, result in scenarios])
+    row('mean', [format_seconds(result['mean']) for _, result in scenarios])
+    for p in PERCENTILES:
+        row(f'p{p}', [format_seconds(result['percentiles'][p]) for _, result in scenarios])
+    row('max', [format_seconds(result['max']) for _, result in scenarios])
+    for name in THRESHOLDS:
+        if name in workflow.sla:
+            row(f"P(> {name} {format_seconds(workflow.sla[name])})",
+                [f"{result['breach'][name]:.1%}" for _, result in scenarios])
+    row('P(a node fails after its retries)', [f"{result['failure']:.1%}" for _, result in scenarios])
+    if any(result['failure'] for _, result in scenarios):
+        print('Failed runs count as breaching every threshold.')
+    print('\nCritical-path frequency')
+    for node_id in workflow.order:
+        row(f'  {node_id}', [f"{result['criticality'][node_id]:.1%}" for _, result in scenarios])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the critical path and SLA breaches of a workflow')
+    parser.add_argument('workflow', help='Workflow JSON, e.g. workflows/daily_etl_workflow.json')
+    parser.add_argument('--samples', action='append', default=[],
+                        help='workflow_runner.py report or JSON of node runtimes in seconds (repeatable)')
+    parser.add_argument('--runtimes', help='JSON mapping node IDs to a runtime distribution or samples')
+    parser.add_argument('--runtime', type=parse_assignment, action='append', default=[],
+                        help='Runtime of one node as node=SPEC, e.g. product_performance=lognormal:600,120')
+    parser.add_argument('--default', help='Runtime SPEC of nodes with no samples or distribution')
+    parser.add_argument('--scale', type=parse_assignment, action='append', default=[],
+                        help='What-if: multiply a node runtime, e.g. product_performance=2 (repeatable)')
+    parser.add_argument('--workers', type=int,
+                        help='What-if: nodes running at once (declared: resource_management cpu cores)')
+    parser.add_argument('--failure-rate', type=parse_assignment, action='append', default=[],
+                        help='Chance an attempt of node fails, as node=P (default: from --samples reports)')
+    parser.add_argument('--retry-interval', type=float,
+                        help='Seconds between retries (default: retry_policy.retry_interval)')
+    parser.add_argument('--trials', type=int, default=10000, help='Monte Carlo trials (default: 10000)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    try:
+        workflow = Workflow.load(args.workflow)
+    except (OSError, ValueError, KeyError) as error:
+        parser.error(f'Cannot load {args.workflow}: {error}')
+
+    samples, attempts = {}, {}
+    for path in args.samples:
+        file_samples, file_attempts = read_samples(path)
+        for node_id, values in file_samples.items():
+            samples.setdefault(node_id, []).extend(values)
+        for node_id, (failed, total) in file_attempts.items():
+            counts = attempts.setdefault(node_id, [0, 0])
+            counts[0] += failed
+            counts[1] += total
+    specs: Dict[str, Any] = dict(samples)
+    if args.runtimes:
+        with open(args.runtimes, 'r', encoding='utf-8') as runtimes_file:
+            specs.update(json.load(runtimes_file))
+    specs.update(args.runtime)
+
+    unknown = sorted(set(specs) - set(workflow.nodes))
+    unknown += [node_id for node_id, _ in args.scale + args.failure_rate if node_id not in workflow.nodes]
+    if unknown:
+        parser.error(f"Unknown node(s): {', '.join(sorted(set(unknown)))}")
+    missing = [node_id for node_id in workflow.order if node_id not in specs]
+    if missing and args.default is None:
+        parser.error(f"No runtime for {', '.join(missing)}: add --samples, --runtime node=SPEC or --default SPEC")
+    try:
+        runtimes = {node_id: Runtime.parse(specs.get(node_id, args.default)) for node_id in workflow.order}
+        scales = {node_id: float(value) for node_id, value in args.scale}
+        failure_rates = {node_id: failed / total for node_id, (failed, total) in attempts.items() if total}
+        failure_rates.update((node_id, float(value)) for node_id, value in args.failure_rate)
+    except ValueError as error:
+        parser.error(str(error))
+    declared = workflow.cores or 1
+    workers = args.workers or declared
+    if workers < 1 or args.trials < 1:
+        parser.error('--workers and --trials must be at least 1')
+
+    print(f"\n{workflow.name}: {len(workflow.nodes)} nodes, {declared} declared core(s)"
+          + (f", {workflow.resources['memory']} memory" if 'memory' in workflow.resources else ''))
+    if any(failure_rates.values()):
+        print('Attempt failure rates: ' + ', '.join(f'{node_id} {rate:.1%}'
+                                                    for node_id, rate in failure_rates.items() if rate))
+
+    baseline = Simulator(workflow, runtimes, declared, failure_rates=failure_rates,
+                         retry_interval=args.retry_interval)
+    scenarios = [('declared', baseline)]
+    if scales or workers != declared:
+        scenarios.append(('what-if', Simulator(workflow, runtimes, workers, scales, failure_rates,
+                                               args.retry_interval)))
+    print_static(workflow, scenarios[-1][1])
+    results = [(name, simulator.run(args.trials, args.seed)) for name, simulator in scenarios]
+    print_results(workflow, results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'workflow': workflow.name, 'sla': workflow.sla,
+                       'runtimes': {node_id: runtime.describe() for node_id, runtime in runtimes.items()},
+                       'scenarios': {name: result for name, result in results}}, output_file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
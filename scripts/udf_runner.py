@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Local runner for the MaxCompute Python UDFs
+
+Runs the UDF and UDTF classes of udf/python (or any module written against
+``odps.udf``) on a local CSV or Parquet file, without a MaxCompute project.
+When PyODPS is not installed, stand-ins for ``odps.udf`` (``annotate``,
+``BaseUDF``, ``BaseUDTF``) and ``odps.distcache`` (``get_cache_file`` reading
+file resources from ``--resource-dir``) are installed first.
+
+The input is read in chunks of ``--chunk-size`` rows, with only the columns
+the calls use, and the chunks are evaluated across ``--workers`` processes.
+Results are written in input order, and every call reports its throughput and
+per-row latency percentiles (p50/p90/p99/max of each ``evaluate`` or
+``process`` call).
+
+Calls are written like SQL, with column names, 'string' literals, numbers
+and NULL as arguments, and an optional output name (a column list for UDTFs):
+    TextSentiment(review_text)
+    TextClean(review_text, 'all') AS cleaned
+    TextProfile(review_text) AS (sentiment, keywords, word_count, language)
+
+Each chunk is one UDTF instance (process for every row, then close), so a
+UDTF that buffers rows until close, such as TextSimilarPairs, sees one chunk
+at a time; raise --chunk-size to give it the whole input.
+
+Usage:
+    python udf_runner.py reviews.csv --call "TextSentiment(review_text) AS sentiment" --keep review_id --output sentiments.csv
+    python udf_runner.py reviews.parquet --call "TextSentiment(review_text)" --call "TextClean(review_text, 'all')" --workers 4
+    python udf_runner.py reviews.csv --call "TextSentimentScore(review_text, 'sentiment_lexicon.tsv')" --resource-dir ../udf/python --batch
+"""
+
+import argparse
+import csv
+import importlib.util
+import inspect
+import json
+import os
+import re
+import shlex
+import sys
+import time
+import types
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'udf', 'python', 'text_analytics.py')
+
+# Directory odps.distcache.get_cache_file reads file resources from
+RESOURCE_DIR_VARIABLE = 'UDF_RUNNER_RESOURCE_DIR'
+
+CALL_PATTERN = re.compile(r'^\s*(\w+)\s*\((.*?)\)\s*(?:AS\s+(?:\((.*)\)|(\w+)))?\s*$',
+                          re.IGNORECASE | re.DOTALL)
+NUMBER_PATTERN = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+
+# Converters of CSV strings to MaxCompute argument types; an empty field is NULL
+TYPE_CONVERTERS = {
+    'bigint': int,
+    'int': int,
+    'double': float,
+    'float': float,
+    'boolean': lambda value: value.lower() == 'true',
+}
+
+ARROW_TYPES = {
+    'string': 'string',
+    'bigint': 'int64',
+    'int': 'int32',
+    'double': 'float64',
+    'float': 'float32',
+    'boolean': 'bool_',
+}
+
+
+def install_odps_standin(resource_dir: str = '.'):
+    """Provide ``odps.udf`` and ``odps.distcache`` where PyODPS is not installed."""
+    os.environ[RESOURCE_DIR_VARIABLE] = os.path.abspath(resource_dir)
+    try:
+        import odps.udf  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    def annotate(signature: str):
+        """Record the signature; MaxCompute uses it to type arguments and results."""
+        def decorate(cls):
+            cls._odps_signature = signature
+            return cls
+        return decorate
+
+    class BaseUDF:
+        pass
+
+    class BaseUDTF:
+        def forward(self, *values):
+            raise NotImplementedError('forward() is provided by the runner')
+
+        def close(self):
+            pass
+
+    def get_cache_file(name: str, mode: str = 't'):
+        path = os.path.join(os.environ.get(RESOURCE_DIR_VARIABLE, '.'), name)
+        return open(path, 'rb') if 'b' in mode else open(path, 'r', encoding='utf-8')
+
+    package = types.ModuleType('odps')
+    package.__path__ = []
+    udf = types.ModuleType('odps.udf')
+    udf.annotate, udf.BaseUDF, udf.BaseUDTF = annotate, BaseUDF, BaseUDTF
+    distcache = types.ModuleType('odps.distcache')
+    distcache.get_cache_file = get_cache_file
+    package.udf, package.distcache = udf, distcache
+    sys.modules.update({'odps': package, 'odps.udf': udf, 'odps.distcache': distcache})
+
+
+def load_module(path: str):
+    """Import a UDF module from its file, as MaxCompute does with a PY resource."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_signature(signature: Optional[str]) -> Tuple[List[str], List[str]]:
+    """Argument and result types of an ``annotate`` signature like ``string,bigint->double``."""
+    if not signature:
+        return [], []
+    arguments, _, results = signature.partition('->')
+    split = lambda types_: [name.strip().lower() for name in types_.split(',') if name.strip()]
+    return split(arguments), split(results)
+
+
+class UdfCall:
+    """One ``Class(arguments) [AS names]`` call of the runner."""
+
+    def __init__(self, spec: str):
+        match = CALL_PATTERN.match(spec)
+        if not match:
+            raise ValueError(f'Invalid call {spec!r}: expected Class(arguments) [AS name]')
+        self.spec = spec.strip()
+        self.class_name, arguments, names, name = match.groups()
+        # Arguments are ('column', name) or ('literal', value)
+        lexer = shlex.shlex(arguments, posix=False)
+        lexer.whitespace, lexer.whitespace_split = ', \t\r\n', True
+        self.arguments = [self._argument(token) for token in lexer]
+        self.names = [n.strip() for n in names.split(',')] if names else [name] if name else None
+
+    @staticmethod
+    def _argument(token: str) -> Tuple[str, Any]:
+        if len(token) >= 2 and token[0] == token[-1] == "'":
+            return 'literal', token[1:-1]
+        if token.upper() == 'NULL':
+            return 'literal', None
+        if NUMBER_PATTERN.match(token):
+            return 'literal', float(token) if re.search(r'[.eE]', token) else int(token)
+        if re.match(r'^\w+$', token):
+            return 'column', token
+        raise ValueError(f"Invalid argument {token!r}: expected a column, 'string', number or NULL")
+
+    @property
+    def columns(self) -> List[str]:
+        return [value for kind, value in self.arguments if kind == 'column']
+
+    def bind(self, module):
+        """Resolve the UDF class and the output column names."""
+        self.udf_class = getattr(module, self.class_name)
+        self.is_udtf = hasattr(self.udf_class, 'process')
+        self.argument_types, self.result_types = parse_signature(
+            getattr(self.udf_class, '_odps_signature', None))
+        if self.names is None:
+            count = len(self.result_types) or 1
+            self.names = ([self.class_name] if count == 1 and not self.is_udtf
+                          else [f'{self.class_name}_{index}' for index in range(count)])
+        # evaluate_batch takes a list for each texts... parameter and one value for
+        # the others (a lexicon, clean_type, ...), so those must be literals
+        evaluate_batch = None if self.is_udtf else getattr(self.udf_class, 'evaluate_batch', None)
+        self.batch_columns = ([name.startswith('texts')
+                               for name in list(inspect.signature(evaluate_batch).parameters)[1:]]
+                              if evaluate_batch else [])
+        self.batchable = evaluate_batch is not None and all(
+            is_column or kind == 'literal' for is_column, (kind, _) in zip(self.batch_columns, self.arguments))
+        return self
+
+
+class ChunkEvaluator:
+    """Evaluates the calls over chunks of columns; one per worker process."""
+
+    def __init__(self, module_path: str, specs: List[str], resource_dir: str, batch: bool):
+        install_odps_standin(resource_dir)
+        module = load_module(module_path)
+        self.calls = [UdfCall(spec).bind(module) for spec in specs]
+        self.batch = batch
+        # UDFs live as long as the worker, like a MaxCompute UDF instance
+        self.udfs = [None if call.is_udtf else call.udf_class() for call in self.calls]
+
+    def evaluate(self, chunk: Dict[str, list]) -> Tuple[List[list], List[array]]:
+        """Results (a column of values, or UDTF rows) and latencies (seconds) of every call."""
+        results, latencies = [], []
+        rows = len(next(iter(chunk.values()))) if chunk else 0
+        for call, udf in zip(self.calls, self.udfs):
+            arguments = self._arguments(call, chunk, rows)
+            if call.is_udtf:
+                result, latency = self._process(call, arguments, rows)
+            elif self.batch and call.batchable:
+                result, latency = self._evaluate_batch(call, udf, arguments, rows)
+            else:
+                result, latency = self._evaluate(udf, arguments, rows)
+            results.append(result)
+            latencies.append(latency)
+        return results, latencies
+
+    @staticmethod
+    def _arguments(call: UdfCall, chunk: Dict[str, list], rows: int) -> List[Any]:
+        """Argument columns (lists) and literals, converted to the signature types."""
+        arguments = []
+        for index, (kind, value) in enumerate(call.arguments):
+            if kind == 'literal':
+                arguments.append(value)
+                continue
+            column = chunk[value]
+            kind = call.argument_types[index] if index < len(call.argument_types) else 'string'
+            convert = TYPE_CONVERTERS.get(kind)
+            if convert:
+                column = [convert(v) if isinstance(v, str) and v else None if v == '' else v
+                          for v in column]
+            arguments.append(column)
+        return arguments
+
+    @staticmethod
+    def _rows(arguments: List[Any], rows: int) -> Iterator[tuple]:
+        columns = [argument if isinstance(argument, list) else [argument] * rows
+                   for argument in arguments]
+        return zip(*columns)
+
+    def _evaluate(self, udf, arguments: List[Any], rows: int) -> Tuple[list, array]:
+        evaluate, clock = udf.evaluate, time.perf_counter
+        result, latency = [], array('d')
+        append, record = result.append, latency.append
+        for row in self._rows(arguments, rows):
+            start = clock()
+            append(evaluate(*row))
+            record(clock() - start)
+        return result, latency
+
+    @staticmethod
+    def _evaluate_batch(call: UdfCall, udf, arguments: List[Any], rows: int) -> Tuple[list, array]:
+        """evaluate_batch over the chunk; every row gets the chunk's mean latency."""
+        # A literal passed for a column parameter is repeated for every row
+        arguments = [[argument] * rows if index < len(call.batch_columns) and call.batch_columns[index]
+                     and not isinstance(argument, list) else argument
+                     for index, argument in enumerate(arguments)]
+        start = time.perf_counter()
+        result = udf.evaluate_batch(*arguments)
+        elapsed = time.perf_counter() - start
+        if len(result) != rows:
+            raise ValueError(f'{call.class_name}.evaluate_batch returned {len(result)} results '
+                             f'for {rows} rows')
+        return result, array('d', [elapsed / max(rows, 1)]) * rows
+
+    def _process(self, call: UdfCall, arguments: List[Any], rows: int) -> Tuple[list, array]:
+        udtf = call.udf_class()
+        output: List[tuple] = []
+        udtf.forward = lambda *values: output.append(values)
+        process, clock = udtf.process, time.perf_counter
+        latency = array('d')
+        record = latency.append
+        for row in self._rows(arguments, rows):
+            start = clock()
+            process(*row)
+            record(clock() - start)
+        start = clock()
+        udtf.close()
+        if latency:
+            latency[-1] += clock() - start
+        return output, latency
+
+
+_evaluator: Optional[ChunkEvaluator] = None
+
+
+def _init_worker(module_path: str, specs: List[str], resource_dir: str, batch: bool):
+    global _evaluator
+    _evaluator = ChunkEvaluator(module_path, specs, resource_dir, batch)
+
+
+def _evaluate_chunk(chunk: Dict[str, list]):
+    return _evaluator.evaluate(chunk)
+
+
+def read_chunks(path: str, columns: List[str], chunk_size: int) -> Iterator[Dict[str, list]]:
+    """Stream ``columns`` of a CSV (with a header row) or Parquet file, chunk_size rows at a time."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Parquet input requires pyarrow: pip install pyarrow')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield {name: batch.column(name).to_pylist() for name in columns}
+        return
+
+    with open(path, 'r', newline='', encoding='utf-8') as input_file:
+        reader = csv.reader(input_file)
+        header = next(reader)
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise ValueError(f'{path} has no column {", ".join(missing)}')
+        positions = [header.index(name) for name in columns]
+        while True:
+            rows = [row for _, row in zip(range(chunk_size), reader)]
+            if not rows:
+                return
+            yield {name: [row[position] for row in rows] for name, position in zip(columns, positions)}
+
+
+class ResultWriter:
+    """Output rows as CSV, or as Parquet for a ``.parquet`` path."""
+
+    def __init__(self, path: str, names: List[str], types_: List[Optional[str]]):
+        self.path = path
+        self.names = names
+        self.rows_written = 0
+        if path.endswith('.parquet'):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError('Parquet output requires pyarrow: pip install pyarrow')
+            self._pa = pa
+            self._schema = pa.schema([(name, getattr(pa, ARROW_TYPES.get(kind or 'string', 'string'))())
+                                      for name, kind in zip(names, types_)])
+            self._parquet = pq.ParquetWriter(path, self._schema)
+            self._csv = None
+        else:
+            self._file = open(path, 'w', newline='', encoding='utf-8') if path != '-' else sys.stdout
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(names)
+
+    def write_columns(self, columns: List[list]):
+        if self._csv is not None:
+            self._csv.writerows(zip(*columns))
+        else:
+            self._parquet.write_table(self._pa.Table.from_arrays(
+                [self._pa.array(column, type=field.type)
+                 for column, field in zip(columns, self._schema)], schema=self._schema))
+        self.rows_written += len(columns[0]) if columns else 0
+
+    def close(self):
+        if self._csv is None:
+            self._parquet.close()
+        elif self._file is not sys.stdout:
+            self._file.close()
+
+
+def percentile(ordered: List[float], share: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+
+def run(input_path: str, specs: List[str], module_path: str = DEFAULT_MODULE,
+        output_path: Optional[str] = None, keep: List[str] = (), workers: int = 1,
+        chunk_size: int = 10000, resource_dir: str = '.', batch: bool = False) -> List[Dict[str, Any]]:
+    """Evaluate ``specs`` over the input file; returns one report per call."""
+    install_odps_standin(resource_dir)
+    calls = [UdfCall(spec).bind(load_module(module_path)) for spec in specs]
+    udtfs = [call for call in calls if call.is_udtf]
+    if udtfs and (len(calls) > 1 or keep):
+        raise ValueError('A UDTF call must be the only call, without --keep columns')
+
+    columns = list(dict.fromkeys(list(keep) + [name for call in calls for name in call.columns]))
+    writer = None
+    if output_path:
+        names = list(keep) + [name for call in calls for name in call.names]
+        kinds = [None] * len(keep) + [kind for call in calls
+                                      for kind in (call.result_types or [None] * len(call.names))]
+        writer = ResultWriter(output_path, names, kinds)
+
+    rows_in = 0
+    rows_out = [0] * len(calls)
+    latencies = [array('d') for _ in calls]
+    chunks = read_chunks(input_path, columns, chunk_size)
+    start = time.perf_counter()
+    try:
+        for chunk, (results, chunk_latencies) in _evaluate_all(
+                chunks, (module_path, specs, resource_dir, batch), workers):
+            rows_in += len(next(iter(chunk.values()))) if chunk else 0
+            for index, (result, latency) in enumerate(zip(results, chunk_latencies)):
+                latencies[index].extend(latency)
+                rows_out[index] += len(result)
+            if writer is None:
+                continue
+            if udtfs:
+                if results[0]:
+                    writer.write_columns([list(column) for column in zip(*results[0])])
+            else:
+                writer.write_columns([chunk[name] for name in keep] + [
+                    column for call, result in zip(calls, results)
+                    for column in _result_columns(call, result)])
+    finally:
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - start
+
+    reports = []
+    for call, latency, produced in zip(calls, latencies, rows_out):
+        ordered = sorted(latency)
+        busy = sum(ordered)
+        reports.append({
+            'call': call.spec,
+            'rows': rows_in,
+            'output_rows': produced,
+            'workers': workers,
+            'batch': batch and call.batchable,
+            'seconds': elapsed,
+            'udf_seconds': busy,
+            'rows_per_second': rows_in / max(elapsed, 1e-9),
+            'rows_per_udf_second': rows_in / max(busy, 1e-9),
+            'latency_us': {name: percentile(ordered, share) * 1e6 for name, share in
+                           (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))},
+        })
+    return reports
+
+
+def _result_columns(call: UdfCall, result: list) -> List[list]:
+    """Output columns of a UDF result; a multi-value result is split into its columns."""
+    if len(call.names) == 1:
+        return [result]
+    return [list(column) for column in zip(*result)] if result else [[] for _ in call.names]
+
+
+def _evaluate_all(chunks: Iterator[Dict[str, list]], init_args: tuple,
+                  workers: int) -> Iterator[tuple]:
+    """(chunk, results) pairs in input order, with at most 2 chunks per worker in flight."""
+    if workers <= 1:
+        evaluator = ChunkEvaluator(*init_args)
+        for chunk in chunks:
+            yield chunk, evaluator.evaluate(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=init_args) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_evaluate_chunk, chunk)))
+            if len(pending) >= 2 * workers:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+
+def print_report(reports: List[Dict[str, Any]], file=None):
+    """Print the reports to ``file`` (default: stdout)."""
+    for report in reports:
+        latency = report['latency_us']
+        mode = 'evaluate_batch' if report['batch'] else 'per row'
+        print(f"{report['call']} ({mode}, {report['workers']} worker(s)):", file=file)
+        print(f"  {report['rows']:,} rows -> {report['output_rows']:,} results in "
+              f"{report['seconds']:.2f}s, {report['rows_per_second']:,.0f} rows/s "
+              f"({report['rows_per_udf_second']:,.0f} rows per UDF second)", file=file)
+        print(f"  latency p50 {latency['p50']:.1f}us  p90 {latency['p90']:.1f}us  "
+              f"p99 {latency['p99']:.1f}us  max {latency['max']:.1f}us", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run MaxCompute Python UDFs over a local file')
+    parser.add_argument('input', help='CSV file with a header row, or a .parquet file')
+    parser.add_argument('--call', action='append', required=True, metavar='"Class(args) [AS name]"',
+                        help='UDF or UDTF call; repeat for several UDFs over the same input')
+    parser.add_argument('--module', default=DEFAULT_MODULE,
+                        help='UDF module file (default: udf/python/text_analytics.py)')
+    parser.add_argument('--output', help='Output file, CSV or .parquet (- for stdout)')
+    parser.add_argument('--keep', default='', help='Comma-separated input columns copied to the output')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='Rows per chunk sent to a worker (default: 10000)')
+    parser.add_argument('--resource-dir', default='.',
+                        help='Directory of the file resources the UDFs load (default: .)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Use evaluate_batch where a UDF has it and its per-call arguments are literals '
+                             '(latency is then the chunk mean)')
+    parser.add_argument('--report', help='Also write the reports to this JSON file')
+    args = parser.parse_args()
+
+    keep = [name.strip() for name in args.keep.split(',') if name.strip()]
+    try:
+        reports = run(args.input, args.call, args.module, args.output, keep, args.workers,
+                      args.chunk_size, args.resource_dir, args.batch)
+    except ValueError as error:
+        parser.error(str(error))
+    # Keep stdout to the CSV when the results go there
+    print_report(reports, sys.stderr if args.output == '-' else None)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(reports, report_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Local executor for the DataWorks workflow definitions in workflows/
+
+Parses a workflow like workflows/daily_etl_workflow.json and runs its nodes on
+the local SQL engine (local_engine.py): each node starts once all of its
+dependencies have succeeded, on a pool of ``--workers`` threads (default:
+the cores in ``resource_management.cpu``). When more nodes are ready than
+workers are free, the node with the longest path to the end of the workflow
+(by timeout) starts first, so the critical path is never kept waiting.
+
+ODPS_SQL nodes run the statements of ``sql_file``, or only the section of it
+named by ``sql_section`` (the numbered section writing that table, e.g.
+``product_performance`` is ``-- 3. PRODUCT PERFORMANCE ETL``). An elided
+``sql_content`` (``SELECT * FROM (...)``) runs the section of sql/ that writes
+its target table. SHELL nodes only run with --run-shell; otherwise they are
+skipped, so a local run sends no notifications.
+
+Every node is limited to its ``timeout`` and retried ``retry_count`` times
+(default: ``retry_policy.max_retries``), ``retry_policy.retry_interval``
+seconds apart. Nodes downstream of a failed node do not run. The report
+lists each node's timing, its slack and the critical path, and checks the
+makespan against ``monitoring.sla`` and ``monitoring.alerts``.
+
+Usage:
+    python workflow_runner.py ../workflows/daily_etl_workflow.json --data-dir generated_data --bizdate 20240115
+    python workflow_runner.py ../workflows/daily_etl_workflow.json --workers 3 --retry-interval 5 --report run.json
+    python workflow_runner.py ../workflows/daily_etl_workflow.json --dry-run   # schedule order only
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from local_engine import (BACKENDS, Backend, Engine, EngineError, Statement, duckdb, open_backend,
+                          parse_variable, split_script, substitute)
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Node states of a run
+SUCCESS, FAILED, SKIPPED, UPSTREAM_FAILED = 'success', 'failed', 'skipped', 'upstream_failed'
+
+DATABASE_ERRORS = (sqlite3.Error,) + ((duckdb.Error,) if duckdb is not None else ())
+
+
+class WorkflowNode:
+    """One node of a workflow definition."""
+
+    def __init__(self, spec: Dict[str, Any], default_retries: int = 0):
+        self.id = spec['id']
+        self.name = spec.get('name', self.id)
+        self.type = spec.get('type', 'ODPS_SQL')
+        self.sql_file = spec.get('sql_file')
+        self.sql_section = spec.get('sql_section')
+        self.sql_content = spec.get('sql_content')
+        self.command = spec.get('command')
+        self.parameters = spec.get('parameters', {})
+        self.timeout = spec.get('timeout')
+        self.retry_count = spec.get('retry_count', default_retries)
+        self.dependencies = list(spec.get('dependencies', []))
+
+    def __repr__(self):
+        return f'WorkflowNode({self.id!r})'
+
+
+class Workflow:
+    """Nodes, dependencies, retry policy, SLA and resources of a workflow definition."""
+
+    def __init__(self, spec: Dict[str, Any]):
+        spec = spec.get('workflow', spec)
+        self.name = spec.get('name', 'workflow')
+        self.parameters = spec.get('parameters', {})
+        error_handling = spec.get('error_handling', {})
+        self.retry_policy = error_handling.get('retry_policy', {})
+        self.on_failure = error_handling.get('on_failure', {})
+        monitoring = spec.get('monitoring', {})
+        self.sla = monitoring.get('sla', {})
+        self.alerts = monitoring.get('alerts', [])
+        self.resources = spec.get('resource_management', {})
+        default_retries = self.retry_policy.get('max_retries', 0)
+        self.nodes = {node['id']: WorkflowNode(node, default_retries) for node in spec.get('nodes', [])}
+        self.order = self._topological_order()
+
+    @classmethod
+    def load(cls, path: str) -> 'Workflow':
+        with open(path, 'r', encoding='utf-8') as workflow_file:
+            return cls(json.load(workflow_file))
+
+    def _topological_order(self) -> List[str]:
+        """Node IDs with every node after its dependencies; raises on unknown IDs and cycles."""
+        for node in self.nodes.values():
+            unknown = [dependency for dependency in node.dependencies if dependency not in self.nodes]
+            if unknown:
+                raise ValueError(f"Node {node.id} depends on unknown node(s): {', '.join(unknown)}")
+        remaining = {node_id: len(node.dependencies) for node_id, node in self.nodes.items()}
+        ready = [node_id for node_id, count in remaining.items() if count == 0]
+        order = []
+        while ready:
+            node_id = ready.pop(0)
+            order.append(node_id)
+            for dependent in self.dependents(node_id):
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) < len(self.nodes):
+            cycle = sorted(node_id for node_id, count in remaining.items() if count)
+            raise ValueError(f"Dependency cycle between: {', '.join(cycle)}")
+        return order
+
+    def dependents(self, node_id: str) -> List[str]:
+        return [node.id for node in self.nodes.values() if node_id in node.dependencies]
+
+    @property
+    def cores(self) -> Optional[int]:
+        """Cores of ``resource_management.cpu`` (e.g. ``"2 cores"``)."""
+        match = re.match(r'\s*(\d+)', str(self.resources.get('cpu', '')))
+        return int(match.group(1)) if match else None
+
+    def schedule(self, durations: Dict[str, float]) -> Dict[str, Tuple[float, float, float]]:
+        """Earliest start, earliest finish and latest start of every node with unlimited workers."""
+        earliest = {}
+        for node_id in self.order:
+            start = max((earliest[dependency][1] for dependency in self.nodes[node_id].dependencies),
+                        default=0.0)
+            earliest[node_id] = (start, start + durations[node_id])
+        makespan = max((finish for _, finish in earliest.values()), default=0.0)
+        latest = {}
+        for node_id in reversed(self.order):
+            finish = min((latest[dependent] for dependent in self.dependents(node_id)), default=makespan)
+            latest[node_id] = finish - durations[node_id]
+        return {node_id: (*earliest[node_id], latest[node_id]) for node_id in self.order}
+
+    def critical_path(self, durations: Dict[str, float]) -> Tuple[float, List[str]]:
+        """Length and nodes of the longest dependency chain under ``durations``."""
+        finish, previous = {}, {}
+        for node_id in self.order:
+            dependencies = self.nodes[node_id].dependencies
+            before = max(dependencies, key=lambda dependency: finish[dependency], default=None)
+            previous[node_id] = before
+            finish[node_id] = (finish[before] if before else 0.0) + durations[node_id]
+        if not finish:
+            return 0.0, []
+        node_id = max(finish, key=finish.get)
+        length, path = finish[node_id], []
+        while node_id is not None:
+            path.append(node_id)
+            node_id = previous[node_id]
+        return length, path[::-1]
+
+    def bottom_levels(self, durations: Dict[str, float]) -> Dict[str, float]:
+        """Longest path from the start of each node to the end of the workflow."""
+        levels = {}
+        for node_id in reversed(self.order):
+            levels[node_id] = durations[node_id] + max(
+                (levels[dependent] for dependent in self.dependents(node_id)), default=0.0)
+        return levels
+
+    def sla_status(self, makespan: float) -> str:
+        if 'critical_threshold' in self.sla and makespan > self.sla['critical_threshold']:
+            return 'CRITICAL'
+        if 'warning_threshold' in self.sla and makespan > self.sla['warning_threshold']:
+            return 'WARNING'
+        return 'OK'
+
+    def triggered_alerts(self, makespan: float, failed: bool) -> List[Dict[str, Any]]:
+        """Alerts whose ``condition`` holds, e.g. ``duration > warning_threshold``."""
+        values = dict(self.sla, duration=makespan)
+        triggered = []
+        for alert in self.alerts:
+            condition = alert.get('condition', '').strip()
+            if condition == 'any_node_failed':
+                holds = failed
+            else:
+                match = re.match(r'^(\w+)\s*(>=|<=|>|<)\s*([\w.]+)$', condition)
+                if not match:
+                    continue
+                left, operator, right = match.groups()
+                left = values.get(left)
+                right = values.get(right, float(right) if re.match(r'^[\d.]+$', right) else None)
+                if left is None or right is None:
+                    continue
+                holds = {'>': left > right, '>=': left >= right, '<': left < right, '<=': left <= right}[operator]
+            if holds:
+                triggered.append(alert)
+        return triggered
+
+
+def section_statements(path: str, section: Optional[str] = None) -> List[Statement]:
+    """Statements of ``path``; with ``section``, only the numbered section that writes
+    that table or, failing that, whose title contains its words."""
+    with open(path, 'r', encoding='utf-8') as script_file:
+        statements = split_script(script_file.read(), os.path.basename(path))
+    if section is None:
+        return statements
+    wanted = section.lower()
+    titles = [statement.section for statement in statements if statement.target == wanted]
+    if not titles:
+        words = wanted.replace('_', ' ')
+        titles = [statement.section for statement in statements
+                  if statement.section and words in statement.section.lower()]
+    if not titles:
+        raise EngineError(f'No section {section!r} in {path}')
+    return [statement for statement in statements if statement.section == titles[0]]
+
+
+def writing_section(table: str, sql_dir: str) -> Tuple[str, List[Statement]]:
+    """The script of ``sql_dir`` and its section that inserts into ``table``."""
+    for path in sorted(glob.glob(os.path.join(sql_dir, '*.sql'))):
+        with open(path, 'r', encoding='utf-8') as script_file:
+            statements = split_script(script_file.read(), os.path.basename(path))
+        for statement in statements:
+            if statement.target == table and statement.text.upper().startswith('INSERT'):
+                return path, [s for s in statements if s.section == statement.section]
+    raise EngineError(f'No script in {sql_dir} writes {table}')
+
+
+def resolve_statements(node: WorkflowNode, base_dir: str) -> Tuple[List[Statement], str]:
+    """Statements an ODPS_SQL node runs and where they come from."""
+    if node.sql_file:
+        statements = section_statements(os.path.join(base_dir, node.sql_file), node.sql_section)
+        section = statements[0].section if node.sql_section and statements else None
+        return statements, node.sql_file + (f' [{section}]' if section else '')
+    if node.sql_content:
+        statements = split_script(node.sql_content, node.id)
+        if '(...)' not in node.sql_content:
+            return statements, 'sql_content'
+        # An elided statement stands for the script section writing the same table
+        table = statements[0].target
+        path, section = writing_section(table, os.path.join(base_dir, 'sql'))
+        return section, f'{os.path.relpath(path, base_dir)} [{section[0].section}] for elided sql_content'
+    raise EngineError(f'Node {node.id} has neither sql_file nor sql_content')
+
+
+class NodeResult:
+    """Outcome and timing of one node in a run."""
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        self.status = None
+        self.attempts = 0
+        self.start = None
+        self.end = None
+        self.error = None
+        self.source = None
+        self.statements: List[Dict[str, Any]] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) if self.start is not None and self.end is not None else 0.0
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            'node': self.node_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'start': round(self.start - origin, 3) if self.start is not None else None,
+            'duration': round(self.duration, 3),
+            'error': self.error,
+            'source': self.source,
+            'statements': self.statements,
+        }
+
+
+class WorkflowRunner:
+    """Runs a workflow's nodes on a bounded thread pool in dependency order."""
+
+    def __init__(self, workflow: Workflow, open_connection: Optional[Callable[[], Backend]],
+                 variables: Dict[str, str], workers: int, base_dir: str = REPO_DIR,
+                 retry_interval: Optional[float] = None, run_shell: bool = False,
+                 dry_run: bool = False):
+        self.workflow = workflow
+        self.open_connection = open_connection
+        self.variables = variables
+        self.workers = workers
+        self.base_dir = base_dir
+        self.retry_interval = (workflow.retry_policy.get('retry_interval', 0)
+                               if retry_interval is None else retry_interval)
+        self.run_shell = run_shell
+        self.dry_run = dry_run
+        self.origin = None
+        self._lock = threading.Lock()
+
+    def log(self, message: str):
+        with self._lock:
+            print(f"[{time.perf_counter() - self.origin:9.3f}s] {message}", flush=True)
+
+    def run(self) -> Dict[str, NodeResult]:
+        """Run every node; returns their results by ID."""
+        workflow = self.workflow
+        timeouts = {node_id: float(node.timeout or 0) for node_id, node in workflow.nodes.items()}
+        priority = workflow.bottom_levels(timeouts)
+        results = {node_id: NodeResult(node_id) for node_id in workflow.nodes}
+        waiting = {node_id: set(node.dependencies) for node_id, node in workflow.nodes.items()}
+        ready = [node_id for node_id in workflow.order if not waiting[node_id]]
+        running = {}
+        self.origin = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while ready or running:
+                ready.sort(key=lambda node_id: -priority[node_id])
+                while ready and len(running) < self.workers:
+                    node_id = ready.pop(0)
+                    running[executor.submit(self.run_node, workflow.nodes[node_id], results[node_id])] = node_id
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node_id = running.pop(future)
+                    future.result()
+                    for dependent in workflow.dependents(node_id):
+                        waiting[dependent].discard(node_id)
+                        if results[node_id].status in (SUCCESS, SKIPPED):
+                            if not waiting[dependent]:
+                                ready.append(dependent)
+                        else:
+                            self._cancel(dependent, results, waiting)
+        return results
+
+    def _cancel(self, node_id: str, results: Dict[str, NodeResult], waiting: Dict[str, set]):
+        """Mark ``node_id`` and everything downstream of it as not run."""
+        if results[node_id].status is not None:
+            return
+        results[node_id].status = UPSTREAM_FAILED
+        waiting[node_id] = {None}
+        self.log(f"{node_id}: not run, an upstream node failed")
+        for dependent in self.workflow.dependents(node_id):
+            self._cancel(dependent, results, waiting)
+
+    def run_node(self, node: WorkflowNode, result: NodeResult):
+        """Run one node with its timeout and retries (in a worker thread)."""
+        result.start = time.perf_counter()
+        variables = dict(self.variables)
+        try:
+            variables.update({name: substitute(str(value), self.variables)
+                              for name, value in node.parameters.items()})
+        except EngineError as error:
+            result.status, result.error, result.end = FAILED, str(error), time.perf_counter()
+            self.log(f"{node.id}: failed, {error}")
+            return
+        if node.type == 'SHELL' and not self.run_shell:
+            result.status, result.end = SKIPPED, time.perf_counter()
+            self.log(f"{node.id}: SHELL node skipped (pass --run-shell to run it)")
+            return
+        for attempt in range(1 + max(int(node.retry_count or 0), 0)):
+            if attempt:
+                self.log(f"{node.id}: retry {attempt} in {self.retry_interval:g}s")
+                time.sleep(self.retry_interval)
+            result.attempts = attempt + 1
+            self.log(f"{node.id}: started" + (f" (attempt {attempt + 1})" if attempt else ''))
+            try:
+                if node.type == 'SHELL':
+                    self._run_shell(node, variables)
+                elif self.dry_run:
+                    result.source = resolve_statements(node, self.base_dir)[1]
+                else:
+                    self._run_sql(node, variables, result)
+                result.status, result.error = SUCCESS, None
+                break
+            except (EngineError, subprocess.SubprocessError, OSError, *DATABASE_ERRORS) as error:
+                result.status, result.error = FAILED, str(error).splitlines()[0] if str(error) else repr(error)
+                self.log(f"{node.id}: attempt {attempt + 1} failed: {result.error}")
+        result.end = time.perf_counter()
+        self.log(f"{node.id}: {result.status} in {result.duration:.3f}s")
+
+    def _run_sql(self, node: WorkflowNode, variables: Dict[str, str], result: NodeResult):
+        statements, result.source = resolve_statements(node, self.base_dir)
+        backend = self.open_connection()
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            backend.interrupt()
+
+        timer = threading.Timer(node.timeout, expire) if node.timeout else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        result.statements = []
+        try:
+            for statement in statements:
+                started = time.perf_counter()
+                rows = None
+                for sql in backend.translate(statement.text, variables):
+                    columns, _, count = backend.execute(sql)
+                    if columns is not None or count >= 0:
+                        rows = count
+                result.statements.append({'statement': statement.description,
+                                          'line': statement.line,
+                                          'seconds': round(time.perf_counter() - started, 6),
+                                          'rows': rows})
+        except Exception as error:
+            if timed_out.is_set():
+                raise EngineError(f'timed out after {node.timeout}s') from error
+            raise EngineError(f'{statement.description} ({statement.script}:{statement.line}): '
+                              f'{str(error).splitlines()[0]}') from error
+        finally:
+            if timer:
+                timer.cancel()
+            backend.close()
+
+    def _run_shell(self, node: WorkflowNode, variables: Dict[str, str]):
+        command = substitute(node.command or '', variables)
+        completed = subprocess.run(command, shell=True, timeout=node.timeout, cwd=self.base_dir,
+                                   capture_output=True, text=True)
+        if completed.returncode:
+            output = (completed.stderr or completed.stdout).strip().splitlines()
+            raise EngineError(f"exit status {completed.returncode}" + (f": {output[-1]}" if output else ''))
+
+
+def build_report(workflow: Workflow, results: Dict[str, NodeResult], origin: float) -> Dict[str, Any]:
+    durations = {node_id: result.duration for node_id, result in results.items()}
+    schedule = workflow.schedule(durations)
+    length, path = workflow.critical_path(durations)
+    ends = [result.end for result in results.values() if result.end is not None]
+    makespan = max(ends) - origin if ends else 0.0
+    failed = any(result.status in (FAILED, UPSTREAM_FAILED) for result in results.values())
+    nodes = []
+    for node_id in workflow.order:
+        entry = results[node_id].to_dict(origin)
+        earliest_start, _, latest_start = schedule[node_id]
+        entry['slack'] = round(latest_start - earliest_start, 3)
+        entry['critical'] = node_id in path
+        nodes.append(entry)
+    return {
+        'workflow': workflow.name,
+        'makespan': round(makespan, 3),
+        'critical_path': path,
+        'critical_path_seconds': round(length, 3),
+        'sla': dict(workflow.sla, status=workflow.sla_status(makespan)),
+        'alerts': workflow.triggered_alerts(makespan, failed),
+        'failed': failed,
+        'nodes': nodes,
+    }
+
+
+def print_report(workflow: Workflow, report: Dict[str, Any]):
+    print(f"\n{'Node':<24} {'Status':<16} {'Tries':>5} {'Start':>9} {'Duration':>9} {'Slack':>9}")
+    for entry in report['nodes']:
+        start = f"{entry['start']:.3f}" if entry['start'] is not None else '-'
+        marker = ' *' if entry['critical'] else ''
+        print(f"{entry['node']:<24} {entry['status']:<16} {entry['attempts']:>5} {start:>9} "
+              f"{entry['duration']:>9.3f} {entry['slack']:>9.3f}{marker}")
+        for detail in (entry['source'], entry['error']):
+            if detail:
+                print(f"{'':<24} {detail}")
+    print(f"\nCritical path (*): {' -> '.join(report['critical_path'])} "
+          f"({report['critical_path_seconds']:.3f}s)")
+    sla = report['sla']
+    thresholds = ', '.join(f"{name} {sla[name]}s" for name in
+                           ('expected_duration', 'warning_threshold', 'critical_threshold') if name in sla)
+    print(f"Makespan: {report['makespan']:.3f}s, SLA {sla['status']}" + (f" ({thresholds})" if thresholds else ''))
+    for alert in report['alerts']:
+        print(f"Alert [{alert.get('action', 'alert')}]: {alert.get('message', alert.get('condition'))}")
+    if report['failed'] and workflow.on_failure:
+        notification = workflow.on_failure.get('notification', {})
+        print(f"On failure: {workflow.on_failure.get('action', 'alert')} "
+              f"({notification.get('type', '')} to {', '.join(notification.get('recipients', []))})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a DataWorks workflow definition locally')
+    parser.add_argument('workflow', help='Workflow JSON, e.g. workflows/daily_etl_workflow.json')
+    parser.add_argument('--data-dir', default='generated_data',
+                        help='Directory with the table CSV files (default: generated_data)')
+    parser.add_argument('--bizdate', default=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'),
+                        help='Value of ${bizdate} (default: yesterday)')
+    parser.add_argument('--var', type=parse_variable, action='append', default=[],
+                        help='Another ${name} parameter as name=value (repeatable)')
+    parser.add_argument('--workers', type=int,
+                        help='Nodes running at once (default: resource_management cpu cores)')
+    parser.add_argument('--backend', choices=['auto', *BACKENDS], default='auto',
+                        help='Embedded database (default: duckdb when installed, else sqlite)')
+    parser.add_argument('--database', help='Database file to keep (default: a temporary file)')
+    parser.add_argument('--no-load', action='store_true',
+                        help='Do not load the source tables (use those in --database)')
+    parser.add_argument('--retry-interval', type=float,
+                        help='Seconds between retries (default: retry_policy.retry_interval)')
+    parser.add_argument('--run-shell', action='store_true', help='Run SHELL nodes instead of skipping them')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Resolve and schedule the nodes without running SQL')
+    parser.add_argument('--base-dir', default=REPO_DIR,
+                        help='Directory sql_file paths are relative to (default: the repository)')
+    parser.add_argument('--report', help='Write the run report to this JSON file')
+    args = parser.parse_args()
+
+    try:
+        workflow = Workflow.load(args.workflow)
+    except (OSError, ValueError, KeyError) as error:
+        parser.error(f'Cannot load {args.workflow}: {error}')
+    workers = args.workers or workflow.cores or os.cpu_count() or 1
+    variables = dict(args.var, bizdate=args.bizdate)
+    backend_name = args.backend
+    if backend_name == 'auto':
+        backend_name = 'duckdb' if duckdb is not None else 'sqlite'
+    directory = None
+    database = args.database
+    if database is None:
+        directory = tempfile.mkdtemp(prefix='workflow_')
+        database = os.path.join(directory, f'workflow.{backend_name}')
+    backend = None
+    try:
+        if not args.dry_run:
+            # Opened once; each node runs on a session of its own against it
+            backend = open_backend(backend_name, database)
+            if not args.no_load:
+                Engine(backend, variables).load(args.data_dir)
+        print(f"\nRunning {workflow.name}: {len(workflow.nodes)} nodes on {workers} worker(s)")
+        runner = WorkflowRunner(workflow, backend.session if backend else None, variables,
+                                workers, args.base_dir, args.retry_interval, args.run_shell, args.dry_run)
+        results = runner.run()
+        report = build_report(workflow, results, runner.origin)
+    finally:
+        if backend:
+            backend.close()
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print_report(workflow, report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Report written to {args.report}")
+    if report['failed'] or report['sla']['status'] == 'CRITICAL':
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
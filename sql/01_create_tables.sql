@@ -80,4 +80,58 @@ CREATE TABLE web_sessions (
 )
 PARTITIONED BY (ds STRING)
 COMMENT 'Web analytics session data'
-LIFECYCLE 90; -- Shorter retention for web data
\ No newline at end of file
+LIFECYCLE 90; -- Shorter retention for web data
+
+-- 6. Create Page Views Table
+DROP TABLE IF EXISTS page_views;
+CREATE TABLE page_views (
+    page_view_id STRING,
+    session_id STRING,
+    user_id STRING,
+    page_url STRING,
+    page_title STRING,
+    `timestamp` DATETIME, -- Reserved word, quoted
+    time_on_page_seconds BIGINT,
+    referrer_url STRING,
+    exit_page BOOLEAN
+)
+PARTITIONED BY (ds STRING)
+COMMENT 'Web analytics page view events'
+LIFECYCLE 90;
+
+-- 7. Create User Events Table
+DROP TABLE IF EXISTS user_events;
+CREATE TABLE user_events (
+    event_id STRING,
+    session_id STRING,
+    user_id STRING,
+    event_type STRING,
+    event_timestamp DATETIME,
+    page_url STRING,
+    element_id STRING,
+    element_type STRING,
+    event_data STRING
+)
+PARTITIONED BY (ds STRING)
+COMMENT 'Custom user interaction events'
+LIFECYCLE 90;
+
+
+-- 8. Create Customers Delta Table
+-- Daily customer changes written by scripts/data_generator.py --daily
+DROP TABLE IF EXISTS customers_delta;
+CREATE TABLE customers_delta (
+    customer_id STRING,
+    first_name STRING,
+    last_name STRING,
+    email STRING,
+    phone STRING,
+    registration_date DATETIME,
+    country STRING,
+    city STRING,
+    age_group STRING,
+    change_type STRING -- INSERT, UPDATE, DELETE
+)
+PARTITIONED BY (ds STRING)
+COMMENT 'Daily customer inserts, updates and deletes'
+LIFECYCLE 30;
\ No newline at end of file
@@ -13,91 +13,274 @@ Usage Examples:
 SELECT text_sentiment('This product is amazing!') as sentiment;
 SELECT text_keywords('The quick brown fox jumps over the lazy dog') as keywords;
 SELECT text_similarity('hello world', 'hello earth') as similarity;
+
+Batch usage (offline pipelines, no MaxCompute runtime needed):
+from text_analytics import evaluate_batch
+sentiments = evaluate_batch('sentiment', review_texts)
 """
 
-from odps.udf import annotate
-from odps.udf import BaseUDF
+import heapq
+import io
 import re
 import math
-from collections import Counter
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
 
+try:
+    from odps.udf import annotate
+    from odps.udf import BaseUDF, BaseUDTF
+except ImportError:
+    # Outside MaxCompute the UDF classes are plain Python classes, so offline
+    # pipelines can import this module and call evaluate/evaluate_batch
+    def annotate(signature):
+        return lambda cls: cls
 
-@annotate("string->string")
-class TextSentiment(BaseUDF):
+    class BaseUDF(object):
+        pass
+
+    class BaseUDTF(object):
+        def forward(self, *values):
+            raise NotImplementedError('forward() is only available inside MaxCompute')
+
+
+# Word tokenizer shared by every UDF. A greedy \w+ run always ends at a word
+# boundary, so this yields the same tokens as \b\w+\b with less backtracking
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase ``text`` and split it into word tokens."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+# Built-in sentiment lexicon
+POSITIVE_WORDS = (
+    'good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic',
+    'awesome', 'perfect', 'love', 'like', 'best', 'brilliant',
+    'outstanding', 'superb', 'magnificent', 'terrific', 'marvelous',
+    'happy', 'pleased', 'satisfied', 'delighted', 'thrilled'
+)
+
+NEGATIVE_WORDS = (
+    'bad', 'terrible', 'awful', 'horrible', 'disgusting', 'hate',
+    'dislike', 'worst', 'pathetic', 'useless', 'disappointing',
+    'frustrated', 'angry', 'sad', 'upset', 'annoyed', 'furious',
+    'poor', 'inferior', 'defective', 'broken', 'failed'
+)
+
+# Negation words that can flip sentiment
+NEGATION_WORDS = (
+    'not', 'no', 'never', 'nothing', 'nowhere', 'nobody',
+    'none', 'neither', 'nor', 'cannot', 'cant', 'wont', 'dont'
+)
+
+
+class SentimentLexicon(object):
     """
-    Simple sentiment analysis using keyword-based approach
-    Returns: positive, negative, or neutral
+    Weighted sentiment words and phrases, compiled into a trie over tokens
+    
+    Scoring walks the tokens once, following the trie from each token for
+    the longest phrase starting there, so the cost per row depends on the
+    text and the longest phrase, not on the size of the lexicon. A negation
+    word flips the weight of the next word or phrase, unless it starts a
+    phrase of its own (e.g. "not bad at all").
     """
     
-    def __init__(self):
-        # Simple sentiment dictionaries
-        self.positive_words = {
-            'good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic',
-            'awesome', 'perfect', 'love', 'like', 'best', 'brilliant',
-            'outstanding', 'superb', 'magnificent', 'terrific', 'marvelous',
-            'happy', 'pleased', 'satisfied', 'delighted', 'thrilled'
-        }
-        
-        self.negative_words = {
-            'bad', 'terrible', 'awful', 'horrible', 'disgusting', 'hate',
-            'dislike', 'worst', 'pathetic', 'useless', 'disappointing',
-            'frustrated', 'angry', 'sad', 'upset', 'annoyed', 'furious',
-            'poor', 'inferior', 'defective', 'broken', 'failed'
-        }
-        
-        # Negation words that can flip sentiment
-        self.negation_words = {
-            'not', 'no', 'never', 'nothing', 'nowhere', 'nobody',
-            'none', 'neither', 'nor', 'cannot', 'cant', 'wont', 'dont'
-        }
+    def __init__(self, entries, negation_words):
+        # word -> [weight of the phrase ending here or None, child trie or None]
+        self.trie = {}
+        self.negation_words = frozenset(negation_words)
+        for phrase, weight in entries:
+            words = tokenize(phrase)
+            if not words:
+                continue
+            node = self.trie
+            for word in words[:-1]:
+                entry = node.setdefault(word, [None, None])
+                if entry[1] is None:
+                    entry[1] = {}
+                node = entry[1]
+            node.setdefault(words[-1], [None, None])[0] = weight
     
-    def evaluate(self, text):
-        if not text:
-            return 'neutral'
-        
-        # Clean and tokenize text
-        words = re.findall(r'\b\w+\b', text.lower())
-        
-        positive_score = 0
-        negative_score = 0
+    @classmethod
+    def default(cls):
+        """The built-in lexicon: +1 per positive word, -1 per negative word."""
+        entries = [(word, 1) for word in POSITIVE_WORDS] + [(word, -1) for word in NEGATIVE_WORDS]
+        return cls(entries, NEGATION_WORDS)
+    
+    @classmethod
+    def parse(cls, lines):
+        """
+        Lexicon of a resource file, one entry per line: a word or phrase, a
+        tab and its weight, or NEGATION for a negation word; # starts a comment
+        """
+        entries = []
+        negation_words = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            phrase, separator, weight = line.rpartition('\t')
+            if not separator:
+                raise ValueError('Invalid lexicon line, expected phrase<TAB>weight: %r' % line)
+            if weight.strip().upper() == 'NEGATION':
+                negation_words.extend(tokenize(phrase))
+            else:
+                entries.append((phrase, float(weight)))
+        return cls(entries, negation_words)
+    
+    def score(self, words):
+        """Net sentiment weight of a tokenized text: positive above 0, negative below."""
+        trie, negation_words = self.trie, self.negation_words
+        total = 0
         negate = False
+        position, count = 0, len(words)
         
-        for word in words:
+        while position < count:
+            word = words[position]
+            entry = trie.get(word)
+            weight, length = None, 0
+            # Longest phrase starting at this word
+            end = position
+            while entry is not None:
+                if entry[0] is not None:
+                    weight, length = entry[0], end - position + 1
+                end += 1
+                if entry[1] is None or end == count:
+                    break
+                entry = entry[1].get(words[end])
+            
             # Check for negation
-            if word in self.negation_words:
+            if length < 2 and word in negation_words:
                 negate = True
+                position += 1
                 continue
             
-            # Score sentiment
-            if word in self.positive_words:
-                if negate:
-                    negative_score += 1
-                else:
-                    positive_score += 1
-            elif word in self.negative_words:
-                if negate:
-                    positive_score += 1
-                else:
-                    negative_score += 1
-            
-            # Reset negation after 2 words
-            if negate:
-                negate = False
+            if weight is not None:
+                total += -weight if negate else weight
+                position += length
+            else:
+                position += 1
+            # Negation only applies to the next word or phrase
+            negate = False
         
-        # Determine overall sentiment
-        if positive_score > negative_score:
+        return total
+    
+    def label(self, words):
+        """Sentiment label of a tokenized text."""
+        total = self.score(words)
+        if total > 0:
             return 'positive'
-        elif negative_score > positive_score:
+        elif total < 0:
             return 'negative'
         else:
             return 'neutral'
 
 
+# Compiled lexicons by resource name (None for the built-in one), so each
+# worker loads a lexicon once however many UDF instances use it
+_lexicons = {}
+
+
+def load_lexicon(name=None):
+    """
+    Compiled sentiment lexicon of a MaxCompute file resource (a local file
+    outside MaxCompute), or the built-in lexicon without a name
+    """
+    name = name or None
+    lexicon = _lexicons.get(name)
+    if lexicon is None:
+        if name is None:
+            lexicon = SentimentLexicon.default()
+        else:
+            try:
+                from odps.distcache import get_cache_file
+            except ImportError:
+                lexicon_file = io.open(name, encoding='utf-8')
+            else:
+                lexicon_file = get_cache_file(name)
+            try:
+                lexicon = SentimentLexicon.parse(lexicon_file)
+            finally:
+                lexicon_file.close()
+        _lexicons[name] = lexicon
+    return lexicon
+
+
+@annotate("string->string")
+class TextSentiment(BaseUDF):
+    """
+    Simple sentiment analysis using keyword-based approach
+    Returns: positive, negative, or neutral
+    """
+    
+    def __init__(self):
+        self.lexicon = load_lexicon()
+    
+    def evaluate(self, text):
+        if not text:
+            return 'neutral'
+        
+        return self.score(tokenize(text))
+    
+    def evaluate_batch(self, texts):
+        """Evaluate a list or column of texts; returns a list of results."""
+        score, findall = self.score, WORD_PATTERN.findall
+        return [score(findall(text.lower())) if text else 'neutral' for text in texts]
+    
+    def score(self, words):
+        """Sentiment of an already tokenized text."""
+        return self.lexicon.label(words)
+
+
+@annotate("string,string->double")
+class TextSentimentScore(BaseUDF):
+    """
+    Weighted sentiment score using a lexicon file resource (see
+    SentimentLexicon.parse); an empty lexicon name uses the built-in lexicon
+    Returns: the net weight, positive above 0 and negative below
+    """
+    
+    def evaluate(self, text, lexicon):
+        if not text:
+            return 0.0
+        
+        return float(load_lexicon(lexicon).score(tokenize(text)))
+    
+    def evaluate_batch(self, texts, lexicon):
+        """Score a list or column of texts with one lexicon; returns a list of results."""
+        score, findall = load_lexicon(lexicon).score, WORD_PATTERN.findall
+        return [float(score(findall(text.lower()))) if text else 0.0 for text in texts]
+
+
+@annotate("string,string->string")
+class TextSentimentLabel(BaseUDF):
+    """
+    Sentiment using a lexicon file resource; an empty lexicon name uses the
+    built-in lexicon, like text_sentiment
+    Returns: positive, negative, or neutral
+    """
+    
+    def evaluate(self, text, lexicon):
+        if not text:
+            return 'neutral'
+        
+        return load_lexicon(lexicon).label(tokenize(text))
+    
+    def evaluate_batch(self, texts, lexicon):
+        """Label a list or column of texts with one lexicon; returns a list of results."""
+        label, findall = load_lexicon(lexicon).label, WORD_PATTERN.findall
+        return [label(findall(text.lower())) if text else 'neutral' for text in texts]
+
+
 @annotate("string->string")
 class TextKeywords(BaseUDF):
     """
-    Extract keywords from text using TF-IDF-like scoring
+    Extract keywords from text, scored by frequency * word length
     Returns comma-separated list of top keywords
+    (text_keywords_tfidf scores by TF-IDF against a corpus IDF table)
     """
     
     def __init__(self):
@@ -116,9 +299,15 @@ class TextKeywords(BaseUDF):
         if not text:
             return ''
         
-        # Clean and tokenize
-        words = re.findall(r'\b\w+\b', text.lower())
-        
+        return self.extract(tokenize(text))
+    
+    def evaluate_batch(self, texts):
+        """Evaluate a list or column of texts; returns a list of results."""
+        extract, findall = self.extract, WORD_PATTERN.findall
+        return [extract(findall(text.lower())) if text else '' for text in texts]
+    
+    def extract(self, words):
+        """Top keywords of an already tokenized text."""
         # Filter out stop words and short words
         filtered_words = [
             word for word in words 
@@ -131,16 +320,159 @@ class TextKeywords(BaseUDF):
         # Count word frequencies
         word_freq = Counter(filtered_words)
         
-        # Simple keyword scoring (frequency * length)
-        scored_words = [
-            (word, freq * len(word)) 
-            for word, freq in word_freq.items()
-        ]
+        # Simple keyword scoring (frequency * length); top 5 by score, ties in
+        # first-occurrence order as with a stable sort
+        top_keywords = heapq.nlargest(5, word_freq, key=lambda word: word_freq[word] * len(word))
+        
+        return ','.join(top_keywords)
+
+
+IDF_TABLE_MAGIC = b'IDF1'
+
+
+def build_idf_table(texts, path, min_df=1):
+    """
+    Stream a corpus of texts and write its IDF table to ``path``; returns
+    the number of documents. Words in fewer than min_df documents are left
+    out (they get the IDF of an unseen word).
+    
+    The table is one binary file: a header line
+    ``IDF1<TAB>documents<TAB>words<TAB>word bytes``, the sorted words
+    separated by newlines (UTF-8), then one little-endian float32 IDF per
+    word, smoothed as log((1 + documents) / (1 + df)) + 1.
+    """
+    document_frequency = Counter()
+    documents = 0
+    for text in texts:
+        documents += 1
+        if text:
+            document_frequency.update(set(tokenize(text)))
+    
+    words = sorted(word for word, df in document_frequency.items() if df >= min_df)
+    idfs = array('f', [math.log((1.0 + documents) / (1 + document_frequency[word])) + 1
+                       for word in words])
+    if sys.byteorder == 'big':
+        idfs.byteswap()
+    word_bytes = u'\n'.join(words).encode('utf-8')
+    
+    with io.open(path, 'wb') as table_file:
+        header = u'%s\t%d\t%d\t%d\n' % (IDF_TABLE_MAGIC.decode('ascii'), documents,
+                                         len(words), len(word_bytes))
+        table_file.write(header.encode('ascii'))
+        table_file.write(word_bytes)
+        table_file.write(idfs.tostring() if bytes is str else idfs.tobytes())
+    return documents
+
+
+class IdfTable(object):
+    """
+    Inverse document frequencies of a corpus (see build_idf_table)
+    Words stay a sorted list and IDFs a float32 array, so loading is a few
+    bulk reads and lookups are a binary search, with no per-word parsing
+    """
+    
+    def __init__(self, documents, words, idfs):
+        self.documents = documents
+        self.words = words
+        self.idfs = idfs
+        # IDF of a word no document contains
+        self.unseen_idf = math.log(1.0 + documents) + 1
+    
+    @classmethod
+    def read(cls, data):
+        """Table of the contents of a build_idf_table file."""
+        header_end = data.index(b'\n') + 1
+        magic, documents, count, word_bytes = data[:header_end].split(b'\t')
+        if magic != IDF_TABLE_MAGIC:
+            raise ValueError('Not an IDF table (expected a %r header)' % IDF_TABLE_MAGIC)
+        count, words_end = int(count), header_end + int(word_bytes)
+        words = data[header_end:words_end].decode('utf-8').split(u'\n') if count else []
+        idfs = array('f')
+        if bytes is str:
+            idfs.fromstring(data[words_end:words_end + 4 * count])
+        else:
+            idfs.frombytes(data[words_end:words_end + 4 * count])
+        if sys.byteorder == 'big':
+            idfs.byteswap()
+        return cls(int(documents), words, idfs)
+    
+    def idf(self, word):
+        words = self.words
+        index = bisect_left(words, word)
+        if index < len(words) and words[index] == word:
+            return self.idfs[index]
+        return self.unseen_idf
+
+
+# IDF tables by resource name, loaded on first use once per worker
+_idf_tables = {}
+
+
+def load_idf_table(name):
+    """IDF table of a MaxCompute file resource (a local file outside MaxCompute)."""
+    table = _idf_tables.get(name)
+    if table is None:
+        try:
+            from odps.distcache import get_cache_file
+        except ImportError:
+            table_file = io.open(name, 'rb')
+        else:
+            table_file = get_cache_file(name, 'b')
+        try:
+            table = _idf_tables[name] = IdfTable.read(table_file.read())
+        finally:
+            table_file.close()
+    return table
+
+
+@annotate("string,string,bigint,string->string")
+class TextKeywordsTfidf(BaseUDF):
+    """
+    Extract keywords by TF-IDF against an IDF table file resource built with
+    build_idf_table (python text_analytics.py idf-table ...)
+    Arguments: text, IDF table resource, number of keywords (default 5),
+    output format: 'words' (default) for word1,word2,... or 'scores' for
+    word1:score1,word2:score2,...
+    """
+    
+    output_formats = ('words', 'scores')
+    
+    def __init__(self):
+        self.stop_words = TextKeywords().stop_words
+    
+    def evaluate(self, text, idf_table, top_k, output_format):
+        if not text:
+            return ''
         
-        # Sort by score and return top 5
-        top_keywords = sorted(scored_words, key=lambda x: x[1], reverse=True)[:5]
+        return self.extract(tokenize(text), load_idf_table(idf_table), top_k, output_format)
+    
+    def evaluate_batch(self, texts, idf_table, top_k, output_format):
+        """Evaluate a list or column of texts with one IDF table; returns a list of results."""
+        table, extract, findall = load_idf_table(idf_table), self.extract, WORD_PATTERN.findall
+        return [extract(findall(text.lower()), table, top_k, output_format) if text else ''
+                for text in texts]
+    
+    def extract(self, words, table, top_k=None, output_format=None):
+        """Top keywords of an already tokenized text."""
+        output_format = output_format or 'words'
+        if output_format not in self.output_formats:
+            raise ValueError('Unsupported keyword output format: %s' % output_format)
+        
+        stop_words = self.stop_words
+        word_freq = Counter(word for word in words if len(word) > 2 and word not in stop_words)
+        if not word_freq:
+            return ''
         
-        return ','.join([word for word, score in top_keywords])
+        # TF (share of the text's keywords) * IDF; the top_k by heap, ties
+        # in first-occurrence order
+        total = float(sum(word_freq.values()))
+        idf = table.idf
+        scores = dict((word, freq / total * idf(word)) for word, freq in word_freq.items())
+        top_keywords = heapq.nlargest(5 if top_k is None else top_k, scores, key=scores.get)
+        
+        if output_format == 'scores':
+            return ','.join('%s:%.4f' % (word, scores[word]) for word in top_keywords)
+        return ','.join(top_keywords)
 
 
 @annotate("string,string->double")
@@ -154,10 +486,18 @@ class TextSimilarity(BaseUDF):
         if not text1 or not text2:
             return 0.0
         
-        # Tokenize both texts
-        words1 = set(re.findall(r'\b\w+\b', text1.lower()))
-        words2 = set(re.findall(r'\b\w+\b', text2.lower()))
-        
+        return self.jaccard(set(tokenize(text1)), set(tokenize(text2)))
+    
+    def evaluate_batch(self, texts1, texts2):
+        """Evaluate two lists or columns of texts pairwise; returns a list of results."""
+        jaccard, findall = self.jaccard, WORD_PATTERN.findall
+        return [jaccard(set(findall(text1.lower())), set(findall(text2.lower())))
+                if text1 and text2 else 0.0
+                for text1, text2 in zip(texts1, texts2)]
+    
+    @staticmethod
+    def jaccard(words1, words2):
+        """Similarity of two word sets."""
         # Calculate Jaccard similarity (intersection over union)
         intersection = len(words1.intersection(words2))
         union = len(words1.union(words2))
@@ -168,6 +508,106 @@ class TextSimilarity(BaseUDF):
         return float(intersection) / float(union)
 
 
+def similar_pairs(records, threshold):
+    """
+    All pairs of (key, text) records whose text_similarity is at least
+    threshold, as (key1, key2, similarity) tuples in input order.
+    
+    Exact all-pairs search over an inverted index of each record's rarest
+    words (prefix filtering, as in the AllPairs/PPJoin algorithms). Records
+    are processed in order of size. Two word sets x >= y with Jaccard
+    similarity >= threshold share at least ceil(threshold / (1 + threshold)
+    * (|x| + |y|)) words, so they meet in the index through the first words
+    of each set in rarest-first order. Candidates that cannot reach that
+    overlap are dropped, and every emitted similarity is
+    TextSimilarity.jaccard of the two word sets.
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError('threshold must be in (0, 1]: %r' % threshold)
+    
+    keys = []
+    word_sets = []
+    for key, text in records:
+        keys.append(key)
+        word_sets.append(set(tokenize(text)) if text else set())
+    
+    frequency = Counter(word for words in word_sets for word in words)
+    rarity = lambda word: (frequency[word], word)
+    jaccard = TextSimilarity.jaccard
+    overlap_share = threshold / (1 + threshold)
+    # Slack so float rounding of threshold * size never shortens a prefix
+    epsilon = 1e-9
+    
+    index = {}
+    pairs = []
+    for i in sorted(range(len(word_sets)), key=lambda i: len(word_sets[i])):
+        words = word_sets[i]
+        size = len(words)
+        if not size:
+            continue
+        ordered = sorted(words, key=rarity)
+        probe_prefix = size - int(math.ceil(threshold * size - epsilon)) + 1
+        index_prefix = size - int(math.ceil(2 * overlap_share * size - epsilon)) + 1
+        min_size = threshold * size - epsilon
+        
+        # Words shared with each candidate so far (None once it cannot reach
+        # the overlap needed for the threshold)
+        overlaps = {}
+        for position, word in enumerate(ordered[:probe_prefix]):
+            postings = index.get(word)
+            if not postings:
+                continue
+            # Postings are in order of size and min_size only grows, so
+            # records too small for this one are too small for all later ones
+            while postings and len(word_sets[postings[0][0]]) < min_size:
+                postings.popleft()
+            for j, other_position in postings:
+                other_size = len(word_sets[j])
+                overlap = overlaps.get(j, 0)
+                if overlap is None:
+                    continue
+                needed = math.ceil(overlap_share * (size + other_size) - epsilon)
+                rest = min(size - position, other_size - other_position) - 1
+                overlaps[j] = overlap + 1 if overlap + 1 + rest >= needed else None
+        
+        for position, word in enumerate(ordered[:index_prefix]):
+            index.setdefault(word, deque()).append((i, position))
+        
+        for j, overlap in overlaps.items():
+            if overlap is None:
+                continue
+            similarity = jaccard(word_sets[j], words)
+            if similarity >= threshold:
+                pairs.append((min(i, j), max(i, j), similarity))
+    
+    pairs.sort()
+    return [(keys[i], keys[j], similarity) for i, j, similarity in pairs]
+
+
+@annotate("string,string,string,double->string,string,string,double")
+class TextSimilarPairs(BaseUDTF):
+    """
+    Similar text pairs within groups, without a CROSS JOIN
+    Buffers (group, key, text) rows and on close emits group, key1, key2 and
+    similarity for every pair of rows of the same group whose
+    text_similarity is at least threshold (see similar_pairs)
+    """
+    
+    def __init__(self):
+        self.groups = {}
+        self.threshold = None
+    
+    def process(self, group, key, text, threshold):
+        self.threshold = threshold
+        self.groups.setdefault(group, []).append((key, text))
+    
+    def close(self):
+        for group, records in self.groups.items():
+            for key1, key2, similarity in similar_pairs(records, self.threshold):
+                self.forward(group, key1, key2, similarity)
+        self.groups = {}
+
+
 @annotate("string->bigint")
 class TextWordCount(BaseUDF):
     """
@@ -184,13 +624,41 @@ class TextWordCount(BaseUDF):
         if not text:
             return 0
         
-        words = re.findall(r'\b\w+\b', text.lower())
-        meaningful_words = [
-            word for word in words 
-            if word not in self.stop_words and len(word) > 2
-        ]
-        
-        return len(meaningful_words)
+        return self.count(tokenize(text))
+    
+    def evaluate_batch(self, texts):
+        """Evaluate a list or column of texts; returns a list of results."""
+        count, findall = self.count, WORD_PATTERN.findall
+        return [count(findall(text.lower())) if text else 0 for text in texts]
+    
+    def count(self, words):
+        """Meaningful words in an already tokenized text."""
+        stop_words = self.stop_words
+        return sum(1 for word in words if len(word) > 2 and word not in stop_words)
+
+
+# Scripts counted by the language detector, and their code point ranges
+SCRIPTS = ('latin', 'chinese', 'japanese', 'korean', 'arabic')
+SCRIPT_RANGES = (
+    (0x0041, 0x005a, 0),  # A-Z
+    (0x0061, 0x007a, 0),  # a-z
+    (0x4e00, 0x9fff, 1),  # CJK unified ideographs
+    (0x3040, 0x30ff, 2),  # hiragana and katakana
+    (0xac00, 0xd7af, 3),  # hangul syllables
+    (0x0600, 0x06ff, 4),  # arabic
+)
+OTHER_SCRIPT = len(SCRIPTS)
+
+
+def _script_table():
+    """Script index of every BMP code point (OTHER_SCRIPT outside the ranges)."""
+    table = bytearray([OTHER_SCRIPT]) * 0x10000
+    for first, last, script in SCRIPT_RANGES:
+        table[first:last + 1] = bytearray([script]) * (last + 1 - first)
+    return table
+
+
+SCRIPT_TABLE = _script_table()
 
 
 @annotate("string->string")
@@ -200,51 +668,125 @@ class TextLanguageDetect(BaseUDF):
     Returns: english, chinese, japanese, korean, arabic, or unknown
     """
     
+    # Decision rules, tried in order: (script, share of the text it must
+    # exceed, language); 'unknown' if none applies
+    rules = ((0, 0.7, 'english'), (1, 0.3, 'chinese'), (2, 0.3, 'japanese'),
+             (3, 0.3, 'korean'), (4, 0.3, 'arabic'))
+    
+    # Texts are scanned block_size characters at a time, so the scan can
+    # stop once the remaining characters cannot change the language
+    early_exit = True
+    block_size = 4096
+    
     def evaluate(self, text):
         if not text:
             return 'unknown'
         
-        # Count different character types
-        latin_chars = len(re.findall(r'[a-zA-Z]', text))
-        chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-        japanese_chars = len(re.findall(r'[\u3040-\u309f\u30a0-\u30ff]', text))
-        korean_chars = len(re.findall(r'[\uac00-\ud7af]', text))
-        arabic_chars = len(re.findall(r'[\u0600-\u06ff]', text))
-        
+        return self.detect(text)
+    
+    def detect(self, text):
+        """Language of a non-empty text."""
+        return self.scan(text, self.early_exit)[1]
+    
+    def script_counts(self, text):
+        """Latin, chinese, japanese, korean and arabic character counts of a text."""
+        if not text:
+            return [0] * len(SCRIPTS)
+        return self.scan(text, False)[0]
+    
+    def scan(self, text, early_exit):
+        """
+        Script counts and language of a non-empty text. Every code point is
+        classified once through SCRIPT_TABLE, per distinct character of a
+        block; with early_exit the counts stop where the language is settled
+        """
         total_chars = len(text)
+        block_size = self.block_size if early_exit else total_chars
+        counts = [0] * (len(SCRIPTS) + 1)
+        table = SCRIPT_TABLE
         
-        # Calculate percentages
-        if total_chars == 0:
-            return 'unknown'
+        for start in range(0, total_chars, block_size):
+            for char, char_count in Counter(text[start:start + block_size]).items():
+                code = ord(char)
+                counts[table[code] if code < 0x10000 else OTHER_SCRIPT] += char_count
+            remaining = max(total_chars - start - block_size, 0)
+            language = self.decide(counts, total_chars, remaining)
+            if language is not None:
+                return counts[:-1], language
+    
+    def decide(self, counts, total_chars, remaining):
+        """
+        Language given the script counts so far, or None while the
+        remaining (not yet counted) characters could still change it
+        """
+        for script, share, language in self.rules:
+            if counts[script] / total_chars > share:
+                return language
+            if (counts[script] + remaining) / total_chars > share:
+                return None
+        return 'unknown'
+    
+    def evaluate_batch(self, texts):
+        """Evaluate a list or column of texts; returns a list of results."""
+        evaluate = self.evaluate
+        return [evaluate(text) for text in texts]
+
+
+@annotate("string->string,bigint,bigint,bigint,bigint,bigint,bigint")
+class TextLanguageProfile(BaseUDTF):
+    """
+    Language of a text with the character counts behind it
+    Emits language, total_chars and the latin, chinese, japanese, korean and
+    arabic character counts, from a single scan of the text
+    """
+    
+    def __init__(self):
+        self.detector = TextLanguageDetect()
+    
+    def process(self, text):
+        self.forward(*self.profile(text))
+    
+    def profile(self, text):
+        """(language, total_chars, latin, chinese, japanese, korean, arabic) of a text."""
+        if not text:
+            return ('unknown', 0) + (0,) * len(SCRIPTS)
         
-        latin_pct = latin_chars / total_chars
-        chinese_pct = chinese_chars / total_chars
-        japanese_pct = japanese_chars / total_chars
-        korean_pct = korean_chars / total_chars
-        arabic_pct = arabic_chars / total_chars
-        
-        # Determine language based on highest percentage
-        if latin_pct > 0.7:
-            return 'english'
-        elif chinese_pct > 0.3:
-            return 'chinese'
-        elif japanese_pct > 0.3:
-            return 'japanese'
-        elif korean_pct > 0.3:
-            return 'korean'
-        elif arabic_pct > 0.3:
-            return 'arabic'
-        else:
-            return 'unknown'
+        counts, language = self.detector.scan(text, False)
+        return (language, len(text)) + tuple(counts)
+    
+    def evaluate_batch(self, texts):
+        """Profile a list or column of texts; returns a list of tuples."""
+        profile = self.profile
+        return [profile(text) for text in texts]
 
 
 @annotate("string,string->string")
 class TextClean(BaseUDF):
     """
     Clean text based on specified cleaning type
-    Types: html, email, phone, url, punctuation, numbers, whitespace
+    Types: html, html_tags (tags only, no entity decoding), email, phone, url,
+    punctuation, numbers, whitespace, all, or a comma-separated combination
+    applied in order (e.g. 'html,url,whitespace')
     """
     
+    html_pattern = re.compile(r'<[^>]+>')
+    email_pattern = re.compile(r'\S+@\S+')
+    phone_pattern = re.compile(r'(\+?\d{1,3})?[\s.-]?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}')
+    url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+    punctuation_pattern = re.compile(r'[^\w\s]')
+    numbers_pattern = re.compile(r'\d+')
+    whitespace_pattern = re.compile(r'\s+')
+    digit_pattern = re.compile(r'\d')
+    
+    # Common HTML entities, decoded in this order
+    html_entities = (('&amp;', '&'), ('&lt;', '<'), ('&gt;', '>'), ('&quot;', '"'), ('&#39;', "'"))
+    
+    # Steps of 'all'; its HTML step removes tags but leaves entities
+    all_types = ('html_tags', 'email', 'phone', 'url', 'punctuation', 'whitespace')
+    
+    # Compiled cleaners by clean_type, shared by all instances of a worker
+    cleaners = {}
+    
     def evaluate(self, text, clean_type):
         if not text:
             return text
@@ -252,68 +794,295 @@ class TextClean(BaseUDF):
         if not clean_type:
             return text
         
-        result = text
+        return self.cleaner(clean_type)(text)
+    
+    def evaluate_batch(self, texts, clean_type):
+        """Clean a list or column of texts with one clean_type; returns a list of results."""
+        if not clean_type:
+            return list(texts)
+        clean = self.cleaner(clean_type)
+        return [clean(text) if text else text for text in texts]
+    
+    @classmethod
+    def cleaner(cls, clean_type):
+        """
+        Function applying the cleaning steps of clean_type in order, compiled
+        once per clean_type. Unknown types are ignored.
+        """
+        clean = cls.cleaners.get(clean_type)
+        if clean is None:
+            names = []
+            for name in clean_type.split(','):
+                name = name.strip()
+                names.extend(cls.all_types if name == 'all' else [name])
+            steps = [cls.step(name) for name in names]
+            steps = tuple(step for step in steps if step is not None)
+            
+            def clean(text):
+                for step in steps:
+                    text = step(text)
+                return text
+            cls.cleaners[clean_type] = clean
+        return clean
+    
+    @classmethod
+    def step(cls, name):
+        """
+        One cleaning step. Each step runs on the previous step's output, as
+        sequential re.sub calls would; a step is skipped when a substring
+        check shows its pattern cannot match, so clean text costs few passes
+        """
+        if name == 'html':
+            # Remove HTML tags, then decode common HTML entities
+            remove_tags = cls.html_pattern.sub
+            entities = cls.html_entities
+            
+            def html(text):
+                if '<' in text:
+                    text = remove_tags('', text)
+                if '&' in text:
+                    for entity, char in entities:
+                        text = text.replace(entity, char)
+                return text
+            return html
         
-        if clean_type == 'html':
-            # Remove HTML tags
-            result = re.sub(r'<[^>]+>', '', result)
-            # Decode common HTML entities
-            result = result.replace('&amp;', '&')
-            result = result.replace('&lt;', '<')
-            result = result.replace('&gt;', '>')
-            result = result.replace('&quot;', '"')
-            result = result.replace('&#39;', "'")
+        if name == 'html_tags':
+            remove_tags = cls.html_pattern.sub
+            return lambda text: remove_tags('', text) if '<' in text else text
         
-        elif clean_type == 'email':
+        if name == 'email':
             # Remove email addresses
-            result = re.sub(r'\S+@\S+', '', result)
+            remove_emails = cls.email_pattern.sub
+            return lambda text: remove_emails('', text) if '@' in text else text
         
-        elif clean_type == 'phone':
-            # Remove phone numbers
-            result = re.sub(r'(\+?\d{1,3})?[\s.-]?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}', '', result)
+        if name == 'phone':
+            # Remove phone numbers (at least ten digits)
+            remove_phones, has_digit = cls.phone_pattern.sub, cls.digit_pattern.search
+            return lambda text: remove_phones('', text) if has_digit(text) else text
         
-        elif clean_type == 'url':
+        if name == 'url':
             # Remove URLs
-            result = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', result)
+            remove_urls = cls.url_pattern.sub
+            return lambda text: remove_urls('', text) if '://' in text else text
         
-        elif clean_type == 'punctuation':
+        if name == 'punctuation':
             # Remove punctuation except spaces
-            result = re.sub(r'[^\w\s]', '', result)
+            remove_punctuation = cls.punctuation_pattern.sub
+            return lambda text: remove_punctuation('', text)
         
-        elif clean_type == 'numbers':
+        if name == 'numbers':
             # Remove numbers
-            result = re.sub(r'\d+', '', result)
+            remove_numbers = cls.numbers_pattern.sub
+            return lambda text: remove_numbers('', text)
         
-        elif clean_type == 'whitespace':
-            # Normalize whitespace
-            result = re.sub(r'\s+', ' ', result).strip()
+        if name == 'whitespace':
+            # Normalize whitespace: split() splits on the same characters as
+            # \s+ and drops leading and trailing whitespace, like strip()
+            return lambda text: ' '.join(text.split())
         
-        elif clean_type == 'all':
-            # Apply all cleaning operations
-            result = re.sub(r'<[^>]+>', '', result)  # HTML
-            result = re.sub(r'\S+@\S+', '', result)  # Email
-            result = re.sub(r'(\+?\d{1,3})?[\s.-]?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}', '', result)  # Phone
-            result = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', result)  # URL
-            result = re.sub(r'[^\w\s]', '', result)  # Punctuation
-            result = re.sub(r'\s+', ' ', result).strip()  # Whitespace
+        return None
+
+
+@annotate("string->string,string,bigint,string")
+class TextProfile(BaseUDTF):
+    """
+    Sentiment, keywords, word count and language of a text in one call
+    Lowercases and tokenizes the text once for the three word metrics and
+    reads it once more for the language; emits the same values as
+    text_sentiment, text_keywords, text_word_count and text_language_detect
+    """
+    
+    def __init__(self):
+        self.sentiment = TextSentiment()
+        self.keywords = TextKeywords()
+        self.word_count = TextWordCount()
+        self.language = TextLanguageDetect()
+    
+    def process(self, text):
+        self.forward(*self.profile(text))
+    
+    def profile(self, text):
+        """(sentiment, keywords, word_count, language) of a text."""
+        if not text:
+            return 'neutral', '', 0, 'unknown'
         
-        return result
+        words = tokenize(text)
+        return (self.sentiment.score(words), self.keywords.extract(words),
+                self.word_count.count(words), self.language.detect(text))
+    
+    def evaluate_batch(self, texts):
+        """Profile a list or column of texts; returns a list of tuples."""
+        profile = self.profile
+        return [profile(text) for text in texts]
 
 
+@annotate("string,string,string->string,string")
+class TextAnalyzeBatch(BaseUDTF):
+    """
+    Batched evaluation of a single-text UDF over many rows
+    Buffers (key, text) rows per function and evaluates them batch_size at a
+    time through evaluate_batch; emits key and result (as a string)
+    Functions: sentiment, keywords, word_count, language
+    """
+    
+    batch_size = 1024
+    functions = ('sentiment', 'keywords', 'word_count', 'language')
+    
+    def __init__(self):
+        self.buffers = {}
+    
+    def process(self, function, key, text):
+        if function not in self.functions:
+            raise ValueError('Unsupported batch function: %s' % function)
+        keys, texts = self.buffers.setdefault(function, ([], []))
+        keys.append(key)
+        texts.append(text)
+        if len(texts) >= self.batch_size:
+            self.flush(function)
+    
+    def close(self):
+        for function in list(self.buffers):
+            self.flush(function)
+    
+    def flush(self, function):
+        keys, texts = self.buffers.pop(function)
+        for key, result in zip(keys, evaluate_batch(function, texts)):
+            self.forward(key, None if result is None else str(result))
+
+
+# Functions of the batch API: evaluate_batch(name, ...) runs the UDF class's
+# evaluate_batch over whole columns
+BATCH_FUNCTIONS = {
+    'sentiment': TextSentiment,
+    'sentiment_score': TextSentimentScore,
+    'sentiment_label': TextSentimentLabel,
+    'keywords': TextKeywords,
+    'keywords_tfidf': TextKeywordsTfidf,
+    'similarity': TextSimilarity,
+    'word_count': TextWordCount,
+    'language': TextLanguageDetect,
+    'clean': TextClean,
+    'language_profile': TextLanguageProfile,
+    'profile': TextProfile,
+}
+
+# Functions taking more arguments than one column of texts
+PAIR_FUNCTIONS = {'similarity', 'clean', 'sentiment_score', 'sentiment_label', 'keywords_tfidf'}
+
+_batch_udfs = {}
+
+
+def evaluate_batch(function, texts, *args):
+    """
+    Evaluate a UDF over a list or column of texts (any iterable, e.g. a
+    pandas Series) and return a list of results, for offline pipelines.
+    
+    evaluate_batch('sentiment', texts)
+    evaluate_batch('similarity', texts1, texts2)
+    evaluate_batch('clean', texts, 'all')
+    evaluate_batch('keywords_tfidf', texts, 'product_idf.bin', 10, 'words')
+    evaluate_batch('profile', texts)  # (sentiment, keywords, word_count, language) tuples
+    """
+    udf = _batch_udfs.get(function)
+    if udf is None:
+        if function not in BATCH_FUNCTIONS:
+            raise ValueError('Unsupported batch function: %s' % function)
+        udf = _batch_udfs[function] = BATCH_FUNCTIONS[function]()
+    return udf.evaluate_batch(texts, *args)
+
+
+
+def read_csv_columns(path, *columns):
+    """Stream the given columns of a CSV file with a header row, as tuples."""
+    import csv
+    with io.open(path, newline='', encoding='utf-8') as input_file:
+        for row in csv.DictReader(input_file):
+            yield tuple(row[column] for column in columns)
+
+
+def main():
+    """Offline tools: similar text pairs of a CSV file, and IDF tables for text_keywords_tfidf."""
+    import argparse
+    import csv
+    
+    parser = argparse.ArgumentParser(description='Offline text analytics tools')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    
+    pairs_parser = commands.add_parser('similar-pairs', help='Find pairs of similar texts in a CSV file')
+    pairs_parser.add_argument('input', help='CSV file with a header row')
+    pairs_parser.add_argument('--key-column', required=True, help='Column identifying a row')
+    pairs_parser.add_argument('--text-column', required=True, help='Column with the text to compare')
+    pairs_parser.add_argument('--group-column', help='Only compare rows with the same value here')
+    pairs_parser.add_argument('--threshold', type=float, default=0.5,
+                              help='Minimum Jaccard similarity (default: 0.5)')
+    pairs_parser.add_argument('--output', help='Output CSV file (default: stdout)')
+    
+    idf_parser = commands.add_parser('idf-table', help='Build the IDF table of a CSV text column')
+    idf_parser.add_argument('input', help='CSV file with a header row')
+    idf_parser.add_argument('--text-column', required=True, help='Column with the documents')
+    idf_parser.add_argument('--min-df', type=int, default=1,
+                            help='Leave out words in fewer documents (default: 1)')
+    idf_parser.add_argument('--output', required=True, help='IDF table file to write')
+    args = parser.parse_args()
+    
+    if args.command == 'idf-table':
+        texts = (text for text, in read_csv_columns(args.input, args.text_column))
+        documents = build_idf_table(texts, args.output, args.min_df)
+        sys.stderr.write('IDF table of %d documents written to %s\n' % (documents, args.output))
+        return
+    
+    groups = {}
+    columns = [args.key_column, args.text_column] + ([args.group_column] if args.group_column else [])
+    for row in read_csv_columns(args.input, *columns):
+        groups.setdefault(row[2] if args.group_column else '', []).append(row[:2])
+    
+    output_file = io.open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.writer(output_file)
+        writer.writerow(([args.group_column] if args.group_column else []) +
+                        ['key1', 'key2', 'similarity'])
+        pair_count = 0
+        for group, records in groups.items():
+            for pair in similar_pairs(records, args.threshold):
+                writer.writerow(([group] if args.group_column else []) + list(pair))
+                pair_count += 1
+    finally:
+        if args.output:
+            output_file.close()
+    sys.stderr.write('%d similar pairs\n' % pair_count)
+
+
+if __name__ == '__main__':
+    main()
+
 """
 Deployment Instructions:
 
 1. Save this file as text_analytics.py
-2. Upload to MaxCompute as a Python resource:
+2. Upload to MaxCompute as a Python resource, with any sentiment lexicons
+   as file resources (sentiment_lexicon.tsv is an example with phrases):
    ADD PY text_analytics.py;
+   ADD FILE sentiment_lexicon.tsv;
+   IDF tables for text_keywords_tfidf are built offline from a corpus export
+   and uploaded the same way:
+   python text_analytics.py idf-table products.csv --text-column description --output product_idf.bin
+   ADD FILE product_idf.bin;
 
 3. Create UDF functions:
    CREATE FUNCTION text_sentiment AS 'text_analytics.TextSentiment' USING 'text_analytics.py';
+   CREATE FUNCTION text_sentiment_score AS 'text_analytics.TextSentimentScore' USING 'text_analytics.py,sentiment_lexicon.tsv';
+   CREATE FUNCTION text_sentiment_label AS 'text_analytics.TextSentimentLabel' USING 'text_analytics.py,sentiment_lexicon.tsv';
    CREATE FUNCTION text_keywords AS 'text_analytics.TextKeywords' USING 'text_analytics.py';
+   CREATE FUNCTION text_keywords_tfidf AS 'text_analytics.TextKeywordsTfidf' USING 'text_analytics.py,product_idf.bin';
    CREATE FUNCTION text_similarity AS 'text_analytics.TextSimilarity' USING 'text_analytics.py';
+   CREATE FUNCTION text_similar_pairs AS 'text_analytics.TextSimilarPairs' USING 'text_analytics.py';
    CREATE FUNCTION text_word_count AS 'text_analytics.TextWordCount' USING 'text_analytics.py';
    CREATE FUNCTION text_language_detect AS 'text_analytics.TextLanguageDetect' USING 'text_analytics.py';
    CREATE FUNCTION text_clean AS 'text_analytics.TextClean' USING 'text_analytics.py';
+   CREATE FUNCTION text_language_profile AS 'text_analytics.TextLanguageProfile' USING 'text_analytics.py';
+   CREATE FUNCTION text_profile AS 'text_analytics.TextProfile' USING 'text_analytics.py';
+   CREATE FUNCTION text_analyze_batch AS 'text_analytics.TextAnalyzeBatch' USING 'text_analytics.py';
 
 Usage Examples:
 
@@ -324,6 +1093,13 @@ SELECT
     text_sentiment(review_text) as sentiment
 FROM customer_reviews;
 
+-- Weighted sentiment with a domain lexicon (loaded once per worker)
+SELECT 
+    review_id,
+    text_sentiment_label(review_text, 'sentiment_lexicon.tsv') as sentiment,
+    text_sentiment_score(review_text, 'sentiment_lexicon.tsv') as sentiment_score
+FROM customer_reviews;
+
 -- Extract keywords from product descriptions
 SELECT 
     product_id,
@@ -331,15 +1107,28 @@ SELECT
     text_keywords(description) as keywords
 FROM products;
 
--- Calculate similarity between product descriptions
+-- Top 10 TF-IDF keywords against the product corpus, with their scores
 SELECT 
-    p1.product_id as product1,
-    p2.product_id as product2,
-    text_similarity(p1.description, p2.description) as similarity
+    product_id,
+    text_keywords_tfidf(description, 'product_idf.bin', 10, 'scores') as keywords
+FROM products;
+
+-- Calculate similarity between two product descriptions
+SELECT text_similarity(p1.description, p2.description) as similarity
 FROM products p1
-CROSS JOIN products p2
-WHERE p1.product_id < p2.product_id
-  AND text_similarity(p1.description, p2.description) > 0.5;
+JOIN products p2 ON p2.product_id = 'PROD000002'
+WHERE p1.product_id = 'PROD000001';
+
+-- Similar product descriptions within each category (an inverted index per
+-- category instead of a CROSS JOIN; rows of a category must reach one worker)
+SELECT text_similar_pairs(category, product_id, description, 0.5)
+    AS (category, product1, product2, similarity)
+FROM (
+    SELECT category, product_id, description FROM products DISTRIBUTE BY category
+) t;
+
+-- Offline, over a CSV export:
+--   python text_analytics.py similar-pairs products.csv --key-column product_id --text-column description --threshold 0.5
 
 -- Count meaningful words in customer feedback
 SELECT 
@@ -352,4 +1141,32 @@ FROM customer_feedback;
 SELECT 
     text_clean('<p>Contact us at support@company.com or call 123-456-7890</p>', 'all') as cleaned;
 -- Result: 'Contact us at or call'
+
+-- Only some cleaning steps, applied in the order given
+SELECT text_clean(review_text, 'html,url,whitespace') as cleaned FROM customer_reviews;
+
+-- Language with its per-script character counts, for ratio features
+SELECT 
+    f.feedback_id,
+    l.language,
+    l.latin_chars / l.total_chars as latin_ratio,
+    (l.chinese_chars + l.japanese_chars) / l.total_chars as cjk_ratio
+FROM customer_feedback f
+LATERAL VIEW text_language_profile(f.feedback_text) l
+    AS language, total_chars, latin_chars, chinese_chars, japanese_chars, korean_chars, arabic_chars
+WHERE l.total_chars > 0;
+
+-- All single-text metrics of a column at once (one tokenization per row)
+SELECT 
+    f.feedback_id,
+    p.sentiment,
+    p.keywords,
+    p.word_count,
+    p.language
+FROM customer_feedback f
+LATERAL VIEW text_profile(f.feedback_text) p AS sentiment, keywords, word_count, language;
+
+-- Batched sentiment over a large table (rows are evaluated 1024 at a time)
+SELECT text_analyze_batch('sentiment', review_id, review_text) AS (review_id, sentiment)
+FROM customer_reviews;
 """
\ No newline at end of file